@@ -1,18 +1,15 @@
 import streamlit as st
 import datetime
-import asyncio
 import os
 import subprocess
-from diet_minutes_api import DietMinutesAPI
-from news_fetcher import NewsFetcher
 from script_generator import ScriptGenerator
-from komei_scraper import KomeiScraper
-from slide_generator import SlideGenerator
-from law_fetcher import LawFetcher
-from stats_fetcher import StatsFetcher
-from subsidy_fetcher import SubsidyFetcher
+from llm_cache import get_default_cache
+from llm_metrics import format_metrics_summary
+from trend_snapshot import get_trend_snapshot
+from headline_archive import get_default_archive
 from settings_manager import load_settings, save_settings
-from project_manager import save_project, list_projects, delete_project
+from project_manager import save_project, search_projects, load_project, delete_project
+from script_revisions import add_revision, revision_label, revision_text
 import re
 import json
 
@@ -38,6 +35,8 @@ if "suggested_indicators" not in st.session_state:
     st.session_state["suggested_indicators"] = []
 if "deep_dive_results" not in st.session_state:
     st.session_state["deep_dive_results"] = None
+if "current_revisions" not in st.session_state:
+    st.session_state["current_revisions"] = []
 
 # --- 履歴からのロード予約の処理 (ウィジェット生成前に実行) ---
 if st.session_state.get("pending_load_proj"):
@@ -51,7 +50,13 @@ if st.session_state.get("pending_load_proj"):
     st.session_state["current_slides_data"] = proj.get("slides_data", [])
     st.session_state["current_model"] = proj.get("model", "N/A")
     st.session_state["current_provider"] = proj.get("provider", "N/A")
+    st.session_state["current_research"] = proj.get("research")
     st.session_state["display_script_area"] = proj.get("script", "") # ウィジェットと同期
+    # 改訂履歴のない (以前に保存した) プロジェクトは、保存時の台本を第1版とする
+    st.session_state["current_revisions"] = proj.get("revisions") or add_revision(
+        [], "", st.session_state["current_raw_script"], "generate",
+        provider=proj.get("provider"), model=proj.get("model")
+    )
     # 処理が終わったら予約を消す
     del st.session_state["pending_load_proj"]
     st.toast(f"✅ 「{st.session_state['current_topic']}」を読み込みました")
@@ -111,6 +116,30 @@ def clean_script_text(text: str) -> str:
     text = re.sub(r"\[\s*\{.*\}\s*\]", "", text, flags=re.DOTALL)
     return text.strip()
 
+@st.cache_data(max_entries=32, show_spinner=False)
+def render_pptx(deck_key: str, title: str, _slides_data: list) -> bytes:
+    """スライド資料をメモリ上に作成する (deck_key = タイトルとスライドデータのハッシュごとに1回)"""
+    from slide_generator import SlideGenerator
+    return SlideGenerator().render(title, _slides_data)
+
+# --- 再構成結果の反映 (ウィジェット生成前に実行) ---
+if st.session_state.get("pending_refine_result"):
+    new_raw_text = st.session_state["pending_refine_result"]
+    # 改訂履歴に1版追加する (差分の基準は置き換える前の台本)
+    revision = st.session_state.pop("pending_revision", None) or {"kind": "refine"}
+    st.session_state["current_revisions"] = add_revision(
+        st.session_state["current_revisions"], st.session_state["current_raw_script"], new_raw_text, **revision
+    )
+    st.session_state["current_raw_script"] = new_raw_text
+    st.session_state["current_script"] = clean_script_text(new_raw_text)
+    st.session_state["display_script_area"] = st.session_state["current_script"] # 同期
+    st.session_state["current_slides_data"] = ScriptGenerator.extract_json_from_response(new_raw_text)
+    del st.session_state["pending_refine_result"]
+    if revision["kind"] == "restore":
+        st.toast(f"🕘 第{revision['restored_from'] + 1}版に戻しました")
+    else:
+        st.toast("✨ 再構成が完了しました！")
+
 # Playwrightのブラウザをクラウド環境でインストール
 @st.cache_resource
 def ensure_playwright_browsers():
@@ -177,6 +206,60 @@ with st.sidebar:
             "gemini-2.5-pro"
         ], index=["gemini-3-pro-preview", "gemini-3-pro-image-preview", "gemini-2.5-pro"].index(saved_settings.get("gemini_model", "gemini-3-pro-preview")))
     
+    context_budget = st.number_input(
+        "ソース予算 (トークン)",
+        min_value=2000, max_value=120000, step=1000,
+        value=int(saved_settings.get("context_budget", 12000)),
+        help="台本生成プロンプトに載せるニュース・議事録・法令などの合計トークン数の上限です。超えた分は優先度の低いものから除外されます。"
+    )
+
+    use_retrieval = st.checkbox(
+        "トピックに近いソースだけを使う (埋め込み検索)",
+        value=saved_settings.get("use_retrieval", False),
+        help="ニュース・議事録・法令をチャンクに分けて埋め込み、トピックとの類似度が高い上位のチャンクだけを台本生成に渡します。キーワードが一致しない関連発言も拾えます。"
+    )
+    if use_retrieval:
+        retrieval_top_k = st.number_input(
+            "ソースごとの採用チャンク数", min_value=5, max_value=100, step=5,
+            value=int(saved_settings.get("retrieval_top_k", 20))
+        )
+        embedder_options = ["ローカル (TF-IDF)", "OpenAI Embeddings"]
+        embedder_name = st.selectbox(
+            "埋め込み方式", embedder_options,
+            index=embedder_options.index(saved_settings.get("embedder_name", "ローカル (TF-IDF)"))
+        )
+    else:
+        retrieval_top_k = int(saved_settings.get("retrieval_top_k", 20))
+        embedder_name = saved_settings.get("embedder_name", "ローカル (TF-IDF)")
+
+    use_presummary = st.checkbox(
+        "大量のソースを事前要約する (map-reduce)",
+        value=saved_settings.get("use_presummary", False),
+        help="議事録やニュースが予算を超える場合、安価なモデルでチャンクごとに並行要約してから台本を生成します。生成モデルへの入力が減り、待ち時間が短くなります。"
+    )
+
+    with st.expander("🛟 フェイルオーバー (オプション)"):
+        secondary_provider = "Gemini" if provider == "OpenAI" else "OpenAI"
+        secondary_key = default_gemini_key if secondary_provider == "Gemini" else default_openai_key
+        secondary_model = saved_settings.get("gemini_model", "gemini-2.5-pro") if secondary_provider == "Gemini" else saved_settings.get("openai_model", "gpt-4o")
+        use_failover = st.checkbox(
+            f"{secondary_provider} ({secondary_model}) を予備として使う",
+            value=saved_settings.get("use_failover", False),
+            help="主系がエラーになった場合や応答が遅い場合に、予備のプロバイダーへ切り替えます。"
+        )
+        hedge_after = st.slider(
+            "予備へ並行リクエストするまでの待ち時間 (秒)",
+            min_value=0, max_value=60,
+            value=int(saved_settings.get("hedge_after", 15)),
+            help="この時間内に最初の文字が届かなければ予備にも依頼し、先に返ってきた方を採用します。0 の場合はエラー時のみ切り替えます。"
+        )
+        auto_primary = st.checkbox(
+            "応答の速いプロバイダーを自動で主系にする",
+            value=saved_settings.get("auto_primary", False)
+        )
+        if use_failover and not secondary_key:
+            st.caption(f"⚠️ {secondary_provider} の API キーが Secrets / 保存済み設定にありません。")
+
     st.divider()
     st.subheader("💡 外部連携 (オプション)")
     
@@ -198,11 +281,40 @@ with st.sidebar:
             "komei_user": komei_user,
             "komei_pass": komei_pass,
             "komei_article_url": komei_article_url,
-            "estat_id": estat_id
+            "estat_id": estat_id,
+            "context_budget": context_budget,
+            "use_retrieval": use_retrieval,
+            "retrieval_top_k": retrieval_top_k,
+            "embedder_name": embedder_name,
+            "use_presummary": use_presummary,
+            "use_failover": use_failover,
+            "hedge_after": hedge_after,
+            "auto_primary": auto_primary
         }
         save_settings(current_settings)
         st.success("設定を保存しました。")
 
+    with st.expander("🗄️ LLMキャッシュ"):
+        cache_stats = get_default_cache().stats()
+        st.caption(
+            f"ヒット: {cache_stats['hits']} / ミス: {cache_stats['misses']} "
+            f"(ヒット率 {cache_stats['hit_rate']:.0%}) ・ 保存件数: {cache_stats['entries']}件"
+        )
+
+def make_generator(provider_name: str, key: str, model_name: str, **kwargs) -> ScriptGenerator:
+    """サイドバーのフェイルオーバー設定を反映した ScriptGenerator を作る"""
+    fallback = None
+    if use_failover and secondary_key and secondary_provider.lower() != provider_name.lower():
+        try:
+            fallback = ScriptGenerator(secondary_provider, secondary_key, secondary_model)
+        except Exception as e:
+            st.warning(f"予備プロバイダーを初期化できませんでした: {e}")
+    return ScriptGenerator(
+        provider_name, key, model_name,
+        fallback=fallback, hedge_after=hedge_after or None, auto_primary=auto_primary,
+        **kwargs
+    )
+
 # メイン画面のタブ
 tab_main, tab_history = st.tabs(["🚀 台本作成", "📜 履歴一覧"])
 
@@ -242,6 +354,11 @@ with tab_main:
         use_stats = st.checkbox("e-Stat統計", value=True)
     
     use_subsidy = st.checkbox("補助金情報 (jGrants)", value=True)
+    force_refresh = st.checkbox(
+        "🔄 すべてのソースを取り直す", value=False,
+        help="同じキーワードで数時間以内に調べた結果があれば、通常はそれを使い、前回以降の分だけを取得します。"
+             "チェックすると前回の結果を使わずにすべて取得し直します。"
+    )
 
 
     # 2. 台本生成ボタン
@@ -254,7 +371,7 @@ with tab_main:
             # 前回の情報を深くクリア (新しいテーマに引っ張られないようにする)
             keys_to_clear = [
                 "current_raw_script", "current_script", "current_slides_data", 
-                "current_news", "current_speeches", "current_topic",
+                "current_news", "current_speeches", "current_topic", "current_revisions",
                 "display_script_area", "refine_input" # Widget keys
             ]
             for k in keys_to_clear:
@@ -265,194 +382,67 @@ with tab_main:
             st.session_state["suggested_indicators"] = []
             st.session_state["deep_dive_results"] = None
             
-            # 内部での初期化を確実にする
-            news_list = []
-            speeches = []
-            law_data = []
-            stats_summaries = []
-            
             try:
-                generator = ScriptGenerator(provider, api_key, model)
-                
+                # 収集・生成に使うモジュールはボタンが押されたときだけ読み込む (再実行のたびに読み込まない)
+                from pipeline import ScriptPipeline
+                embedder = None
+                if use_retrieval and embedder_name == "OpenAI Embeddings" and default_openai_key:
+                    from source_index import OpenAIEmbedder
+                    embedder = OpenAIEmbedder(default_openai_key)
+
                 with st.status(f"リクエストを解析中...", expanded=True) as status:
-                    # 自然言語解析の実行
-                    query_info = generator.analyze_query(topic)
-                    search_keywords = ", ".join(query_info["keywords"])
-                    st.write(f"🔍 検索キーワードを抽出しました: `{search_keywords}`")
-                    
-                    # 期間の確定
+                    # 期間: 既定 (直近7日) のままなら入力文からの推測を優先する
                     default_start = datetime.date.today() - datetime.timedelta(days=7)
                     user_start = date_range[0]
                     user_end = date_range[1] if len(date_range) == 2 else datetime.date.today()
-                    
-                    if user_start != default_start:
-                        start_date = user_start
-                        end_date = user_end
-                        st.write(f"📅 ユーザー指定の期間を適用します: {start_date} 〜 {end_date}")
-                    elif query_info.get("days"):
-                        end_date = datetime.date.today()
-                        start_date = end_date - datetime.timedelta(days=query_info["days"])
-                        st.write(f"📅 文章から期間を推測しました: {start_date} 〜 {end_date} ({query_info['days']}日間)")
-                    else:
-                        start_date = user_start
-                        end_date = user_end
-
-                    news_list = []
-                    speeches = []
-
-                    # --- 1. 国会議事録の取得 ---
-                    if use_diet:
-                        diet_start = end_date - datetime.timedelta(days=365)
-                        st.write(f"🏛️ 国会議事録を検索中 (背景調査のため 1年前まで遡ります: {diet_start} 〜 {end_date})...")
-                        diet_api = DietMinutesAPI()
-                        speeches = diet_api.fetch_speeches(
-                            any_keyword=search_keywords,
-                            from_date=diet_start.strftime("%Y-%m-%d"),
-                            until_date=end_date.strftime("%Y-%m-%d")
-                        )
-                        st.write(f"✅ 議事録: {len(speeches)}件取得")
-                    else:
-                        st.write("⏩ 国会議事録をスキップ")
-
-                    # --- 2. ニュースRSSの取得 ---
-                    if use_news:
-                        st.write(f"主要メディアのRSSを検索中...")
-                        news_fetcher = NewsFetcher()
-                        main_kw = query_info["keywords"][0] if query_info["keywords"] else topic
-                        news_list = news_fetcher.fetch_all_news(
-                            keyword=main_kw,
-                            days=(end_date - start_date).days
-                        )
-                        st.write(f"✅ ニュース: {len(news_list)}件取得 (キーワード: {main_kw})")
-                    else:
-                        st.write("⏩ その他ニュースをスキップ")
-
-                    # --- 3. 公明新聞スクレイピング ---
-                    if use_komei and komei_user and komei_pass:
-                        scraper = KomeiScraper()
-                        target_urls = []
-                        if komei_article_url:
-                            target_urls = [komei_article_url]
-                        else:
-                            st.write("---")
-                            k_keywords = query_info.get("keywords", [topic])
-                            st.write(f"🔍 公明新聞を検索中 (キーワード候補: {', '.join(k_keywords)})...")
-                            for kw in k_keywords:
-                                f_urls = asyncio.run(scraper.search_articles(kw))
-                                if f_urls:
-                                    target_urls.extend(f_urls)
-                                    st.write(f"✅ 公明新聞: 「{kw}」で記事が見つかりました")
-                                    break
-                        if target_urls:
-                            target_urls = list(dict.fromkeys(target_urls))[:3]
-                            for idx, url in enumerate(target_urls):
-                                st.write(f"📄 公明新聞記事の内容を抽出中 ({idx+1}/{len(target_urls)})...")
-                                komei_text = asyncio.run(scraper.fetch_article_text(komei_user, komei_pass, url))
-                                if komei_text:
-                                    news_list.append({
-                                        "source": "公明新聞",
-                                        "title": f"公明新聞 関連記事 {idx+1}",
-                                        "summary": komei_text[:1000] + "...",
-                                        "link": url,
-                                        "published": datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
-                                    })
-                                    st.success(f"✅ 公明新聞: 成功")
-                                else:
-                                    st.error(f"❌ 公明新聞: 失敗")
-                        elif not komei_article_url:
-                            st.info("ℹ️ 公明新聞: 関連記事なし")
-                    else:
-                        st.write("⏩ 公明新聞をスキップ")
-
-                    # --- 4. 法令情報の取得 ---
-                    law_data = []
-                    if use_law:
-                        st.write("e-Gov法令APIを検索中...")
-                        law_fetcher = LawFetcher()
-                        l_keywords = query_info.get("law_keywords", query_info["keywords"])
-                        unique_laws = []
-                        seen_ids = set()
-                        
-                        # 1. まずは「キーワード検索」を優先（全文検索・抜粋取得）
-                        for kw in l_keywords:
-                            st.write(f"🔍 法令(全文検索): 「{kw}」で検索試行中...")
-                            kw_results = law_fetcher.search_by_keyword(kw)
-                            if kw_results:
-                                for r in kw_results:
-                                    if r['id'] not in seen_ids:
-                                        unique_laws.append(r)
-                                        seen_ids.add(r['id'])
-                            if len(unique_laws) >= 3: break # 全文検索は重いので少なめに
-                            
-                        # 2. 次に「名称検索」（見つからなかった場合の補完）
-                        if len(unique_laws) < 5:
-                            for kw in l_keywords:
-                                st.write(f"🔍 法令(名称検索): 「{kw}」で検索試行中...")
-                                title_results = law_fetcher.search_laws(kw)
-                                if title_results:
-                                    for r in title_results:
-                                        if r['id'] not in seen_ids:
-                                            unique_laws.append(r)
-                                            seen_ids.add(r['id'])
-                                if len(unique_laws) >= 5: break
-                                
-                        law_data = unique_laws[:5]
-                        st.write(f"✅ 法令: {len(law_data)}件特定 (うち抜粋あり: {len([l for l in law_data if l.get('snippets')])}件)")
-
-                    # --- 5. 統計情報の取得 (Deep Dive用に温存し、初期はキーワード提案のみ) ---
-                    st.write("統計データ分析の準備をしています...")
-                    # 以前の stats_summaries 取得はスキップ (後続のInsight機能に統合)
-                    stats_summaries = [] 
-
-                    # --- 5.5 補助金情報の取得 ---
-                    subsidy_data = []
-                    if use_subsidy:
-                        st.write("jGrantsで補助金を検索中...")
-                        subsidy_fetcher = SubsidyFetcher()
-                        # Use law_keywords or main keywords (often similar, looking for formal terms)
-                        s_keywords = query_info.get("law_keywords", query_info.get("keywords", [topic]))
-                        
-                        for kw in s_keywords:
-                            st.write(f"🔍 補助金: 「{kw}」で検索試行中...")
-                            subs = subsidy_fetcher.search_subsidies(kw)
-                            if subs:
-                                subsidy_data.extend(subs)
-                            
-                            # IDベースで重複排除
-                            seen_s_ids = set()
-                            unique_subs = []
-                            for s in subsidy_data:
-                                if s['id'] not in seen_s_ids:
-                                    unique_subs.append(s)
-                                    seen_s_ids.add(s['id'])
-                            subsidy_data = unique_subs
-                            
-                            if len(subsidy_data) >= 3: break
-                        
-                        subsidy_data = subsidy_data[:3]
-                        st.write(f"✅ 補助金: {len(subsidy_data)}件特定")
-
-                    # --- 6. 台本生成 ---
-                    st.write(f"AI ({model}) が台本を執筆中...")
-                    generator = ScriptGenerator(provider=provider, api_key=api_key, model=model)
-                    generated_text = generator.generate(topic, news_list, speeches, law_data, stats_summaries, subsidy_data)
-                    slides_data = generator.extract_json_from_response(generated_text)
-                    
+
+                    pipeline = ScriptPipeline(
+                        provider, api_key, model,
+                        use_komei=use_komei, use_diet=use_diet, use_news=use_news,
+                        use_law=use_law, use_stats=use_stats, use_subsidy=use_subsidy,
+                        komei_user=komei_user, komei_pass=komei_pass, komei_article_url=komei_article_url,
+                        context_budget=context_budget,
+                        summary_model="auto" if use_presummary else None,
+                        retrieval_top_k=retrieval_top_k if use_retrieval else None,
+                        embedder=embedder,
+                        make_generator=make_generator,
+                        force_refresh=force_refresh
+                    )
+                    progress_line = st.empty()
+                    progress_handlers = {
+                        "info": st.write, "success": st.success, "error": st.error,
+                        "note": st.info, "caption": st.caption, "progress": progress_line.write,
+                    }
+                    result = pipeline.run(
+                        topic,
+                        start_date=user_start if user_start != default_start else None,
+                        end_date=user_end,
+                        on_progress=lambda message, level: progress_handlers.get(level, st.write)(message),
+                        # 届いた断片から順に表示する
+                        consume_stream=st.write_stream
+                    )
+                    generated_text = result["script"]
+
+                    st.session_state["last_generation_usage"] = result["usage"]
                     st.session_state["current_raw_script"] = generated_text
+                    st.session_state["current_revisions"] = add_revision(
+                        [], "", generated_text, "generate", provider=provider, model=model
+                    )
                     st.session_state["current_script"] = clean_script_text(generated_text)
                     st.session_state["display_script_area"] = st.session_state["current_script"] # 同期
-                    st.session_state["current_slides_data"] = slides_data
-                    st.session_state["current_news"] = news_list
-                    st.session_state["current_speeches"] = speeches
+                    st.session_state["current_slides_data"] = result["slides_data"]
+                    st.session_state["current_news"] = result["news_list"]
+                    st.session_state["current_speeches"] = result["speeches"]
                     st.session_state["current_topic"] = topic
+                    st.session_state["current_research"] = result["research"]
                     st.session_state["current_provider"] = provider
                     st.session_state["current_model"] = model
-                    
-                    # --- 7. 統計インサイトの提案 ---
-                    if use_stats:
-                        st.write("📊 統計インサイトを分析中...")
-                        suggested = generator.suggest_indicators(generated_text)
-                        st.session_state["suggested_indicators"] = suggested
+                    st.session_state["suggested_indicators"] = result["suggested_indicators"]
+
+                    # --- 8. LLM呼び出しの計測結果 (分析〜生成〜統計提案) ---
+                    if result["metrics"]:
+                        st.write("⏱️ LLM呼び出しの内訳")
+                        st.markdown(format_metrics_summary(result["metrics"]))
 
                     status.update(label="完了！", state="complete", expanded=False)
 
@@ -463,6 +453,13 @@ with tab_main:
     if st.session_state["current_script"]:
         st.divider()
         st.subheader(f"📝 生成された要約台本 ({st.session_state['current_model']})")
+        usage = st.session_state.get("last_generation_usage")
+        if usage and usage.get("input_tokens"):
+            ttft = f"{usage['ttft']:.1f}秒" if usage.get("ttft") is not None else "N/A"
+            st.caption(
+                f"入力 {usage['input_tokens']:,} トークン (うちキャッシュ済み {usage.get('cached_tokens', 0):,}) ・ "
+                f"出力 {usage.get('output_tokens', 0):,} トークン ・ 最初の文字まで {ttft} ・ 合計 {usage['elapsed']:.1f}秒"
+            )
         
         # 台本の編集・閲覧
         new_script = st.text_area(
@@ -480,39 +477,69 @@ with tab_main:
             key="refine_input"
         )
         
-        def refine_script_callback(api_key_val):
+        scoped_refine = st.checkbox(
+            "指示に関係するセクションだけを再構成する",
+            value=True,
+            help="「導入」「信頼性チェック」など特定のセクションへの指示の場合、そのセクションと関連スライドだけを書き直します。全体に関わる指示は自動的に全体を再構成します。"
+        )
+
+        if st.button("✨ 再構成を実行"):
             instruction = st.session_state.refine_input
             if not instruction:
                 st.warning("指示を入力してください。")
-                return
-
-            try:
-                # Callback内でst.statusを使うとリランで消えるため、toast推奨だが
-                # 処理中の表示のためにspinnerを使用
-                with st.spinner("AIが台本を再構成しています..."):
-                    generator = ScriptGenerator(
-                        provider=st.session_state["current_provider"], 
-                        api_key=api_key_val, 
-                        model=st.session_state["current_model"]
-                    )
-                    # 最新の(編集された)台本と、生データを組み合わせて再送
-                    new_raw_text = generator.refine(
-                        st.session_state["current_raw_script"], 
-                        instruction
+            else:
+                try:
+                    generator = make_generator(
+                        st.session_state["current_provider"], 
+                        api_key, 
+                        st.session_state["current_model"]
                     )
-                    
-                    # 更新
-                    st.session_state["current_raw_script"] = new_raw_text
-                    st.session_state["current_script"] = clean_script_text(new_raw_text)
-                    st.session_state["display_script_area"] = st.session_state["current_script"] # 同期
-                    st.session_state["current_slides_data"] = generator.extract_json_from_response(new_raw_text)
-                    
-                    st.toast("✨ 再構成が完了しました！")
-            except Exception as e:
-                st.error(f"再構成中にエラーが発生しました: {e}")
-
-        if st.button("✨ 再構成を実行", on_click=refine_script_callback, args=(api_key,)):
-            pass
+                    with st.container(border=True):
+                        st.caption("AIが台本を再構成しています...")
+                        # 最新の(編集された)台本と、生データを組み合わせて再送
+                        refine_stream = generator.refine_stream(
+                            st.session_state["current_raw_script"], 
+                            instruction,
+                            scoped=scoped_refine
+                        )
+                        if generator.last_refine_scope:
+                            st.caption(f"対象セクション: {' / '.join(generator.last_refine_scope)}")
+                        st.write_stream(refine_stream)
+                    new_raw_text = generator.last_refine_result
+                    st.session_state["last_generation_usage"] = generator.last_usage
+                    if new_raw_text is None:
+                        st.error("セクション単位の再構成結果を反映できませんでした。もう一度実行するか、チェックを外して全体を再構成してください。")
+                    else:
+                        # 台本エリアのウィジェットは既に生成済みのため、反映はリラン直後に行う
+                        st.session_state["pending_refine_result"] = new_raw_text
+                        st.session_state["pending_revision"] = {
+                            "kind": "refine", "instruction": instruction,
+                            "provider": st.session_state["current_provider"],
+                            "model": st.session_state["current_model"],
+                            "scope": generator.last_refine_scope,
+                        }
+                        st.rerun()
+                except Exception as e:
+                    st.error(f"再構成中にエラーが発生しました: {e}")
+
+        # --- 改訂履歴 (再構成の前の版を確認・復元する) ---
+        revisions = st.session_state["current_revisions"]
+        if len(revisions) > 1:
+            with st.expander(f"🕘 改訂履歴 ({len(revisions)}版)"):
+                selected = st.selectbox(
+                    "版を選択", options=list(range(len(revisions)))[::-1],
+                    format_func=lambda i: revision_label(revisions, i),
+                    key="revision_select"
+                )
+                if selected is not None and selected < len(revisions):
+                    selected_text = revision_text(revisions, st.session_state["current_raw_script"], selected)
+                    st.text_area("この版の台本", value=clean_script_text(selected_text), height=250,
+                                 disabled=True, key=f"revision_preview_{selected}_{len(revisions)}")
+                    if st.button("この版に戻す", disabled=selected == len(revisions) - 1):
+                        # 復元も1版として追加する (それまでの版は消さない)
+                        st.session_state["pending_refine_result"] = selected_text
+                        st.session_state["pending_revision"] = {"kind": "restore", "restored_from": selected}
+                        st.rerun()
 
         col_save, _ = st.columns([1, 4])
         with col_save:
@@ -523,7 +550,9 @@ with tab_main:
                     st.session_state["current_news"], 
                     st.session_state["current_speeches"], 
                     st.session_state["current_provider"], 
-                    st.session_state["current_model"]
+                    st.session_state["current_model"],
+                    revisions=st.session_state["current_revisions"],
+                    research=st.session_state.get("current_research")
                 )
                 st.success(f"保存完了: {path}")
 
@@ -534,16 +563,18 @@ with tab_main:
             st.info("台本から構造化データを抽出し、自動生成されたスライド資料です。")
             
             presentation_title = f"{st.session_state['current_topic']}に関する解説"
-            slide_gen = SlideGenerator()
-            pptx_path = slide_gen.create_slides(presentation_title, st.session_state["current_slides_data"])
-            
-            with open(pptx_path, "rb") as f:
-                st.download_button(
-                    label="📥 プレゼン資料(.pptx)をダウンロード",
-                    data=f,
-                    file_name=f"presentation_{datetime.date.today()}.pptx",
-                    mime="application/vnd.openxmlformats-officedocument.presentationml.presentation"
-                )
+            from slide_generator import deck_hash
+            # 内容が変わらない限り再実行 (改善指示の入力など) では作り直さない
+            pptx_bytes = render_pptx(
+                deck_hash(presentation_title, st.session_state["current_slides_data"]),
+                presentation_title, st.session_state["current_slides_data"]
+            )
+            st.download_button(
+                label="📥 プレゼン資料(.pptx)をダウンロード",
+                data=pptx_bytes,
+                file_name=f"presentation_{datetime.date.today()}.pptx",
+                mime="application/vnd.openxmlformats-officedocument.presentationml.presentation"
+            )
 
 
             
@@ -588,6 +619,7 @@ with tab_main:
                 if st.button("検索実行", use_container_width=True) or st.session_state.get("trigger_stat_search"):
                     if query:
                         with st.spinner("e-Statを検索中..."):
+                            from stats_fetcher import StatsFetcher
                             stats_fetcher = StatsFetcher()
                             indicators = stats_fetcher.search_indicators(query)
                             st.session_state["deep_dive_indicators"] = indicators
@@ -604,6 +636,7 @@ with tab_main:
                         c1.write(f"**{ind['name']}**")
                         if c2.button("データ取得", key=f"fetch_data_{ind['code']}"):
                             with st.spinner("最新データを取得中..."):
+                                from stats_fetcher import StatsFetcher
                                 fetcher = StatsFetcher()
                                 data = fetcher.get_indicator_data(ind["code"])
                                 if data:
@@ -658,63 +691,11 @@ with tab_main:
         else:
             st.session_state["main_topic_input"] = new_tag
 
-    @st.cache_data(ttl=3600)  # 1時間キャッシュに戻す
-    def fetch_trending_info(_provider, _api_key, _model):
-        async def _fetch():
-            fetcher = NewsFetcher()
-            scraper = KomeiScraper()
-            generator = ScriptGenerator(provider=_provider, api_key=_api_key, model=_model)
-            
-            # 1. 見出し取得 (個別エラーハンドリング)
-            res_general = []
-            res_komei = []
-            err_general = None
-            err_komei = None
-            
-            try:
-                res_general = await asyncio.to_thread(fetcher.get_trending_headlines)
-            except Exception as e:
-                err_general = str(e)
-            
-            try:
-                res_komei = await scraper.get_trending_headlines()
-            except Exception as e:
-                err_komei = str(e)
-            
-            # 2. キーワード抽出 (個別エラーハンドリング)
-            gen_tags = []
-            kom_tags = []
-            
-            if res_general:
-                try:
-                    gen_tags = await asyncio.to_thread(generator.extract_keyword_tags, res_general)
-                except Exception as e:
-                    err_general = f"Tags Error: {e}" if not err_general else f"{err_general} | Tags Error: {e}"
-            
-            if res_komei:
-                try:
-                    kom_tags = await asyncio.to_thread(generator.extract_keyword_tags, res_komei)
-                except Exception as e:
-                    err_komei = f"Tags Error: {e}" if not err_komei else f"{err_komei} | Tags Error: {e}"
-
-            return {
-                "general": {"tags": gen_tags, "headlines": res_general, "error": err_general},
-                "komei": {"tags": kom_tags, "headlines": res_komei, "error": err_komei}
-            }
-        try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            import nest_asyncio
-            nest_asyncio.apply()
-            return loop.run_until_complete(_fetch())
-        except Exception as e:
-            # st.error はキャッシュ内では使えないため warning で返すか空にする
-            # 実際には呼び出し元で表示できるようにエラー情報を追加可能
-            return {
-                "general": {"tags": [], "headlines": []}, 
-                "komei": {"tags": [], "headlines": []},
-                "error": str(e)
-            }
+    @st.cache_data(ttl=3600)
+    def rerank_trend_tags(_provider, _api_key, model_name, headlines, updated_at):
+        """スナップショットの見出しから AI で注目ワードを選び直す (スナップショット・モデルごとに1回)"""
+        generator = ScriptGenerator(provider=_provider, api_key=_api_key, model=model_name)
+        return generator.extract_keyword_tags(list(headlines), rerank=True)
 
     st.divider()
 
@@ -726,101 +707,178 @@ with tab_main:
             st.session_state["show_trends"] = True
             st.rerun()
     else:
-        # APIキーがある場合のみタグを表示
-        if not api_key:
-            st.warning(f"{provider} の API キーが設定されていません。トレンドの抽出には AI 連携が必要です。")
-            st.info("サイドバーでキーを入力するか、Streamlit Cloud の Secrets で設定してください。")
-            st.session_state["show_trends"] = False
+        # 全セッション共通のスナップショットを読むだけで、取得・更新はバックグラウンドで行う
+        trend_snapshot = get_trend_snapshot()
+        trend_data = trend_snapshot.get()
+        if trend_data is None:
+            st.info("トレンド情報をバックグラウンドで取得中です。少し待ってから「更新を確認」を押してください。")
+            trend_data = {"general": {"tags": [], "headlines": []}, "komei": {"tags": [], "headlines": []}}
         else:
-            with st.spinner("トレンド情報を取得中..."):
-                trend_data = fetch_trending_info(provider, api_key, model)
-                
-                # エラーがあれば表示
-                if "error" in trend_data:
-                    st.error(f"トレンド取得中にエラーが発生しました: {trend_data['error']}")
-                    st.info("Playwright の起動に失敗している可能性があります（クラウド環境の制限など）。")
+            refreshing = " ・ バックグラウンドで更新中..." if trend_snapshot.is_refreshing() else ""
+            st.caption(f"取得日時: {trend_data.get('updated_at', '不明')}{refreshing}")
+        col_refresh, col_rerank = st.columns([1, 2])
+        with col_refresh:
+            if st.button("🔄 更新を確認"):
+                st.rerun()
+        # キーワード抽出はローカルで行うため API キーは不要 (AI による選び直しはキーがある場合のみ)
+        with col_rerank:
+            rerank_trends = bool(api_key) and st.checkbox(
+                "AI で注目ワードを選び直す", value=False,
+                help="ローカルで抽出した候補から、AI が解説向きのキーワードを選び直します。"
+            )
+        if rerank_trends:
+            # スナップショットは全セッション共有なので、書き換えずにコピーに反映する
+            trend_data = dict(trend_data)
+            for section in ("general", "komei"):
+                if trend_data[section]["headlines"]:
+                    try:
+                        trend_data[section] = dict(trend_data[section], tags=rerank_trend_tags(
+                            provider, api_key, model, tuple(trend_data[section]["headlines"]), trend_data.get("updated_at")
+                        ))
+                    except Exception as e:
+                        st.warning(f"AI による選び直しに失敗しました: {e}")
+
+        if trend_data["general"].get("error") and not trend_data["general"]["headlines"]:
+            st.error(f"トレンド取得中にエラーが発生しました: {trend_data['general']['error']}")
+        
+        # 1. 一般ニュースセクション
+        with st.container(border=True):
+            st.markdown("🗞️ **一般ニュースの注目ワード**")
+            tags = trend_data["general"]["tags"]
+            if tags:
+                tag_cols = st.columns(len(tags))
+                for i, tag in enumerate(tags):
+                    tag_cols[i].button(
+                        f"#{tag}", 
+                        key=f"tag_gen_{tag}", 
+                        use_container_width=True,
+                        on_click=on_tag_click,
+                        args=(tag,)
+                    )
             
-            # 1. 一般ニュースセクション
-            with st.container(border=True):
-                st.markdown("🗞️ **一般ニュースの注目ワード**")
-                tags = trend_data["general"]["tags"]
-                if tags:
-                    tag_cols = st.columns(len(tags))
-                    for i, tag in enumerate(tags):
-                        tag_cols[i].button(
-                            f"#{tag}", 
-                            key=f"tag_gen_{tag}", 
-                            use_container_width=True,
-                            on_click=on_tag_click,
-                            args=(tag,)
-                        )
-                
-                headlines = trend_data["general"]["headlines"]
-                if headlines:
-                    for h in headlines[:3]:
-                        st.markdown(f"- <small>{h}</small>", unsafe_allow_html=True)
-                    if len(headlines) > 3:
-                        with st.expander("もっと見る"):
-                            for h in headlines[3:]:
-                                st.markdown(f"- <small>{h}</small>", unsafe_allow_html=True)
-
-            # 2. 公明新聞セクション
-            with st.container(border=True):
-                st.markdown("🏢 **公明新聞の注目ワード**")
-                
-                # 個別エラーの表示
-                if trend_data["komei"].get("error"):
-                    st.warning(f"取得エラー: {trend_data['komei']['error']}")
-                
-                tags = trend_data["komei"]["tags"]
-                if tags:
-                    tag_cols = st.columns(len(tags))
-                    for i, tag in enumerate(tags):
-                        tag_cols[i].button(
-                            f"#{tag}", 
-                            key=f"tag_kom_{tag}", 
-                            use_container_width=True,
-                            on_click=on_tag_click,
-                            args=(tag,)
-                        )
-                
-                headlines = trend_data["komei"]["headlines"]
-                if headlines:
-                    for h in headlines[:3]:
-                        st.markdown(f"- <small>{h}</small>", unsafe_allow_html=True)
-                    if len(headlines) > 3:
-                        with st.expander("もっと見る"):
-                            for h in headlines[3:]:
-                                st.markdown(f"- <small>{h}</small>", unsafe_allow_html=True)
+            headlines = trend_data["general"]["headlines"]
+            if headlines:
+                for h in headlines[:3]:
+                    st.markdown(f"- <small>{h}</small>", unsafe_allow_html=True)
+                if len(headlines) > 3:
+                    with st.expander("もっと見る"):
+                        for h in headlines[3:]:
+                            st.markdown(f"- <small>{h}</small>", unsafe_allow_html=True)
+
+        # 2. 公明新聞セクション
+        with st.container(border=True):
+            st.markdown("🏢 **公明新聞の注目ワード**")
             
-            if st.button("トレンドを閉じる"):
-                st.session_state["show_trends"] = False
-                st.rerun()
+            # 個別エラーの表示
+            if trend_data["komei"].get("error"):
+                st.warning(f"取得エラー: {trend_data['komei']['error']}")
+            
+            tags = trend_data["komei"]["tags"]
+            if tags:
+                tag_cols = st.columns(len(tags))
+                for i, tag in enumerate(tags):
+                    tag_cols[i].button(
+                        f"#{tag}", 
+                        key=f"tag_kom_{tag}", 
+                        use_container_width=True,
+                        on_click=on_tag_click,
+                        args=(tag,)
+                    )
+            
+            headlines = trend_data["komei"]["headlines"]
+            if headlines:
+                for h in headlines[:3]:
+                    st.markdown(f"- <small>{h}</small>", unsafe_allow_html=True)
+                if len(headlines) > 3:
+                    with st.expander("もっと見る"):
+                        for h in headlines[3:]:
+                            st.markdown(f"- <small>{h}</small>", unsafe_allow_html=True)
+        
+        # 3. 上昇中のキーワード (アーカイブした見出しの時間別件数から算出)
+        with st.container(border=True):
+            st.markdown("📈 **上昇中のキーワード**")
+            rising_days = st.select_slider(
+                "比較する期間", options=[3, 7, 14, 30], value=7,
+                format_func=lambda d: f"直近{d}日"
+            )
+            rising = get_default_archive().rising_terms(days=rising_days)
+            if rising:
+                tag_cols = st.columns(min(len(rising), 6))
+                for i, r in enumerate(rising[:6]):
+                    tag_cols[i].button(
+                        f"#{r['term']}",
+                        key=f"tag_rise_{r['term']}",
+                        use_container_width=True,
+                        on_click=on_tag_click,
+                        args=(r['term'],),
+                        help=f"直近24時間 {r['recent']}件 (それ以前の平均 {r['baseline']:.1f}件)"
+                    )
+                # 日別の件数推移 (古い順)
+                st.line_chart({r["term"]: r["daily"] for r in rising[:5]})
+            else:
+                st.caption("見出しの蓄積がまだ少ないため、上昇中のキーワードはありません。")
+
+        if st.button("トレンドを閉じる"):
+            st.session_state["show_trends"] = False
+            st.rerun()
 
 with tab_history:
     st.header("📜 保存済みプロジェクト")
-    history = list_projects()
-    
-    if not history:
-        st.info("保存されたプロジェクトはありません。")
+    HISTORY_PAGE_SIZE = 20
+
+    def set_history_page(page):
+        st.session_state["history_page"] = page
+
+    # 検索語が変わったら1ページ目に戻す
+    history_query = st.text_input(
+        "🔎 トピック・台本を検索", key="history_query",
+        placeholder="空白区切りで複数の語を指定すると、すべてを含むものに絞り込みます"
+    )
+    if st.session_state.get("history_last_query") != history_query:
+        st.session_state["history_last_query"] = history_query
+        st.session_state["history_page"] = 1
+    # 表示するのは1ページ分だけ (件数が増えても描画するボタンの数は変わらない)
+    history = search_projects(history_query, page=st.session_state.get("history_page", 1), per_page=HISTORY_PAGE_SIZE)
+    st.session_state["history_page"] = history["page"]
+
+    if not history["items"]:
+        st.info("該当するプロジェクトはありません。" if history_query.strip() else "保存されたプロジェクトはありません。")
     else:
-        for proj in history:
+        first = (history["page"] - 1) * HISTORY_PAGE_SIZE + 1
+        st.caption(f"{history['total']}件中 {first}〜{first + len(history['items']) - 1}件目")
+        for proj in history["items"]:
             with st.container(border=True):
                 col_h1, col_h2, col_h3 = st.columns([3, 2, 1])
                 with col_h1:
                     st.write(f"**トピック: {proj['topic']}**")
-                    st.caption(f"日時: {proj['timestamp']} | モデル: {proj['model']}")
+                    st.caption(f"日時: {proj['timestamp']} | モデル: {proj['model']} | {proj.get('revision_count') or 1}版")
                 with col_h2:
                     if st.button("台本を表示", key=f"view_{proj['filename']}"):
-                        st.session_state["view_proj"] = proj
-                        # メイン画面へのロード予約
-                        st.session_state["pending_load_proj"] = proj
-                        st.rerun() # リロードして先頭のロード処理を走らせる
+                        # 一覧はメタデータだけなので、開くときに本文とソースを読み込む
+                        full_proj = load_project(proj['filename'])
+                        if full_proj is None:
+                            st.error("プロジェクトの読み込みに失敗しました。")
+                        else:
+                            st.session_state["view_proj"] = full_proj
+                            # メイン画面へのロード予約
+                            st.session_state["pending_load_proj"] = full_proj
+                            st.rerun() # リロードして先頭のロード処理を走らせる
                 with col_h3:
                     if st.button("削除", key=f"del_{proj['filename']}", type="secondary"):
                         delete_project(proj['filename'])
                         st.rerun()
 
+        if history["pages"] > 1:
+            col_prev, col_page, col_next = st.columns([1, 2, 1])
+            with col_prev:
+                st.button("◀ 前へ", key="history_prev", disabled=history["page"] <= 1,
+                          on_click=set_history_page, args=(history["page"] - 1,))
+            with col_page:
+                st.caption(f"{history['page']} / {history['pages']} ページ")
+            with col_next:
+                st.button("次へ ▶", key="history_next", disabled=history["page"] >= history["pages"],
+                          on_click=set_history_page, args=(history["page"] + 1,))
+
     if "view_proj" in st.session_state:
         proj = st.session_state["view_proj"]
         st.divider()
@@ -0,0 +1,248 @@
+"""
+複数のトピックの台本をまとめて生成する
+
+例:
+    python batch_runner.py topics.txt --workers 3 --max-concurrent 2 --rpm 30
+    python batch_runner.py --topic "国保" --topic "賃上げ" --no-komei
+
+topics.txt は1行1トピック (空行と # で始まる行は無視)。
+各トピックは project_manager.save_project で保存し、所要時間と失敗をまとめたレポートを
+logs/batch_YYYYmmdd_HHMMSS.json に書き出す。
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+
+from cli import resolve_model, setting_or_env
+from settings_manager import load_settings
+
+REPORT_DIR = "logs"
+
+class BatchRunner:
+    """
+    トピックのリストを並行して台本にするクラス
+    RSSフィード・LLMの応答キャッシュ・クエリ解析器はトピック間で共有し、
+    LLMの呼び出しはプロバイダーごとの同時実行数と1分あたりの回数で制限する。
+    """
+    def __init__(self, provider: str, api_key: str, model: str, max_workers: int = 3,
+                 max_concurrent: Optional[Dict[str, int]] = None, requests_per_minute: Optional[Dict[str, int]] = None,
+                 feed_ttl_seconds: int = 1800, report_dir: str = REPORT_DIR, export_slides: bool = False, **pipeline_options):
+        """
+        :param max_concurrent: プロバイダーごとの同時呼び出し数 ({"openai": 2})
+        :param requests_per_minute: プロバイダーごとの1分あたりの呼び出し回数 ({"openai": 30})
+        :param export_slides: 全トピックの生成後に PowerPoint をまとめて書き出す (プロジェクトと同じ名前の .pptx)
+        :param pipeline_options: ScriptPipeline にそのまま渡す設定 (use_komei, context_budget など)
+        """
+        # 重いモジュールはバッチを実行するときに読み込む
+        from news_fetcher import FeedCache, NewsFetcher
+        from provider_router import RateLimiter
+
+        self.provider = provider
+        self.api_key = api_key
+        self.model = model
+        self.max_workers = max_workers
+        self.report_dir = report_dir
+        self.export_slides = export_slides
+        self.pipeline_options = pipeline_options
+        self.feed_cache = FeedCache(ttl_seconds=feed_ttl_seconds)
+        self.news_fetcher = NewsFetcher(feed_cache=self.feed_cache)
+        self.rate_limiter = RateLimiter(max_concurrent=max_concurrent, requests_per_minute=requests_per_minute)
+
+    def run(self, topics: List[str], start_date: Optional[datetime.date] = None, end_date: Optional[datetime.date] = None,
+            on_progress: Optional[Callable[[str, str, str], None]] = None) -> Dict:
+        """
+        すべてのトピックを処理し、レポートを返す (1トピックの失敗で全体は止めない)
+        :param on_progress: (トピック, メッセージ, level) を受け取る関数
+        """
+        topics = list(dict.fromkeys(t.strip() for t in topics if t and t.strip()))
+        started_at = datetime.datetime.now()
+        started = time.perf_counter()
+        results: Dict[str, Dict] = {}
+        lock = threading.Lock()
+
+        with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as executor:
+            futures = {
+                executor.submit(self._run_topic, topic, start_date, end_date, on_progress): topic
+                for topic in topics
+            }
+            for future in as_completed(futures):
+                with lock:
+                    results[futures[future]] = future.result()
+
+        items = [results[t] for t in topics]
+        decks = [item.pop("slides_data", None) for item in items]
+        slides_elapsed = self._export_slides(items, decks) if self.export_slides else None
+        report = {
+            "started_at": started_at.isoformat(timespec="seconds"),
+            "finished_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "elapsed": round(time.perf_counter() - started, 2),
+            "provider": self.provider,
+            "model": self.model,
+            "workers": self.max_workers,
+            "succeeded": sum(1 for r in items if r["status"] == "ok"),
+            "failed": sum(1 for r in items if r["status"] != "ok"),
+            "feed_cache": {"hits": self.feed_cache.hits, "misses": self.feed_cache.misses},
+            "slides_elapsed": round(slides_elapsed, 2) if slides_elapsed is not None else None,
+            "topics": items,
+        }
+        report["report_path"] = self._write_report(report, started_at)
+        return report
+
+    def _run_topic(self, topic: str, start_date: Optional[datetime.date], end_date: Optional[datetime.date],
+                   on_progress: Optional[Callable[[str, str, str], None]]) -> Dict:
+        from pipeline import ScriptPipeline
+        from project_manager import save_project
+
+        started = time.perf_counter()
+        item = {"topic": topic, "status": "ok", "path": None, "error": None}
+        try:
+            pipeline = ScriptPipeline(
+                self.provider, self.api_key, self.model,
+                news_fetcher=self.news_fetcher, rate_limiter=self.rate_limiter,
+                **self.pipeline_options
+            )
+            result = pipeline.run(
+                topic, start_date=start_date, end_date=end_date,
+                on_progress=(lambda message, level: on_progress(topic, message, level)) if on_progress else None
+            )
+            item["path"] = save_project(
+                topic, result["script"], result["news_list"], result["speeches"], self.provider, self.model,
+                research=result["research"]
+            )
+            item.update({
+                "run_id": result["run_id"],
+                "provider_used": result["provider_used"],
+                "news": len(result["news_list"]),
+                "speeches": len(result["speeches"]),
+                "slides": len(result["slides_data"]),
+                "slides_data": result["slides_data"],
+                "llm_calls": sum(m.get("calls", 0) for m in result["metrics"].values()) if result["metrics"] else 0,
+            })
+        except Exception as e:
+            item["status"] = "error"
+            item["error"] = f"{type(e).__name__}: {e}"
+        item["elapsed"] = round(time.perf_counter() - started, 2)
+        if on_progress:
+            label = f"✅ 完了 ({item['elapsed']:.1f}秒)" if item["status"] == "ok" else f"❌ 失敗: {item['error']}"
+            on_progress(topic, label, "success" if item["status"] == "ok" else "error")
+        return item
+
+    def _export_slides(self, items: List[Dict], decks: List[Optional[List[Dict]]]) -> Optional[float]:
+        # 資料の描画は CPU 処理なので、LLM の並行処理とは別にプロセスプールでまとめて行う (所要時間を返す)
+        from deck_renderer import render_decks
+        from project_store import project_stem
+
+        targets = [(item, slides) for item, slides in zip(items, decks) if item["status"] == "ok" and slides]
+        if not targets:
+            return None
+        started = time.perf_counter()
+        try:
+            rendered = render_decks([(f"{item['topic']}に関する解説", slides) for item, slides in targets])
+        except Exception as e:
+            print(f"Error rendering slides: {e}")
+            return None
+        for (item, _), pptx_bytes in zip(targets, rendered):
+            item["slides_path"] = project_stem(item["path"]) + ".pptx"
+            with open(item["slides_path"], "wb") as f:
+                f.write(pptx_bytes)
+        return time.perf_counter() - started
+
+    def _write_report(self, report: Dict, started_at: datetime.datetime) -> Optional[str]:
+        try:
+            if not os.path.exists(self.report_dir):
+                os.makedirs(self.report_dir)
+            path = os.path.join(self.report_dir, f"batch_{started_at.strftime('%Y%m%d_%H%M%S')}.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            return path
+        except Exception as e:
+            print(f"Error writing batch report: {e}")
+            return None
+
+def _limits(values: Optional[List[str]], default: Optional[int], provider: str) -> Dict[str, int]:
+    # "openai=2" 形式 (プロバイダー省略時は生成に使うプロバイダー) を dict にする
+    limits = {provider.lower(): default} if default else {}
+    for value in values or []:
+        name, _, number = value.rpartition("=")
+        limits[(name or provider).lower()] = int(number)
+    return limits
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="複数のトピックの台本をまとめて生成します")
+    parser.add_argument("topics_file", nargs="?", help="1行1トピックのテキストファイル (- で標準入力)")
+    parser.add_argument("--topic", action="append", default=[], help="トピック (複数指定可)")
+    parser.add_argument("--provider", choices=["OpenAI", "Gemini"], default=None)
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--api-key", default=None)
+    parser.add_argument("--days", type=int, default=None, help="今日から遡る日数 (未指定ならトピックごとに推測)")
+    parser.add_argument("--workers", type=int, default=3, help="同時に処理するトピック数")
+    parser.add_argument("--max-concurrent", nargs="*", default=None, metavar="[PROVIDER=]N",
+                        help="プロバイダーごとのLLM同時呼び出し数 (既定: 2)")
+    parser.add_argument("--rpm", nargs="*", default=None, metavar="[PROVIDER=]N",
+                        help="プロバイダーごとの1分あたりのLLM呼び出し回数 (既定: 制限なし)")
+    for name in ("komei", "diet", "news", "law", "stats", "subsidy"):
+        parser.add_argument(f"--no-{name}", action="store_true")
+    parser.add_argument("--budget", type=int, default=None)
+    parser.add_argument("--presummary", action="store_true")
+    parser.add_argument("--retrieval-top-k", type=int, default=None)
+    parser.add_argument("--force-refresh", action="store_true", help="直近の調査結果を使わず、すべてのソースを取り直す")
+    parser.add_argument("--slides", action="store_true", help="PowerPoint もまとめて書き出す")
+    parser.add_argument("--report-dir", default=REPORT_DIR)
+    args = parser.parse_args(argv)
+
+    topics = list(args.topic)
+    if args.topics_file:
+        f = sys.stdin if args.topics_file == "-" else open(args.topics_file, "r", encoding="utf-8")
+        with f:
+            topics.extend(line.strip() for line in f if line.strip() and not line.lstrip().startswith("#"))
+    if not topics:
+        parser.error("トピックを指定してください (ファイルまたは --topic)")
+
+    settings = load_settings()
+    provider, model, api_key = resolve_model(args.provider, args.model, args.api_key, settings)
+    if not api_key:
+        print(f"{provider}のAPIキーがありません (--api-key・環境変数・settings.json のいずれかで指定してください)", file=sys.stderr)
+        return 2
+
+    start_date = end_date = None
+    if args.days:
+        end_date = datetime.date.today()
+        start_date = end_date - datetime.timedelta(days=args.days)
+
+    runner = BatchRunner(
+        provider, api_key, model, max_workers=args.workers,
+        max_concurrent=_limits(args.max_concurrent, 2, provider),
+        requests_per_minute=_limits(args.rpm, None, provider),
+        report_dir=args.report_dir, export_slides=args.slides,
+        use_komei=not args.no_komei, use_diet=not args.no_diet, use_news=not args.no_news,
+        use_law=not args.no_law, use_stats=not args.no_stats, use_subsidy=not args.no_subsidy,
+        komei_user=setting_or_env("KOMEI_USER", "komei_user", settings),
+        komei_pass=setting_or_env("KOMEI_PASS", "komei_pass", settings),
+        context_budget=args.budget or int(settings.get("context_budget", 12000)),
+        summary_model="auto" if args.presummary else None,
+        retrieval_top_k=args.retrieval_top_k,
+        force_refresh=args.force_refresh
+    )
+    print_lock = threading.Lock()
+
+    def on_progress(topic: str, message: str, level: str):
+        if level in ("info", "success", "error", "note"):
+            with print_lock:
+                print(f"[{topic}] {message}", file=sys.stderr)
+
+    report = runner.run(topics, start_date=start_date, end_date=end_date, on_progress=on_progress)
+    print(f"完了: 成功 {report['succeeded']}件 / 失敗 {report['failed']}件 ({report['elapsed']:.1f}秒)", file=sys.stderr)
+    for item in report["topics"]:
+        print(f"  {item['topic']}: {item['path'] or item['error']} ({item['elapsed']:.1f}秒)", file=sys.stderr)
+    if report["report_path"]:
+        print(report["report_path"])
+    return 0 if report["failed"] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+起動時の import コストを計測する
+
+app.py の先頭で読み込むモジュールを新しいプロセスで import し、`python -X importtime` の結果から
+モジュールごとの累積時間を表示する。重い依存 (LLM SDK・Playwright・python-pptx・numpy) が
+起動時に読み込まれていないかも確認する。
+
+例:
+    python bench_startup.py                 # app.py の import を計測
+    python bench_startup.py --repeat 5      # 5回計測して中央値を使う
+    python bench_startup.py --module pipeline --module script_generator
+    python bench_startup.py --max-ms 800    # 合計がこれを超えたら終了コード 1 (回帰検知用)
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# 起動時には読み込まれてほしくない重いモジュール
+HEAVY_MODULES = ["openai", "google.generativeai", "playwright", "pptx", "numpy", "googleapiclient", "feedparser"]
+
+_TOP_LEVEL_IMPORT = re.compile(r"^(?:from\s+([\w.]+)\s+import\s|import\s+([\w., ]+?)\s*$)")
+
+def app_imports(path: str = "app.py", skip: Tuple[str, ...] = ("streamlit",)) -> List[str]:
+    """
+    スクリプトのトップレベル (インデント無し) で import しているモジュール名 (記述順)
+    ast ではなく行単位で読むため、実行中の Python で構文解析できないスクリプトにも使える
+    """
+    modules = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            match = _TOP_LEVEL_IMPORT.match(line)
+            if match:
+                names = match.group(1) or match.group(2)
+                modules.extend(n.split(" as ")[0].strip() for n in names.split(","))
+    return [m for m in dict.fromkeys(modules) if m and m.split(".")[0] not in skip]
+
+def measure(modules: List[str]) -> Dict:
+    """
+    新しいプロセスで modules を import し、累積時間 (ms) と読み込まれた重いモジュールを返す
+    """
+    code = (
+        "import sys, json, time\n"
+        "t = time.perf_counter()\n"
+        + "".join(f"import {m}\n" for m in modules)
+        + "elapsed = time.perf_counter() - t\n"
+        f"heavy = [m for m in {HEAVY_MODULES!r} if m in sys.modules]\n"
+        "print(json.dumps({'elapsed': elapsed, 'heavy': heavy}))\n"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)) or "."
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    # "import time: self [us] | cumulative | imported package" の行を読む
+    cumulative: Dict[str, float] = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cum_us, name = line.split("|")
+        # 区切りの後の空白1つを除き、さらにインデントの無い行がトップレベルの import
+        name = name.rstrip()[1:]
+        if name in modules and not name.startswith(" "):
+            cumulative[name] = int(cum_us) / 1000
+    return {
+        "total_ms": result["elapsed"] * 1000,
+        "modules": {m: cumulative.get(m, 0.0) for m in modules},
+        "heavy": result["heavy"],
+    }
+
+def run(modules: List[str], repeat: int = 3) -> Dict:
+    """
+    repeat 回計測し、モジュールごとの中央値を返す
+    """
+    runs = [measure(modules) for _ in range(max(1, repeat))]
+    return {
+        "total_ms": statistics.median(r["total_ms"] for r in runs),
+        "modules": {m: statistics.median(r["modules"][m] for r in runs) for m in modules},
+        "heavy": runs[-1]["heavy"],
+        "repeat": len(runs),
+    }
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="起動時の import コストを計測します")
+    parser.add_argument("--app", default="app.py", help="トップレベルの import を調べるスクリプト")
+    parser.add_argument("--module", action="append", default=None, help="計測するモジュール (指定時は --app を使わない)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-ms", type=float, default=None, help="合計時間の上限 (超えたら終了コード 1)")
+    parser.add_argument("--json", action="store_true", help="結果を JSON で出力する")
+    args = parser.parse_args(argv)
+
+    modules = args.module or app_imports(args.app)
+    result = run(modules, repeat=args.repeat)
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        print(f"{'モジュール':<28} {'累積 (ms)':>10}")
+        # 先に import したモジュールが読み込んだ依存は後のモジュールには計上されない
+        for name, ms in sorted(result["modules"].items(), key=lambda x: -x[1]):
+            print(f"{name:<28} {ms:>10.1f}")
+        print(f"{'合計':<28} {result['total_ms']:>10.1f}  (中央値 / {result['repeat']}回)")
+        print(f"起動時に読み込まれた重いモジュール: {', '.join(result['heavy']) or 'なし'}")
+
+    if args.max_ms is not None and result["total_ms"] > args.max_ms:
+        print(f"合計 {result['total_ms']:.1f}ms が上限 {args.max_ms:.1f}ms を超えました", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""
+Streamlit を使わずにコマンドラインから台本を生成する
+
+例:
+    python cli.py "国保 保険料"
+    python cli.py "賃上げ" --provider OpenAI --model gpt-4o-mini --days 30 --no-komei --slides
+"""
+import argparse
+import datetime
+import os
+import sys
+from typing import Optional, Tuple
+
+from settings_manager import load_settings
+
+def setting_or_env(env_key: str, setting_key: str, settings: dict) -> str:
+    # 環境変数 → settings.json の順で読む (app.py の st.secrets → settings.json と同じ優先順)
+    return os.environ.get(env_key) or settings.get(setting_key, "")
+
+def resolve_model(provider: Optional[str], model: Optional[str], api_key: Optional[str], settings: dict) -> Tuple[str, str, str]:
+    """
+    コマンドラインの指定が無い項目を settings.json / 環境変数で補う
+    :return: (provider, model, api_key)。APIキーが見つからない場合は空文字
+    """
+    provider = provider or settings.get("provider") or "OpenAI"
+    if provider == "OpenAI":
+        model = model or settings.get("openai_model") or "gpt-4o"
+        api_key = api_key or setting_or_env("OPENAI_API_KEY", "openai_key", settings)
+    else:
+        model = model or settings.get("gemini_model") or "gemini-3-pro-preview"
+        api_key = api_key or setting_or_env("GEMINI_API_KEY", "gemini_key", settings)
+    return provider, model, api_key
+
+def _parse_date(text: str) -> datetime.date:
+    try:
+        return datetime.date.fromisoformat(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"日付は YYYY-MM-DD 形式で指定してください: {text}")
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="国会NEWS台本をコマンドラインから生成し、プロジェクトとして保存します")
+    parser.add_argument("topic", help="作成したいトピック (キーワードまたは文章)")
+    parser.add_argument("--provider", choices=["OpenAI", "Gemini"], default=None, help="既定: settings.json の provider")
+    parser.add_argument("--model", default=None, help="既定: settings.json のモデル")
+    parser.add_argument("--api-key", default=None, help="既定: OPENAI_API_KEY / GEMINI_API_KEY または settings.json")
+
+    period = parser.add_argument_group("期間 (指定しない場合は入力文から推測し、無ければ直近7日)")
+    period.add_argument("--days", type=int, default=None, help="今日から遡る日数")
+    period.add_argument("--from", dest="start_date", type=_parse_date, default=None, metavar="YYYY-MM-DD")
+    period.add_argument("--to", dest="end_date", type=_parse_date, default=None, metavar="YYYY-MM-DD")
+
+    sources = parser.add_argument_group("収集ソース")
+    for name, label in (("komei", "公明新聞"), ("diet", "国会議事録"), ("news", "一般ニュース"),
+                        ("law", "e-Gov法令"), ("stats", "e-Stat統計の提案"), ("subsidy", "補助金情報")):
+        sources.add_argument(f"--no-{name}", action="store_true", help=f"{label}を使わない")
+    sources.add_argument("--komei-url", default=None, help="公明新聞の記事URL (検索せずにこの記事を使う)")
+    sources.add_argument("--force-refresh", action="store_true",
+                         help="直近に同じキーワードで調べた結果を使わず、すべてのソースを取り直す")
+
+    generation = parser.add_argument_group("生成")
+    generation.add_argument("--budget", type=int, default=None, help="プロンプトに入れるソースのトークン予算")
+    generation.add_argument("--presummary", action="store_true", help="ソースが多い場合に安価なモデルで事前要約する")
+    generation.add_argument("--retrieval-top-k", type=int, default=None, help="埋め込み検索で採用するチャンク数 (指定時のみ絞り込む)")
+    generation.add_argument("--slides", action="store_true", help="PowerPoint も作成する")
+    parser.add_argument("--quiet", action="store_true", help="進捗と生成中のテキストを表示しない")
+    return parser
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    settings = load_settings()
+
+    provider, model, api_key = resolve_model(args.provider, args.model, args.api_key, settings)
+    if not api_key:
+        print(f"{provider}のAPIキーがありません (--api-key・環境変数・settings.json のいずれかで指定してください)", file=sys.stderr)
+        return 2
+
+    start_date, end_date = args.start_date, args.end_date
+    if args.days:
+        end_date = end_date or datetime.date.today()
+        start_date = end_date - datetime.timedelta(days=args.days)
+
+    # 重いモジュール (LLM SDK など) は引数の検証が済んでから読み込む
+    from pipeline import ScriptPipeline
+    from project_manager import save_project
+    from project_store import project_stem
+
+    pipeline = ScriptPipeline(
+        provider, api_key, model,
+        use_komei=not args.no_komei, use_diet=not args.no_diet, use_news=not args.no_news,
+        use_law=not args.no_law, use_stats=not args.no_stats, use_subsidy=not args.no_subsidy,
+        komei_user=setting_or_env("KOMEI_USER", "komei_user", settings),
+        komei_pass=setting_or_env("KOMEI_PASS", "komei_pass", settings),
+        komei_article_url=args.komei_url,
+        context_budget=args.budget or int(settings.get("context_budget", 12000)),
+        summary_model="auto" if args.presummary else None,
+        retrieval_top_k=args.retrieval_top_k,
+        force_refresh=args.force_refresh
+    )
+
+    def on_progress(message: str, level: str):
+        if not args.quiet:
+            print(message, file=sys.stderr)
+
+    def on_token(chunk: str):
+        if not args.quiet:
+            sys.stderr.write(chunk)
+            sys.stderr.flush()
+
+    try:
+        result = pipeline.run(
+            args.topic, start_date=start_date, end_date=end_date,
+            on_progress=on_progress, on_token=on_token,
+            slides_title=args.topic if args.slides else None
+        )
+    except Exception as e:
+        print(f"エラーが発生しました: {e}", file=sys.stderr)
+        return 1
+    if not args.quiet:
+        sys.stderr.write("\n")
+
+    path = save_project(
+        args.topic, result["script"], result["news_list"], result["speeches"],
+        provider, model, research=result["research"]
+    )
+    # 保存先は標準出力に出す (スクリプトから受け取りやすいように)
+    print(path)
+    if result.get("slides_pptx"):
+        # 資料はプロジェクトと同じ名前で保存する (並行して実行しても上書きし合わない)
+        slides_path = project_stem(path) + ".pptx"
+        with open(slides_path, "wb") as f:
+            f.write(result["slides_pptx"])
+        print(slides_path)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
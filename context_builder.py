@@ -0,0 +1,230 @@
+import re
+from functools import lru_cache
+from datetime import datetime
+from typing import List, Dict, Optional
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken が無い環境では文字種ベースの概算で代用する
+    tiktoken = None
+
+# ソースごとの予算配分 (合計予算に対する割合)
+DEFAULT_QUOTAS = {
+    "law": 0.15,
+    "stats": 0.05,
+    "diet": 0.35,
+    "news": 0.35,
+    "subsidy": 0.10,
+}
+
+# ソースごとの最大件数 (None は無制限)
+DEFAULT_MAX_ITEMS = {
+    "subsidy": 3,
+}
+
+@lru_cache(maxsize=8)
+def _get_encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        try:
+            return tiktoken.get_encoding("o200k_base")
+        except Exception:
+            return None
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    """
+    テキストのトークン数を数える (tiktoken が無い場合は概算)
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    # 概算: 日本語などの非ASCII文字は1文字≒1トークン、ASCIIは4文字≒1トークン
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
+
+class ContextBuilder:
+    """
+    ソースごとにトークン数を数え、全体予算とソース別の配分の範囲内で
+    価値の高い項目から順にプロンプト用のコンテキストを組み立てるクラス
+    """
+    def __init__(self, total_budget: int = 12000, quotas: Optional[Dict[str, float]] = None,
+                 max_items: Optional[Dict[str, int]] = None, model: str = "gpt-4o"):
+        self.total_budget = total_budget
+        self.quotas = dict(DEFAULT_QUOTAS, **(quotas or {}))
+        self.max_items = dict(DEFAULT_MAX_ITEMS, **(max_items or {}))
+        self.model = model
+
+    def build(self, topic: str, news_list: List[Dict], diet_speeches: List[Dict], law_data: List[Dict],
+              stats_summaries: List[str], subsidy_data: List[Dict], keywords: Optional[List[str]] = None) -> Dict:
+        """
+        各セクションのテキストと、採用・除外の内訳 (report) を返す
+        """
+        terms = self._terms(topic, keywords)
+        sources = {
+            "law": [self._item("law", l, self._format_law(l), self._score_law(l, terms), l.get("title")) for l in law_data],
+            "stats": [self._item("stats", s, f"- {s}", self._relevance(s, terms), s[:30]) for s in stats_summaries],
+            "diet": [self._item("diet", s, self._format_speech_digest(s) if s.get("digest_of") else self._format_speech(s),
+                                self._score_speech(s, terms), f"{s.get('speaker')} ({s.get('date')})") for s in diet_speeches],
+            "news": [self._item("news", n, self._format_news(n), self._score_news(n, terms), n.get("title")) for n in news_list],
+            "subsidy": [self._item("subsidy", s, self._format_subsidy(s), self._relevance(f"{s.get('title')}", terms), s.get("title")) for s in subsidy_data],
+        }
+
+        selected = {name: [] for name in sources}
+        used = {name: 0 for name in sources}
+        leftovers = []
+
+        # 1. ソース別の配分内で、スコアの高い順に詰める
+        for name, items in sources.items():
+            quota = int(self.total_budget * self.quotas.get(name, 0))
+            limit = self.max_items.get(name)
+            for item in sorted(items, key=lambda x: x["score"], reverse=True):
+                if limit is not None and len(selected[name]) >= limit:
+                    item["reason"] = "件数上限"
+                    leftovers.append(item)
+                elif used[name] + item["tokens"] <= quota:
+                    selected[name].append(item)
+                    used[name] += item["tokens"]
+                else:
+                    leftovers.append(item)
+
+        # 2. 余った予算を、ソースを問わずスコア順に再配分する
+        remaining = self.total_budget - sum(used.values())
+        dropped = []
+        for item in sorted(leftovers, key=lambda x: x["score"], reverse=True):
+            if item.get("reason") != "件数上限" and item["tokens"] <= remaining:
+                selected[item["source"]].append(item)
+                used[item["source"]] += item["tokens"]
+                remaining -= item["tokens"]
+            else:
+                dropped.append({
+                    "source": item["source"],
+                    "label": item["label"],
+                    "tokens": item["tokens"],
+                    "reason": item.get("reason", "予算超過"),
+                })
+
+        result = {name: "\n".join(i["text"] for i in items) for name, items in selected.items()}
+        result["selected"] = {name: [i["data"] for i in items] for name, items in selected.items()}
+        result["report"] = {
+            "budget": self.total_budget,
+            "used": sum(used.values()),
+            "sections": {
+                name: {
+                    "included": len(selected[name]),
+                    "dropped": len([d for d in dropped if d["source"] == name]),
+                    "tokens": used[name],
+                    "quota": int(self.total_budget * self.quotas.get(name, 0)),
+                }
+                for name in sources
+            },
+            "dropped": dropped,
+        }
+        return result
+
+    def _item(self, source: str, data, text: str, score: float, label: Optional[str]) -> Dict:
+        return {
+            "source": source,
+            "data": data,
+            "text": text,
+            "tokens": count_tokens(text + "\n", self.model),
+            "score": score,
+            "label": label or "",
+        }
+
+    # --- 整形 ---
+
+    @staticmethod
+    def _format_news(n: Dict) -> str:
+        return f"ソース: {n['source']}\nタイトル: {n['title']}\n要約: {n['summary']}\n---"
+
+    @staticmethod
+    def _format_speech(s: Dict) -> str:
+        return f"日付: {s.get('date')}\n発言者: {s.get('speaker')}\n会議録: {(s.get('speech') or '')[:500]}...\n---"
+
+    @staticmethod
+    def _format_speech_digest(s: Dict) -> str:
+        # 事前要約 (source_summarizer) は要約の段階で長さを決めているので、ここでは切り詰めない
+        return f"期間: {s.get('date')}\n発言者: {s.get('speaker')}\n会議録の要約 ({s.get('digest_of')}件):\n{s.get('speech') or ''}\n---"
+
+    @staticmethod
+    def _format_law(law: Dict) -> str:
+        part = f"- {law.get('title')} ({law.get('number')})"
+        if law.get("snippets"):
+            part += "\n  条文抜粋:\n  " + "\n  ".join(law["snippets"])
+        return part
+
+    @staticmethod
+    def _format_subsidy(sub: Dict) -> str:
+        return f"- 【{sub.get('name')}】\n  締切: {sub.get('deadline')}\n  上限: {sub.get('limit')}\n  対象: {sub.get('target')}\n  概要: {sub.get('title')}"
+
+    # --- スコアリング ---
+
+    @staticmethod
+    def _terms(topic: str, keywords: Optional[List[str]]) -> List[str]:
+        terms = [t for t in re.split(r"[\s,、，。・/]+", topic or "") if len(t) >= 2]
+        terms.extend(k for k in (keywords or []) if k)
+        return list(dict.fromkeys(terms))
+
+    @staticmethod
+    def _relevance(text: str, terms: List[str]) -> float:
+        if not text:
+            return 0.0
+        return float(sum(min(text.count(t), 5) for t in terms))
+
+    def _score_news(self, n: Dict, terms: List[str]) -> float:
+        score = self._relevance(f"{n.get('title', '')} {n.get('summary', '')}", terms)
+        if n.get("source") == "公明新聞":
+            score += 5
+        # 新しい記事を優先
+        score += self._recency(n.get("published", ""))
+        score += self._retrieval_bonus(n)
+        return score
+
+    def _score_speech(self, s: Dict, terms: List[str]) -> float:
+        score = self._relevance(s.get("speech") or "", terms)
+        if "公明党" in (s.get("speakerGroup") or ""):
+            score += 3
+        score += self._recency(s.get("date") or "")
+        score += self._retrieval_bonus(s)
+        return score
+
+    def _score_law(self, law: Dict, terms: List[str]) -> float:
+        score = self._relevance(f"{law.get('title', '')} {' '.join(law.get('snippets', []))}", terms)
+        if law.get("snippets"):
+            score += 2
+        score += self._retrieval_bonus(law)
+        return score
+
+    @staticmethod
+    def _retrieval_bonus(item: Dict) -> float:
+        # 埋め込み検索で絞り込まれた項目は、コサイン類似度 (0〜1) に応じて加点する
+        return 10.0 * max(0.0, float(item.get("retrieval_score") or 0.0))
+
+    @staticmethod
+    def _recency(date_str: str) -> float:
+        try:
+            date = datetime.strptime((date_str or "")[:10], "%Y-%m-%d")
+        except ValueError:
+            return 0.0
+        # 新しいほど大きい小さなボーナス (当日 2.0 → 1年前 0.0)
+        days_ago = (datetime.now() - date).days
+        return min(2.0, max(0.0, 2.0 - days_ago / 182.5))
+
+def format_context_report(report: Dict, labels: Optional[Dict[str, str]] = None) -> str:
+    """
+    build() の report を1行の要約文字列にする
+    """
+    labels = labels or {"law": "法令", "stats": "統計", "diet": "議事録", "news": "ニュース", "subsidy": "補助金"}
+    parts = []
+    for name, sec in report["sections"].items():
+        if sec["included"] or sec["dropped"]:
+            part = f"{labels.get(name, name)} {sec['included']}件"
+            if sec["dropped"]:
+                part += f" (除外 {sec['dropped']}件)"
+            parts.append(part)
+    return f"{report['used']:,} / {report['budget']:,} トークン ・ " + "、".join(parts)
@@ -0,0 +1,224 @@
+"""
+PowerPoint 資料の描画
+
+テンプレートは1回だけ読み込んでメモリ上に保持し、デッキごとにそこから開く。
+段落の書式 (フォント・サイズ・行間) はスタイルごとに雛形の要素を1つ作っておき、
+段落ごとに python-pptx のプロパティを設定する代わりに雛形を複製して差し込む。
+多数のデッキをまとめて書き出す場合は render_decks でプロセスプールに分散する。
+
+ベンチマーク:
+    python deck_renderer.py --decks 40 --slides 10 --workers 4
+"""
+import argparse
+import io
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from copy import deepcopy
+from typing import Dict, List, Optional, Tuple
+
+# メイリオなどの日本語フォントを指定
+FONT_NAME = "Meiryo"
+SUBTITLE_TEXT = "Generated by AI Summarizer"
+
+# 段落のスタイル (サイズ・段落後のスペースは pt、行間は倍率)
+STYLES = {
+    "deck_title": {"size": 44, "bold": True},
+    "subtitle": {"size": 20},
+    "slide_title": {"size": 36, "bold": True},
+    "body": {"size": 28, "space_after": 14, "line_spacing": 1.3},
+}
+
+def content_lines(content_text: str) -> List[str]:
+    """
+    本文の各行から先頭の・やスペースを削除する (PPTXの箇条書き機能と重複しないように)
+    """
+    lines = []
+    for line in (content_text or "").split("\n"):
+        cleaned_line = line.lstrip("・ ").lstrip()
+        if cleaned_line:
+            lines.append(cleaned_line)
+    return lines
+
+def notes_text(slide_info: Dict) -> str:
+    """
+    ノートに書く内容 (キャプションと図解指示)
+    """
+    text = slide_info.get("caption", "")
+    if "visual_logic" in slide_info:
+        text += f"\n\n[図解指示]\n{slide_info['visual_logic']}"
+    return text
+
+class DeckRenderer:
+    """
+    テンプレートと書式の雛形を使い回して、スライドデータから PPTX のバイト列を作るクラス
+    """
+    def __init__(self, template_path: Optional[str] = None, font_name: str = FONT_NAME):
+        """
+        :param template_path: 元にする .pptx (未指定なら python-pptx の既定テンプレート)
+                              レイアウト0をタイトル、レイアウト1を箇条書きとして使う
+        """
+        from pptx import Presentation
+        from pptx.util import Inches
+
+        self.template_path = template_path
+        self.font_name = font_name
+        base = Presentation(template_path) if template_path else Presentation()
+        # ノートのマスターはデッキごとに作られないよう、テンプレートの時点で作っておく
+        base.notes_master
+        buffer = io.BytesIO()
+        base.save(buffer)
+        self._template = buffer.getvalue()
+        self._styles = self._build_styles()
+        # 本文エリアの位置 (左, 上, 幅, 高さ)。4:3 の標準テンプレートに合わせて調整
+        self._body_box = (Inches(0.5), Inches(1.8), Inches(9.0), Inches(5.0))
+
+    def render(self, title: str, slides_data: List[Dict]) -> bytes:
+        """
+        1つのデッキを作成し、PPTXファイルの中身を返す
+        """
+        from pptx import Presentation
+
+        prs = Presentation(io.BytesIO(self._template))
+
+        # --- タイトルスライド ---
+        slide = prs.slides.add_slide(prs.slide_layouts[0])
+        slide.shapes.title.text = title
+        self._apply(slide.shapes.title.text_frame, "deck_title")
+        subtitle = slide.placeholders[1]
+        subtitle.text = SUBTITLE_TEXT
+        self._apply(subtitle.text_frame, "subtitle")
+
+        # --- コンテンツスライド ---
+        bullet_layout = prs.slide_layouts[1]
+        left, top, width, height = self._body_box
+        for slide_info in slides_data:
+            slide = prs.slides.add_slide(bullet_layout)
+
+            title_tf = slide.shapes.title.text_frame
+            title_tf.text = slide_info.get("title", "No Title")
+            title_tf.word_wrap = True
+            self._apply(title_tf, "slide_title")
+
+            body_shape = slide.placeholders[1]
+            body_shape.left, body_shape.top, body_shape.width, body_shape.height = left, top, width, height
+            tf = body_shape.text_frame
+            tf.word_wrap = True
+            tf.text = "\n".join(content_lines(slide_info.get("content", "")))
+            self._apply(tf, "body")
+
+            notes = notes_text(slide_info)
+            if notes:
+                slide.notes_slide.notes_text_frame.text = notes
+
+        buffer = io.BytesIO()
+        prs.save(buffer)
+        return buffer.getvalue()
+
+    def _apply(self, text_frame, style: str):
+        # 段落の書式 (a:pPr) を雛形の複製で置き換える
+        prototype = self._styles[style]
+        for p in text_frame._txBody.p_lst:
+            if p.pPr is not None:
+                p.remove(p.pPr)
+            p.insert(0, deepcopy(prototype))
+
+    def _build_styles(self) -> Dict:
+        # 作業用のスライドの段落に python-pptx で書式を設定し、その a:pPr を雛形として取り出す
+        from pptx import Presentation
+        from pptx.util import Pt
+
+        prs = Presentation(io.BytesIO(self._template))
+        text_frame = prs.slides.add_slide(prs.slide_layouts[1]).placeholders[1].text_frame
+        styles = {}
+        for name, style in STYLES.items():
+            text_frame.text = ""
+            paragraph = text_frame.paragraphs[0]
+            paragraph.font.name = self.font_name
+            paragraph.font.size = Pt(style["size"])
+            if style.get("bold"):
+                paragraph.font.bold = True
+            if "space_after" in style:
+                paragraph.space_after = Pt(style["space_after"])
+            if "line_spacing" in style:
+                paragraph.line_spacing = style["line_spacing"]
+            styles[name] = deepcopy(paragraph._p.pPr)
+        return styles
+
+_default_renderer: Optional[DeckRenderer] = None
+_default_renderer_lock = threading.Lock()
+
+def get_default_renderer() -> DeckRenderer:
+    """
+    プロセス内で共有するデフォルトの描画器を返す
+    """
+    global _default_renderer
+    with _default_renderer_lock:
+        if _default_renderer is None:
+            _default_renderer = DeckRenderer()
+        return _default_renderer
+
+# プロセスプールの各ワーカーが持つ描画器 (テンプレートはワーカーごとに1回だけ読み込む)
+_worker_renderer: Optional[DeckRenderer] = None
+
+def _init_worker(template_path: Optional[str]):
+    global _worker_renderer
+    _worker_renderer = DeckRenderer(template_path)
+
+def _render_in_worker(deck: Tuple[str, List[Dict]]) -> bytes:
+    return _worker_renderer.render(*deck)
+
+def render_decks(decks: List[Tuple[str, List[Dict]]], max_workers: Optional[int] = None,
+                 template_path: Optional[str] = None) -> List[bytes]:
+    """
+    (タイトル, スライドデータ) のリストをまとめて描画し、同じ順序でバイト列を返す
+    :param max_workers: プロセス数 (未指定なら CPU 数。1 またはデッキが1つならこのプロセスで描画する)
+    """
+    decks = list(decks)
+    workers = min(max_workers or os.cpu_count() or 1, len(decks))
+    if workers <= 1:
+        renderer = DeckRenderer(template_path) if template_path else get_default_renderer()
+        return [renderer.render(title, slides_data) for title, slides_data in decks]
+    # プロセス間の受け渡しを減らすため、ワーカーあたり数デッキずつまとめて渡す
+    chunksize = max(1, len(decks) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(template_path,)) as executor:
+        return list(executor.map(_render_in_worker, decks, chunksize=chunksize))
+
+def _sample_decks(n_decks: int, n_slides: int) -> List[Tuple[str, List[Dict]]]:
+    return [
+        (f"トピック{d}に関する解説", [
+            {
+                "title": f"スライド{i + 1}: 制度の概要と論点",
+                "content": "・背景と経緯\n・主な改正点\n・家計への影響\n・今後の見通し",
+                "caption": "ここでは制度の概要と主な論点を説明します。" * 3,
+                "visual_logic": "diagram: 比較表\nillustration: 家族",
+            }
+            for i in range(n_slides)
+        ])
+        for d in range(n_decks)
+    ]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PPTX 描画のスループットを計測します")
+    parser.add_argument("--decks", type=int, default=40)
+    parser.add_argument("--slides", type=int, default=10, help="デッキあたりのコンテンツスライド数")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--template", default=None)
+    args = parser.parse_args()
+
+    decks = _sample_decks(args.decks, args.slides)
+    renderer = DeckRenderer(args.template)
+    renderer.render(*decks[0])  # 初回の読み込みを除く
+
+    started = time.perf_counter()
+    for deck in decks:
+        renderer.render(*deck)
+    serial = time.perf_counter() - started
+    print(f"1プロセス: {args.decks / serial:.1f} デッキ/秒 ({serial:.2f}秒)")
+
+    started = time.perf_counter()
+    results = render_decks(decks, max_workers=args.workers, template_path=args.template)
+    pooled = time.perf_counter() - started
+    print(f"{args.workers}プロセス: {args.decks / pooled:.1f} デッキ/秒 ({pooled:.2f}秒、プロセス起動を含む)")
+    print(f"平均サイズ: {sum(len(r) for r in results) / len(results) / 1024:.1f} KB")
@@ -0,0 +1,286 @@
+"""
+Google Slides API のローカルのフェイクサーバー (動作確認用)
+
+GoogleSlideGenerator が送るリクエスト (presentations.create / batchUpdate / get) を受け付け、
+プレゼンテーションをメモリ上に保持する。objectId の形式・重複、placeholderIdMappings と
+レイアウトの対応、存在しない図形への insertText は本物の API と同じく 400 エラーにする。
+受け付けた HTTP リクエストは calls に記録するので、往復回数の確認に使える。
+
+例:
+    python fake_slides_server.py              # サンプルのデッキを作り、往復回数を表示
+    python fake_slides_server.py --serve 8765 # サーバーだけ起動する
+"""
+import argparse
+import itertools
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+# 本物の API と同じ objectId の制約 (5〜50文字、先頭は英数字かアンダースコア)
+OBJECT_ID_PATTERN = re.compile(r"^[a-zA-Z0-9_][a-zA-Z0-9_\-:]{4,49}$")
+
+# predefinedLayout ごとのプレースホルダー
+LAYOUT_PLACEHOLDERS = {
+    "BLANK": [],
+    "TITLE": ["CENTERED_TITLE", "SUBTITLE"],
+    "TITLE_AND_BODY": ["TITLE", "BODY"],
+    "TITLE_ONLY": ["TITLE"],
+    "SECTION_HEADER": ["TITLE"],
+}
+
+class SlidesApiError(Exception):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+class FakeSlidesServer:
+    """
+    Slides API の一部を真似る HTTP サーバー (別スレッドで動かす)
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.presentations: Dict[str, Dict] = {}
+        self.calls: List[Dict] = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self) -> "FakeSlidesServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def build_service(self):
+        """
+        このサーバーに向けた Slides API クライアントを作る (同梱のディスカバリー文書を使い、認証は不要)
+        """
+        import httplib2
+        from googleapiclient.discovery import build
+        return build(
+            "slides", "v1", http=httplib2.Http(), static_discovery=True,
+            client_options={"api_endpoint": self.url}, cache_discovery=False
+        )
+
+    # --- API の処理 ---
+
+    def _new_id(self, prefix: str) -> str:
+        # サーバー側で割り当てる ID (クライアントからは予測できない)
+        return f"{prefix}_srv{next(self._ids):05d}"
+
+    def _all_ids(self, presentation: Dict) -> set:
+        ids = set()
+        for slide in presentation["slides"]:
+            ids.add(slide["objectId"])
+            ids.update(e["objectId"] for e in slide["pageElements"])
+            notes = slide["slideProperties"]["notesPage"]
+            ids.add(notes["objectId"])
+            ids.update(e["objectId"] for e in notes["pageElements"])
+        return ids
+
+    def _new_slide(self, object_id: str, placeholders: List[Dict]) -> Dict:
+        notes_id = self._new_id("notes_shape")
+        return {
+            "objectId": object_id,
+            "pageElements": placeholders,
+            "slideProperties": {
+                "notesPage": {
+                    "objectId": self._new_id("notes_page"),
+                    "pageElements": [{"objectId": notes_id, "shape": {"placeholder": {"type": "BODY"}, "text": ""}}],
+                    "notesProperties": {"speakerNotesObjectId": notes_id},
+                }
+            },
+        }
+
+    def create(self, body: Dict) -> Dict:
+        presentation_id = self._new_id("presentation")
+        # 本物と同じく、タイトルスライドが1枚入った状態で作られる
+        slide = self._new_slide(self._new_id("p"), [
+            {"objectId": self._new_id("i"), "shape": {"placeholder": {"type": t}, "text": ""}}
+            for t in LAYOUT_PLACEHOLDERS["TITLE"]
+        ])
+        presentation = {"presentationId": presentation_id, "title": body.get("title", ""), "slides": [slide]}
+        self.presentations[presentation_id] = presentation
+        return presentation
+
+    def batch_update(self, presentation_id: str, body: Dict) -> Dict:
+        presentation = self._get(presentation_id)
+        # 途中で失敗したら何も反映しない (本物と同じくリクエスト全体が1つの単位)
+        working = json.loads(json.dumps(presentation))
+        replies = [self._apply(working, request) for request in body.get("requests", [])]
+        self.presentations[presentation_id] = working
+        return {"presentationId": presentation_id, "replies": replies}
+
+    def _get(self, presentation_id: str) -> Dict:
+        if presentation_id not in self.presentations:
+            raise SlidesApiError(f"Requested entity was not found: {presentation_id}", 404)
+        return self.presentations[presentation_id]
+
+    def _apply(self, presentation: Dict, request: Dict) -> Dict:
+        if "createSlide" in request:
+            return self._create_slide(presentation, request["createSlide"])
+        if "insertText" in request:
+            return self._insert_text(presentation, request["insertText"])
+        if "deleteObject" in request:
+            return self._delete_object(presentation, request["deleteObject"])
+        raise SlidesApiError(f"Unsupported request: {list(request)}")
+
+    def _check_new_id(self, presentation: Dict, object_id: str, taken: set):
+        if not OBJECT_ID_PATTERN.match(object_id):
+            raise SlidesApiError(f"Invalid object ID: {object_id}")
+        if object_id in taken:
+            raise SlidesApiError(f"The object ID ({object_id}) should be unique among all pages and page elements.")
+        taken.add(object_id)
+
+    def _create_slide(self, presentation: Dict, req: Dict) -> Dict:
+        taken = self._all_ids(presentation)
+        slide_id = req.get("objectId") or self._new_id("slide")
+        self._check_new_id(presentation, slide_id, taken)
+        layout = req.get("slideLayoutReference", {}).get("predefinedLayout", "BLANK")
+        if layout not in LAYOUT_PLACEHOLDERS:
+            raise SlidesApiError(f"Unsupported layout: {layout}")
+        available = LAYOUT_PLACEHOLDERS[layout]
+
+        mapped = {}
+        for mapping in req.get("placeholderIdMappings", []):
+            ph = mapping.get("layoutPlaceholder", {})
+            if ph.get("type") not in available or ph.get("index", 0) != 0:
+                raise SlidesApiError(f"The layout {layout} has no placeholder {ph}.")
+            if ph["type"] in mapped:
+                raise SlidesApiError(f"Placeholder {ph['type']} is mapped more than once.")
+            self._check_new_id(presentation, mapping["objectId"], taken)
+            mapped[ph["type"]] = mapping["objectId"]
+
+        placeholders = [
+            {"objectId": mapped.get(t) or self._new_id("i"), "shape": {"placeholder": {"type": t}, "text": ""}}
+            for t in available
+        ]
+        index = req.get("insertionIndex", len(presentation["slides"]))
+        if not 0 <= index <= len(presentation["slides"]):
+            raise SlidesApiError(f"Invalid insertion index: {index}")
+        presentation["slides"].insert(index, self._new_slide(slide_id, placeholders))
+        return {"createSlide": {"objectId": slide_id}}
+
+    def _find_shape(self, presentation: Dict, object_id: str) -> Optional[Dict]:
+        for slide in presentation["slides"]:
+            for element in slide["pageElements"] + slide["slideProperties"]["notesPage"]["pageElements"]:
+                if element["objectId"] == object_id:
+                    return element["shape"]
+        return None
+
+    def _insert_text(self, presentation: Dict, req: Dict) -> Dict:
+        shape = self._find_shape(presentation, req.get("objectId", ""))
+        if shape is None:
+            raise SlidesApiError(f"The object ({req.get('objectId')}) could not be found.")
+        if not req.get("text"):
+            raise SlidesApiError("Text must not be empty.")
+        index = req.get("insertionIndex", 0)
+        shape["text"] = shape["text"][:index] + req["text"] + shape["text"][index:]
+        return {}
+
+    def _delete_object(self, presentation: Dict, req: Dict) -> Dict:
+        object_id = req.get("objectId")
+        for slide in presentation["slides"]:
+            if slide["objectId"] == object_id:
+                presentation["slides"].remove(slide)
+                return {}
+            for element in slide["pageElements"]:
+                if element["objectId"] == object_id:
+                    slide["pageElements"].remove(element)
+                    return {}
+        raise SlidesApiError(f"The object ({object_id}) could not be found.")
+
+    # --- HTTP ---
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def _dispatch(self, method: str):
+                path = self.path.split("?")[0]
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+                with server._lock:
+                    server.calls.append({"method": method, "path": path, "body": body})
+                    try:
+                        status, payload = 200, self._route(method, path, body)
+                    except SlidesApiError as e:
+                        status, payload = e.status, {"error": {"code": e.status, "message": str(e)}}
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _route(self, method: str, path: str, body: Dict) -> Dict:
+                if method == "POST" and path == "/v1/presentations":
+                    return server.create(body)
+                match = re.match(r"^/v1/presentations/([^/:]+)(:batchUpdate)?$", path)
+                if match and method == "POST" and match.group(2):
+                    return server.batch_update(match.group(1), body)
+                if match and method == "GET" and not match.group(2):
+                    # fields によるフィールドの絞り込みは行わない
+                    return server._get(match.group(1))
+                raise SlidesApiError(f"Not found: {method} {path}", 404)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+def _sample_slides() -> List[Dict]:
+    return [
+        {"title": "制度の概要", "content": "・背景と経緯\n・主な改正点", "caption": "制度の概要を説明します。",
+         "visual_logic": "diagram: 比較表"},
+        {"title": "家計への影響", "content": "・負担額の変化\n・対象となる世帯", "caption": "家計への影響です。"},
+        {"title": "今後の見通し", "content": "・施行時期\n・残る課題"},
+    ]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Google Slides API のフェイクサーバー")
+    parser.add_argument("--serve", type=int, default=None, metavar="PORT", help="サーバーだけ起動する")
+    args = parser.parse_args()
+
+    if args.serve is not None:
+        fake = FakeSlidesServer(port=args.serve)
+        print(f"Listening on {fake.url}")
+        try:
+            fake._httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    else:
+        from google_slide_generator import GoogleSlideGenerator
+
+        with FakeSlidesServer() as fake:
+            gen = GoogleSlideGenerator(service=fake.build_service())
+            url = gen.create_slides("テストプレゼン", _sample_slides())
+            presentation = next(iter(fake.presentations.values()))
+            print(f"URL: {url}")
+            print(f"往復回数: {len(fake.calls)} ({', '.join(c['method'] + ' ' + c['path'].rsplit('/', 1)[-1] for c in fake.calls)})")
+            for slide in presentation["slides"]:
+                texts = [e["shape"]["text"].replace("\n", " / ") for e in slide["pageElements"]]
+                notes = slide["slideProperties"]["notesPage"]["pageElements"][0]["shape"]["text"]
+                print(f"  {slide['objectId']}: {texts} ノート: {notes[:20]!r}")
@@ -0,0 +1,219 @@
+"""
+Google API (Slides / Drive) のクライアントの共有
+
+認証情報 (トークン) はプロセスで1回だけ読み込み、期限切れ (と期限間近) の更新はロックを取って1スレッドだけが行う。
+ブラウザでの認証 (初回のみ) はこのロックの外で行い、その間も他の認証情報の更新は止めない。
+サービスクライアントは同梱のディスカバリー文書から作り、スレッドごとに使い回す
+(httplib2 の接続はスレッド間で共有できないため)。クライアントには共有の認証情報の複製を渡し、
+クライアント側での更新が共有の認証情報を書き換えないようにする。共有のトークンが更新されたら作り直す。
+使い回せるのは同じスレッドで続けてエクスポートする場合 (バッチ生成のワーカーなど) だけで、
+再実行のたびに別のスレッドで動く Streamlit のアプリでは、ディスカバリー文書の解析以外は毎回作り直しになる。
+
+計測:
+    python google_clients.py
+"""
+import base64
+import copy
+import datetime
+import os
+import pickle
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+# スコープ: プレゼンテーションの作成・編集、ドライブへのアクセス（ファイル作成のため）
+SCOPES = ['https://www.googleapis.com/auth/presentations', 'https://www.googleapis.com/auth/drive.file']
+
+# 期限までの残りがこの秒数を切ったトークンは、クライアントに渡す前に更新する
+TOKEN_REFRESH_MARGIN = 300
+
+_credentials: Dict[Tuple[str, str], object] = {}
+_credentials_lock = threading.Lock()
+# ブラウザでの認証は同時に1つだけ行う (_credentials_lock とは別)
+_auth_flow_lock = threading.Lock()
+_discovery_docs: Dict[Tuple[str, str], str] = {}
+_discovery_lock = threading.Lock()
+_local = threading.local()
+
+def _load_saved_credentials(token_path: str):
+    # 保存済みのトークン (ローカルファイル or Streamlit Cloud Secrets) を読み、期限が近ければ更新する
+    # 使えるトークンが無ければ None (ブラウザでの認証が必要)
+    # Streamlit は Secrets を読むときだけ使う (アプリの外からも使えるように)
+    import streamlit as st
+
+    creds = None
+    # 1. Streamlit Secrets からのトークン読み込みを試行 (Cloud用)
+    try:
+        secret_token = st.secrets.get("google_token_pickle")
+    except Exception:
+        # secrets.toml が無い環境 (CLI など)
+        secret_token = None
+    if secret_token:
+        try:
+            # Base64文字列をデコードしてpickleとして読み込む
+            creds = pickle.loads(base64.b64decode(secret_token))
+        except Exception as e:
+            print(f"Secretsからのトークン読み込み失敗: {e}")
+
+    # 2. ローカルファイルからのトークン読み込み (Local用)
+    if not creds and os.path.exists(token_path):
+        with open(token_path, 'rb') as token:
+            creds = pickle.load(token)
+
+    if creds and not _needs_refresh(creds):
+        return creds
+    if creds and creds.refresh_token and _refresh(creds, token_path):
+        return creds
+    return None
+
+def _run_auth_flow(credentials_path: str, token_path: str):
+    # 新規認証フロー (Local Only)
+    # Cloud環境(Headless)でここに来るとブラウザが開けずに詰むため、
+    # Cloudでは必ず有効なRefresh Token入りPickleをSecretsに置く必要がある。
+    import streamlit as st
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
+    # Client Secretsの取得
+    if os.path.exists(credentials_path):
+        flow = InstalledAppFlow.from_client_secrets_file(credentials_path, SCOPES)
+    elif "google_credentials" in st.secrets:
+        # Secrets (JSON) からロード
+        flow = InstalledAppFlow.from_client_config(dict(st.secrets["google_credentials"]), SCOPES)
+    else:
+        raise FileNotFoundError("認証情報(credentials.json または secrets.google_credentials)が見つかりません。")
+
+    # ローカルサーバー起動
+    creds = flow.run_local_server(port=0)
+    _save_token(creds, token_path)
+    return creds
+
+def _needs_refresh(creds) -> bool:
+    # 期限切れに加え、期限まで TOKEN_REFRESH_MARGIN 秒を切ったトークンも更新する
+    # (クライアント側 (AuthorizedHttp) がエクスポートの途中で更新しないように)
+    if not creds.valid:
+        return True
+    expiry = getattr(creds, "expiry", None)
+    if expiry is None:
+        return False
+    # google-auth の expiry はタイムゾーンなしの UTC
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    return expiry - now < datetime.timedelta(seconds=TOKEN_REFRESH_MARGIN)
+
+def _refresh(creds, token_path: str) -> bool:
+    from google.auth.transport.requests import Request
+
+    try:
+        creds.refresh(Request())
+    except Exception as e:
+        print(f"トークンの更新に失敗: {e}")
+        return False
+    _save_token(creds, token_path)
+    return True
+
+def _save_token(creds, token_path: str):
+    # (Localのみ) トークンを保存
+    # Cloudで実行時はファイル書き込み権限がない場合があるためtry-except
+    try:
+        with open(token_path, 'wb') as token:
+            pickle.dump(creds, token)
+    except Exception:
+        pass
+
+def get_credentials(credentials_path: str = "credentials.json", token_path: str = "token.pickle"):
+    """
+    プロセスで共有する認証情報を返す (期限切れ・期限間近なら更新してから返す)
+    複数スレッドから同時に呼ばれても、読み込み・更新は1回だけ行う。
+    """
+    key = (credentials_path, token_path)
+    with _credentials_lock:
+        creds = _credentials.get(key)
+        if creds is not None and _needs_refresh(creds):
+            if not (creds.refresh_token and _refresh(creds, token_path)):
+                creds = None
+        if creds is None:
+            creds = _load_saved_credentials(token_path)
+        if creds is not None:
+            _credentials[key] = creds
+            return creds
+        _credentials.pop(key, None)
+
+    # ブラウザでの認証は時間がかかるため、_credentials_lock を持たずに行う
+    with _auth_flow_lock:
+        with _credentials_lock:
+            # 待っている間に他のスレッドが認証を済ませていればそれを使う
+            creds = _credentials.get(key)
+            if creds is not None and not _needs_refresh(creds):
+                return creds
+        creds = _run_auth_flow(credentials_path, token_path)
+        with _credentials_lock:
+            _credentials[key] = creds
+        return creds
+
+def _discovery_doc(api: str, version: str) -> str:
+    # googleapiclient に同梱のディスカバリー文書 (ネットワークからは取得しない)
+    # 解析済みの dict はクライアント生成時に書き換えられるため、共有するのは文字列
+    key = (api, version)
+    with _discovery_lock:
+        if key not in _discovery_docs:
+            from googleapiclient.discovery_cache import get_static_doc
+            doc = get_static_doc(api, version)
+            if doc is None:
+                raise ValueError(f"ディスカバリー文書が同梱されていません: {api} {version}")
+            _discovery_docs[key] = doc
+        return _discovery_docs[key]
+
+def build_service(api: str, version: str, credentials=None, http=None):
+    """
+    同梱のディスカバリー文書からサービスクライアントを作る (キャッシュしない)
+    """
+    from googleapiclient.discovery import build_from_document
+    return build_from_document(_discovery_doc(api, version), credentials=credentials, http=http)
+
+def get_service(api: str, version: str, credentials_path: str = "credentials.json", token_path: str = "token.pickle"):
+    """
+    現在のスレッドで使い回すサービスクライアントを返す
+    クライアントには共有の認証情報の複製を渡す (AuthorizedHttp はリクエストの前に自分で期限切れの
+    トークンを更新するため、共有のものを渡すとロックの外で複数のスレッドが同時に更新してしまう)。
+    共有のトークンが更新・再認証された場合はクライアントも作り直す。
+    """
+    creds = get_credentials(credentials_path, token_path)
+    services = getattr(_local, "services", None)
+    if services is None:
+        services = _local.services = {}
+    key = (api, version, credentials_path, token_path)
+    cached: Optional[Tuple[object, object, object]] = services.get(key)
+    if cached is None or cached[0] is not creds or cached[1] != creds.token:
+        # 他のスレッドが更新している途中の状態を写さないよう、複製はロックを取って作る
+        with _credentials_lock:
+            token, own = creds.token, copy.copy(creds)
+        cached = services[key] = (creds, token, build_service(api, version, credentials=own))
+    return cached[2]
+
+def get_slides_service(credentials_path: str = "credentials.json", token_path: str = "token.pickle"):
+    return get_service('slides', 'v1', credentials_path, token_path)
+
+def get_drive_service(credentials_path: str = "credentials.json", token_path: str = "token.pickle"):
+    return get_service('drive', 'v3', credentials_path, token_path)
+
+if __name__ == "__main__":
+    # 認証なしで、毎回 build する場合と使い回す場合のクライアント準備の時間を比べる
+    import httplib2
+    from googleapiclient.discovery import build
+
+    def prepare(service):
+        # 初回のメソッド生成も含める
+        service.presentations().batchUpdate
+
+    n = 20
+    started = time.perf_counter()
+    for _ in range(n):
+        prepare(build('slides', 'v1', http=httplib2.Http(), static_discovery=True, cache_discovery=False))
+    per_build = (time.perf_counter() - started) / n * 1000
+
+    shared = build_service('slides', 'v1', http=httplib2.Http())
+    started = time.perf_counter()
+    for _ in range(n):
+        prepare(shared)
+    per_reuse = (time.perf_counter() - started) / n * 1000
+    print(f"毎回 build: {per_build:.2f} ms / 回")
+    print(f"使い回し:   {per_reuse:.2f} ms / 回 (presentations() の組み立てのみ)")
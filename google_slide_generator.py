@@ -1,238 +1,132 @@
-import os
-import pickle
-import base64
-import json
-import streamlit as st
-from google.auth.transport.requests import Request
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from typing import List, Dict
+from typing import List, Dict, Tuple
 
-# スコープ: プレゼンテーションの作成・編集、ドライブへのアクセス（ファイル作成のため）
-SCOPES = ['https://www.googleapis.com/auth/presentations', 'https://www.googleapis.com/auth/drive.file']
+from deck_renderer import SUBTITLE_TEXT, content_lines, notes_text
+from google_clients import SCOPES, get_credentials, get_drive_service, get_slides_service
 
 class GoogleSlideGenerator:
     """
     Google Slides APIを使用してスライドを生成するクラス
     """
-    def __init__(self, credentials_path: str = "credentials.json", token_path: str = "token.pickle"):
+    def __init__(self, credentials_path: str = "credentials.json", token_path: str = "token.pickle", service=None):
+        """
+        :param service: 作成済みの Slides API クライアント (テスト用のフェイクサーバーなどに向ける場合)
+        """
         self.credentials_path = credentials_path
         self.token_path = token_path
         self.creds = None
-        self.service = None
+        self.service = service
         self.drive_service = None
+        self._service_injected = service is not None
 
     def authenticate(self):
         """
         Google APIの認証を行う (ローカルファイル or Streamlit Cloud Secrets)
+        認証情報とクライアントはプロセス (クライアントはスレッド) ごとに共有され、2回目以降は作り直さない。
         """
-        # 1. Streamlit Secrets からのトークン読み込みを試行 (Cloud用)
-        if "google_token_pickle" in st.secrets:
-            try:
-                # Base64文字列をデコードしてpickleとして読み込む
-                token_bytes = base64.b64decode(st.secrets["google_token_pickle"])
-                self.creds = pickle.loads(token_bytes)
-            except Exception as e:
-                print(f"Secretsからのトークン読み込み失敗: {e}")
-
-        # 2. ローカルファイルからのトークン読み込み (Local用)
-        if not self.creds and os.path.exists(self.token_path):
-            with open(self.token_path, 'rb') as token:
-                self.creds = pickle.load(token)
-
-        # トークンがない、または有効期限切れの場合
-        if not self.creds or not self.creds.valid:
-            if self.creds and self.creds.expired and self.creds.refresh_token:
-                try:
-                    self.creds.refresh(Request())
-                except Exception:
-                    self.creds = None
-            
-            if not self.creds:
-                # 新規認証フロー (Local Only)
-                # Cloud環境(Headless)でここに来るとブラウザが開けずに詰むため、
-                # Cloudでは必ず有効なRefresh Token入りPickleをSecretsに置く必要がある。
-                
-                # Client Secretsの取得
-                if os.path.exists(self.credentials_path):
-                    flow = InstalledAppFlow.from_client_secrets_file(
-                        self.credentials_path, SCOPES)
-                elif "google_credentials" in st.secrets:
-                    # Secrets (JSON) からロード
-                    # st.secrets returns AttrDict, need to convert to standard dict usually or ensure compatibility
-                    config = dict(st.secrets["google_credentials"])
-                    flow = InstalledAppFlow.from_client_config(config, SCOPES)
-                else:
-                    raise FileNotFoundError("認証情報(credentials.json または secrets.google_credentials)が見つかりません。")
-
-                # ローカルサーバー起動
-                self.creds = flow.run_local_server(port=0)
-
-            # (Localのみ) トークンを保存
-            # Cloudで実行時はファイル書き込み権限がない場合があるためtry-except
-            try:
-                with open(self.token_path, 'wb') as token:
-                    pickle.dump(self.creds, token)
-            except:
-                pass
-
-        self.service = build('slides', 'v1', credentials=self.creds)
-        self.drive_service = build('drive', 'v3', credentials=self.creds)
+        self.creds = get_credentials(self.credentials_path, self.token_path)
+        self.service = get_slides_service(self.credentials_path, self.token_path)
+        self.drive_service = get_drive_service(self.credentials_path, self.token_path)
 
     def create_slides(self, title: str, slides_data: List[Dict]) -> str:
         """
         スライドを作成する
+        プレースホルダーのIDは placeholderIdMappings でこちらから指定するため、スライドの追加と
+        テキストの挿入は1回の batchUpdate で済む (作成後にプレゼンテーション全体を取得し直さない)。
+        スピーカーノートの図形IDはAPI側で割り当てられ、事前に指定できないため、
+        ノートがある場合だけ ID を取得 (必要なフィールドのみ) してもう1回 batchUpdate する。
         :return: 作成されたスライドのURL
         """
-        if not self.service:
+        # 共有クライアントはスレッドごとなので、呼び出したスレッドのものを毎回取り直す (2回目以降は辞書の参照のみ)
+        if not self._service_injected:
             self.authenticate()
 
-        # 1. 新規プレゼンテーション作成
-        body = {
-            'title': title
-        }
-        presentation = self.service.presentations().create(body=body).execute()
+        # 1. 新規プレゼンテーション作成 (内容は作成時に指定できないため、ここで1往復)
+        # presentations() は呼ぶたびにメソッドを組み立て直すため、1回だけ取得して使い回す
+        presentations = self.service.presentations()
+        presentation = presentations.create(body={'title': title}).execute()
         presentation_id = presentation.get('presentationId')
-        
-        # 2. スライドの生成とコンテンツ挿入
+        # 既定で作られる1枚目はレイアウトのIDが分からないので削除し、表紙も作り直す
+        default_slide_ids = [slide['objectId'] for slide in presentation.get('slides', [])]
+
+        # 2. 表紙・各スライド・テキストを1回の batchUpdate で作成
+        requests, notes = build_deck_requests(title, slides_data, default_slide_ids)
+        presentations.batchUpdate(
+            presentationId=presentation_id,
+            body={'requests': requests}
+        ).execute()
+
+        # 3. スピーカーノート (キャプション + 図解指示)
+        if notes:
+            self._write_notes(presentations, presentation_id, notes)
+
+        return f"https://docs.google.com/presentation/d/{presentation_id}/edit"
+
+    def _write_notes(self, presentations, presentation_id: str, notes: Dict[str, str]):
+        # ノートの図形IDだけを取得する (ページ全体は取得しない)
+        presentation = presentations.get(
+            presentationId=presentation_id,
+            fields='slides(objectId,slideProperties(notesPage(notesProperties(speakerNotesObjectId))))'
+        ).execute()
         requests = []
-        
-        # タイトルスライドの削除（デフォルトで1枚あるが、制御しやすくするため一旦消す実装もできるが、
-        # ここではデフォルトの1枚目をタイトルスライドとして使う）
-        
-        # --- 1枚目: 表紙 (Title Slide) ---
-        # 既存のスライドIDを取得
-        slides = presentation.get('slides')
-        title_slide_id = slides[0]['objectId']
-        
-        # タイトルとサブタイトルをセット
-        requests.append({
-            'replaceAllText': {
-                'containsText': {'text': 'Click to add title', 'matchCase': False}, # テンプレート依存だが標準的
-                'replaceText': title
-            }
-        })
+        for slide in presentation.get('slides', []):
+            text = notes.get(slide['objectId'])
+            notes_id = (slide.get('slideProperties', {}).get('notesPage', {})
+                        .get('notesProperties', {}).get('speakerNotesObjectId'))
+            if text and notes_id:
+                requests.append({'insertText': {'objectId': notes_id, 'text': text}})
+        if requests:
+            presentations.batchUpdate(
+                presentationId=presentation_id,
+                body={'requests': requests}
+            ).execute()
+
+def build_deck_requests(title: str, slides_data: List[Dict], default_slide_ids: List[str] = ()) -> Tuple[List[Dict], Dict[str, str]]:
+    """
+    表紙と各スライドを作成し、テキストを入れる batchUpdate のリクエストを作る
+    :param default_slide_ids: 削除する既存のスライド (作成時に自動で入る1枚目)
+    :return: (リクエストのリスト, {スライドID: ノートの内容})
+    """
+    requests = []
+    notes = {}
+
+    def add_slide(page_id: str, index: int, layout: str, texts: List[Tuple[str, str, str]]):
+        # texts: (レイアウトのプレースホルダー種別, 割り当てるID, 入れる文字列)
         requests.append({
-            'replaceAllText': {
-                'containsText': {'text': 'Click to add subtitle', 'matchCase': False},
-                'replaceText': 'Generated by AI Summarizer'
+            'createSlide': {
+                'objectId': page_id,
+                'insertionIndex': index,
+                'slideLayoutReference': {'predefinedLayout': layout},
+                'placeholderIdMappings': [
+                    {'layoutPlaceholder': {'type': ph_type, 'index': 0}, 'objectId': object_id}
+                    for ph_type, object_id, _ in texts
+                ],
             }
         })
-        
-        # レイアウトIDが必要なため、ページ追加のリクエストを作成
-        # 事前にプレゼンテーション情報を取得してLayoutIDを特定するのが確実だが、
-        # ここでは標準的な定数IDや挿入ロジックを使用する。
-        # 単純化のため: "TITLE_AND_BODY" レイアウトで新しいスライドを追加していく
-        
-        for i, slide_info in enumerate(slides_data):
-            page_id = f"slide_page_{i}"
-            
-            # スライド追加
-            requests.append({
-                'createSlide': {
-                    'objectId': page_id,
-                    'insertionIndex': i + 1,
-                    'slideLayoutReference': {
-                        'predefinedLayout': 'TITLE_AND_BODY'
-                    }
-                }
-            })
-            
-            # タイトル設定 (createSlideの直後にplaceholder指定でテキストを入れるのは難しいので、
-            # 要素IDを特定するか、追加したスライドに対してShapeを操作する)
-            # しかし、APIの仕様上、createSlideで作成されたスライドのPlaceholder IDは予測困難。
-            # 汎用的なアプローチ: スライド作成 -> そのスライド内のPlaceholderを取得 -> テキスト設定
-            # という2段階が必要だが、batchUpdateは一括実行。
-            
-            # 簡略化アプローチ: 
-            # 1. スライド作成リクエストだけ先に送る
-            # 2. GetしてPlaceholder IDを取得
-            # 3. テキスト挿入リクエストを送る
-            # ↑これをループ内で行うと遅いが確実。
-        
-        # バッチ実行(スライド作成)
-        if len(requests) > 0:
-            self.service.presentations().batchUpdate(
-                presentationId=presentation_id, 
-                body={'requests': requests}
-            ).execute()
-            requests = [] # クリア
+        for _, object_id, text in texts:
+            # 空文字の挿入はエラーになるため省く
+            if text:
+                requests.append({'insertText': {'objectId': object_id, 'text': text}})
 
-        # 生成されたスライドの詳細を取得して、テキストを埋め込む
-        presentation = self.service.presentations().get(presentationId=presentation_id).execute()
-        slides = presentation.get('slides')
-        
-        # 最初のスライド(Title)は除外、追加した分だけ処理
-        # slides[0] is Title Slide
-        # slides[1...] are added slides
-        
-        text_requests = []
-        
-        for i, slide_info in enumerate(slides_data):
-            # slides_data[0] corresponds to slides[1] (because slides[0] is title)
-            if i + 1 >= len(slides): break
-            
-            slide_obj = slides[i + 1]
-            page_id = slide_obj['objectId']
-            
-            # Placeholdersを探す
-            # 通常、TITLE_AND_BODY では index 0 が Title, index 1 が Body
-            title_ph_id = None
-            body_ph_id = None
-            
-            for elem in slide_obj.get('pageElements', []):
-                if 'shape' in elem and 'placeholder' in elem['shape']:
-                    ph = elem['shape']['placeholder']
-                    dtype = ph.get('type')
-                    if dtype == 'TITLE' or dtype == 'CENTERED_TITLE':
-                        title_ph_id = elem['objectId']
-                    elif dtype == 'BODY':
-                        body_ph_id = elem['objectId']
-            
-            # コンテンツ挿入
-            if title_ph_id:
-                text_requests.append({
-                    'insertText': {
-                        'objectId': title_ph_id,
-                        'text': slide_info.get("title", "No Title")
-                    }
-                })
-            
-            if body_ph_id:
-                text_requests.append({
-                    'insertText': {
-                        'objectId': body_ph_id,
-                        'text': slide_info.get("content", "")
-                    }
-                })
-                # 箇条書き設定などをここで行うことも可能
-                
-            # スピーカーノート（Caption + Visual Logic）
-            notes_text = slide_info.get("caption", "")
-            if "visual_logic" in slide_info:
-                notes_text += f"\n\n[図解指示]\n{slide_info['visual_logic']}"
-            
-            if notes_text:
-                # ノートの更新は shape 操作が必要
-                # ノートページIDの取得が必要
-                notes_page_id = slide_obj.get('slideProperties', {}).get('notesPage', {}).get('objectId')
-                # ノートページ内のBODY placeholderを探す必要があるが、API経由でのノート編集は少し複雑。
-                # UpdateShapeText を使う。
-                # ノートマスタのPlaceholder IDを探す...
-                # 簡易実装: insertText to notesPage's BODY placeholder
-                pass # ノート編集は実装が複雑なため、Phase 1ではスキップ（余裕があれば実装）
-                # メモ: スライド作成時にノートへの書き込みは標準機能として簡単ではないため、
-                # 今回は「スライド本文」の充実に注力する。
+    # --- 表紙 ---
+    add_slide('deck_title', 0, 'TITLE', [
+        ('CENTERED_TITLE', 'deck_title_title', title),
+        ('SUBTITLE', 'deck_title_subtitle', SUBTITLE_TEXT),
+    ])
 
-        if text_requests:
-            self.service.presentations().batchUpdate(
-                presentationId=presentation_id, 
-                body={'requests': text_requests}
-            ).execute()
+    # --- 本文スライド ---
+    for i, slide_info in enumerate(slides_data):
+        page_id = f'slide_{i:03d}'
+        add_slide(page_id, i + 1, 'TITLE_AND_BODY', [
+            ('TITLE', f'{page_id}_title', slide_info.get("title", "No Title")),
+            ('BODY', f'{page_id}_body', "\n".join(content_lines(slide_info.get("content", "")))),
+        ])
+        text = notes_text(slide_info)
+        if text:
+            notes[page_id] = text
 
-        # URLを生成
-        presentation_url = f"https://docs.google.com/presentation/d/{presentation_id}/edit"
-        return presentation_url
+    for slide_id in default_slide_ids:
+        requests.append({'deleteObject': {'objectId': slide_id}})
+    return requests, notes
 
 if __name__ == "__main__":
     # Test
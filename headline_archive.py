@@ -0,0 +1,195 @@
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from trend_extractor import headline_terms
+
+ARCHIVE_PATH = os.path.join("cache", "headline_archive.sqlite3")
+# 語ごとの時間別件数を保持する時間数 (リングバッファの長さ)
+DEFAULT_WINDOW_HOURS = 24 * 30
+
+def current_hour(now: Optional[float] = None) -> int:
+    """
+    UNIX時間を1時間単位に丸めた通し番号
+    """
+    return int((now if now is not None else time.time()) // 3600)
+
+class HeadlineArchive:
+    """
+    取得した見出しをタイムスタンプ付きで保存し、語ごとの1時間単位の出現件数を集計するクラス
+    件数は語ごとに固定長の配列 (リングバッファ) で持つため、履歴を読み直さずに
+    直近 N 日の推移や上昇中の語を求められる。
+    """
+    def __init__(self, path: str = ARCHIVE_PATH, window_hours: int = DEFAULT_WINDOW_HOURS):
+        self.path = path
+        self.window_hours = window_hours
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS headlines ("
+            " source TEXT NOT NULL, text TEXT NOT NULL, first_seen REAL NOT NULL, last_seen REAL NOT NULL,"
+            " PRIMARY KEY (source, text))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS term_counts ("
+            " term TEXT PRIMARY KEY, last_hour INTEGER NOT NULL, counts BLOB NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_headlines_first_seen ON headlines (first_seen)")
+        self._conn.commit()
+
+    def record(self, source: str, headlines: List[str], now: Optional[float] = None) -> int:
+        """
+        見出しを保存し、初めて見た見出しの語だけを件数に加える
+        :return: 新しく追加された見出しの件数
+        """
+        now = now if now is not None else time.time()
+        hour = current_hour(now)
+        new_terms: Dict[str, int] = {}
+        added = 0
+        with self._lock:
+            try:
+                for text in dict.fromkeys(h.strip() for h in headlines if h and h.strip()):
+                    cur = self._conn.execute(
+                        "INSERT OR IGNORE INTO headlines (source, text, first_seen, last_seen) VALUES (?, ?, ?, ?)",
+                        (source, text, now, now)
+                    )
+                    if cur.rowcount:
+                        added += 1
+                        for term in headline_terms(text):
+                            new_terms[term] = new_terms.get(term, 0) + 1
+                    else:
+                        self._conn.execute(
+                            "UPDATE headlines SET last_seen = ? WHERE source = ? AND text = ?", (now, source, text)
+                        )
+                for term, count in new_terms.items():
+                    self._add_count(term, hour, count)
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"Error recording headlines: {e}")
+        return added
+
+    def headlines_after(self, rowid: int = 0, limit: int = 5000) -> List[Tuple[int, str]]:
+        """
+        rowid より後に保存された見出しのうち新しい limit 件を返す (保存順。注目ワードの背景コーパスに使う)
+        :return: [(rowid, 見出し)]
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT rowid, text FROM headlines WHERE rowid > ? ORDER BY rowid DESC LIMIT ?", (rowid, limit)
+            ).fetchall()
+        return rows[::-1]
+
+    def series(self, term: str, hours: int, now: Optional[float] = None) -> List[int]:
+        """
+        語の直近 hours 時間の1時間ごとの件数 (古い順)
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT last_hour, counts FROM term_counts WHERE term = ?", (term,)).fetchone()
+        if not row:
+            return [0] * hours
+        return self._series(row[0], self._unpack(row[1]), hours, current_hour(now))
+
+    def rising_terms(self, days: int = 7, recent_hours: int = 24, top_n: int = 10,
+                     min_recent: int = 2, now: Optional[float] = None) -> List[Dict]:
+        """
+        直近 recent_hours 時間の件数が、それ以前 (days 日間) の平均より伸びている語を返す
+        :return: [{"term", "recent", "baseline", "ratio", "daily": [日別件数 (古い順)]}]
+        """
+        hours = min(days * 24, self.window_hours)
+        now_hour = current_hour(now)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT term, last_hour, counts FROM term_counts WHERE last_hour > ?", (now_hour - recent_hours,)
+            ).fetchall()
+
+        results = []
+        for term, last_hour, blob in rows:
+            counts = self._series(last_hour, self._unpack(blob), hours, now_hour)
+            recent = sum(counts[-recent_hours:])
+            if recent < min_recent:
+                continue
+            before = counts[:-recent_hours]
+            # 以前の期間を直近と同じ長さに換算した件数
+            baseline = sum(before) * recent_hours / len(before) if before else 0.0
+            ratio = (recent + 1) / (baseline + 1)
+            if ratio <= 1:
+                continue
+            daily = [sum(counts[i:i + 24]) for i in range(len(counts) % 24, len(counts), 24)]
+            results.append({
+                "term": term,
+                "recent": recent,
+                "baseline": round(baseline, 2),
+                "ratio": round(ratio, 2),
+                "daily": daily,
+            })
+        results.sort(key=lambda r: (-r["ratio"], -r["recent"], r["term"]))
+        return results[:top_n]
+
+    def compact(self, now: Optional[float] = None) -> int:
+        """
+        保持期間内に1件も出現していない語の行を削除する
+        :return: 削除した語の数
+        """
+        with self._lock:
+            cur = self._conn.execute(
+                "DELETE FROM term_counts WHERE last_hour <= ?", (current_hour(now) - self.window_hours,)
+            )
+            self._conn.commit()
+            return cur.rowcount
+
+    def _add_count(self, term: str, hour: int, count: int):
+        row = self._conn.execute("SELECT last_hour, counts FROM term_counts WHERE term = ?", (term,)).fetchone()
+        if row:
+            last_hour, counts = row[0], self._unpack(row[1])
+        else:
+            last_hour, counts = hour, array("H", bytes(2 * self.window_hours))
+        if hour > last_hour:
+            # 前回更新してから経過した時間のスロットは古い値なので 0 に戻す
+            for h in range(last_hour + 1, min(hour, last_hour + self.window_hours) + 1):
+                counts[h % self.window_hours] = 0
+            last_hour = hour
+        if hour > last_hour - self.window_hours:
+            slot = hour % self.window_hours
+            counts[slot] = min(counts[slot] + count, 0xFFFF)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO term_counts (term, last_hour, counts) VALUES (?, ?, ?)",
+            (term, last_hour, counts.tobytes())
+        )
+
+    def _series(self, last_hour: int, counts: array, hours: int, now_hour: int) -> List[int]:
+        result = []
+        for hour in range(now_hour - hours + 1, now_hour + 1):
+            # last_hour より後と、保持期間より前のスロットは 0
+            if hour > last_hour or hour <= last_hour - self.window_hours:
+                result.append(0)
+            else:
+                result.append(counts[hour % self.window_hours])
+        return result
+
+    def _unpack(self, blob: bytes) -> array:
+        counts = array("H")
+        counts.frombytes(blob)
+        if len(counts) != self.window_hours:
+            # 保持期間の設定が変わった場合は作り直す (古い件数は捨てる)
+            counts = array("H", bytes(2 * self.window_hours))
+        return counts
+
+_default_archive: Optional[HeadlineArchive] = None
+_default_archive_lock = threading.Lock()
+
+def get_default_archive() -> HeadlineArchive:
+    """
+    プロセス内で共有するデフォルトのアーカイブを返す
+    """
+    global _default_archive
+    with _default_archive_lock:
+        if _default_archive is None:
+            _default_archive = HeadlineArchive()
+        return _default_archive
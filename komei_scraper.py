@@ -1,7 +1,7 @@
 import asyncio
-from playwright.async_api import async_playwright
 from typing import Optional, List
 from datetime import datetime
+from headline_archive import get_default_archive
 
 class KomeiScraper:
     """
@@ -15,6 +15,8 @@ class KomeiScraper:
         """
         公明新聞電子版のトップページから最新の見出しを取得する
         """
+        # Playwright は読み込みが重いため、ブラウザを使うときだけ読み込む
+        from playwright.async_api import async_playwright
         async with async_playwright() as p:
             # クラウド環境向けの引数を追加
             browser = await p.chromium.launch(
@@ -37,6 +39,11 @@ class KomeiScraper:
                     const links = Array.from(document.querySelectorAll('a[href*="/article/"], a[href*="/search/"]'));
                     return links.map(a => a.innerText.trim()).filter(t => t.length > 5).slice(0, 10);
                 }""")
+                # 取得した見出しは時系列集計のためにアーカイブする
+                try:
+                    get_default_archive().record("komei", headlines)
+                except Exception as e:
+                    print(f"Error archiving Komei headlines: {e}")
                 return headlines
             except Exception as e:
                 print(f"Error fetching Komei headlines: {e}")
@@ -48,6 +55,7 @@ class KomeiScraper:
         """
         キーワードで記事を検索し、上位のURLリストを返す
         """
+        from playwright.async_api import async_playwright
         async with async_playwright() as p:
             browser = await p.chromium.launch(
                 headless=True,
@@ -93,6 +101,7 @@ class KomeiScraper:
         """
         ログインして指定されたURLの記事テキストを取得する
         """
+        from playwright.async_api import async_playwright
         async with async_playwright() as p:
             browser = await p.chromium.launch(
                 headless=True,
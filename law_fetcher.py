@@ -1,6 +1,10 @@
 import requests
 from typing import List, Dict, Optional
 import json
+import os
+import time
+
+LAW_TITLES_CACHE = os.path.join("cache", "law_titles.json")
 
 class LawFetcher:
     """
@@ -85,6 +89,53 @@ class LawFetcher:
             print(f"Error searching by keyword: {e}")
             return []
 
+    def fetch_law_titles(self, cache_path: str = LAW_TITLES_CACHE, max_age_days: int = 30, refresh: bool = True) -> List[str]:
+        """
+        現行法令の法令名一覧を取得する (/laws エンドポイントをページングで全件取得)
+        一覧はほとんど変わらないため、ディスクにキャッシュして max_age_days 日ごとに更新する。
+        refresh=False の場合は通信せず、キャッシュにあるものだけを返す。
+        """
+        cached = None
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, "r", encoding="utf-8") as f:
+                    cached = json.load(f)
+            except Exception as e:
+                print(f"Error loading law titles cache: {e}")
+        if cached and (not refresh or time.time() - cached.get("fetched_at", 0) < max_age_days * 86400):
+            return cached.get("titles", [])
+        if not refresh:
+            return []
+
+        endpoint = f"{self.BASE_URL}/laws"
+        headers = {"Accept": "application/json"}
+        titles = []
+        offset, limit = 0, 1000
+        try:
+            while True:
+                response = requests.get(endpoint, params={"limit": limit, "offset": offset}, headers=headers, timeout=30)
+                response.raise_for_status()
+                items = response.json().get("laws", [])
+                titles.extend(item.get("revision_info", {}).get("law_title") for item in items)
+                if len(items) < limit:
+                    break
+                offset += limit
+        except Exception as e:
+            print(f"Error fetching law titles: {e}")
+            # 取得に失敗した場合は古いキャッシュでも使う
+            return cached.get("titles", []) if cached else []
+
+        titles = sorted({t for t in titles if t})
+        try:
+            directory = os.path.dirname(cache_path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            with open(cache_path, "w", encoding="utf-8") as f:
+                json.dump({"fetched_at": time.time(), "titles": titles}, f, ensure_ascii=False)
+        except Exception as e:
+            print(f"Error saving law titles cache: {e}")
+        return titles
+
     def fetch_law_text(self, law_id: str) -> Optional[str]:
         """
         法令IDを指定して本文（抜粋）を取得する (/lawdata/{law_id} エンドポイント)
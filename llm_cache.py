@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+CACHE_DIR = "cache"
+DEFAULT_CACHE_PATH = os.path.join(CACHE_DIR, "llm_cache.sqlite3")
+# メモリ上でヒットしたエントリの最終アクセス時刻は、この件数か秒数がたまるごとにまとめてディスクに書く
+ACCESS_FLUSH_ENTRIES = 64
+ACCESS_FLUSH_SECONDS = 30.0
+
+class LLMCache:
+    """
+    LLMの応答をディスクに永続化するキャッシュ
+    キーは (プロバイダー, モデル, プロンプトのハッシュ, temperature) から生成する。
+    直近のエントリはメモリ上にも保持し、ヒット時はディスクを読まずに返す。
+    メモリ上でのヒットも最終アクセス時刻としてまとめてディスクに反映し、よく使うエントリが
+    再起動後や他のプロセスでの削除 (最終アクセスが古い順) で先に消されないようにする。
+    """
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl_seconds: int = 7 * 24 * 3600,
+                 max_entries: int = 5000, max_bytes: int = 50 * 1024 * 1024, memory_entries: int = 512):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        # ディスクにまだ書いていない、メモリ上でのヒットの最終アクセス時刻
+        self._pending_access: Dict[str, float] = {}
+        self._access_flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache (accessed_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(provider: str, model: str, prompt: str, temperature: float, **options) -> str:
+        """
+        キャッシュキーを生成する (options には response_format などの呼び出し条件を渡す)
+        """
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        material = json.dumps(
+            [provider, model, prompt_hash, round(float(temperature), 3), options],
+            ensure_ascii=False, sort_keys=True
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        キャッシュを参照する。期限切れまたは未登録なら None
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if now - created_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    self._pending_access[key] = now
+                    if (len(self._pending_access) >= ACCESS_FLUSH_ENTRIES
+                            or time.monotonic() - self._access_flushed_at >= ACCESS_FLUSH_SECONDS):
+                        try:
+                            self._flush_access()
+                            self._conn.commit()
+                        except sqlite3.Error as e:
+                            print(f"Error writing LLM cache: {e}")
+                    return value
+                del self._memory[key]
+                self._pending_access.pop(key, None)
+
+            try:
+                row = self._conn.execute(
+                    "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row and now - row[1] <= self.ttl_seconds:
+                    self._conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+                    self._conn.commit()
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    return row[0]
+                if row:
+                    self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"Error reading LLM cache: {e}")
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: str):
+        """
+        応答を保存し、件数・容量の上限を超えた分を古い順に削除する
+        """
+        if value is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, value, len(value.encode("utf-8")), now, now)
+                )
+                # 削除する順番を決める前に、メモリ上でのヒットを反映する
+                self._flush_access()
+                self._evict(now)
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"Error writing LLM cache: {e}")
+
+    def stats(self) -> Dict:
+        """
+        ヒット/ミス回数と保存状況を返す
+        """
+        with self._lock:
+            entries, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+            ).fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "bytes": total_bytes,
+            }
+
+    def clear(self):
+        """
+        キャッシュを全て削除する
+        """
+        with self._lock:
+            self._memory.clear()
+            self._pending_access.clear()
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def _remember(self, key: str, value: str, created_at: float):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def flush(self):
+        """
+        メモリ上でのヒットの最終アクセス時刻をディスクに書く
+        """
+        with self._lock:
+            try:
+                self._flush_access()
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"Error writing LLM cache: {e}")
+
+    def _flush_access(self):
+        self._access_flushed_at = time.monotonic()
+        if not self._pending_access:
+            return
+        pending, self._pending_access = self._pending_access, {}
+        self._conn.executemany(
+            "UPDATE llm_cache SET accessed_at = MAX(accessed_at, ?) WHERE key = ?",
+            [(accessed_at, key) for key, accessed_at in pending.items()]
+        )
+
+    def _evict(self, now: float):
+        # 期限切れを先に掃除し、それでも超過していれば最終アクセスが古い順に削除
+        self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        entries, total_bytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+        ).fetchone()
+        if entries <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+
+        rows = self._conn.execute("SELECT key, size FROM llm_cache ORDER BY accessed_at ASC").fetchall()
+        evicted = []
+        for key, size in rows:
+            if entries <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            evicted.append((key,))
+            entries -= 1
+            total_bytes -= size
+            self._memory.pop(key, None)
+            self._pending_access.pop(key, None)
+        self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", evicted)
+
+_default_cache: Optional[LLMCache] = None
+_default_cache_lock = threading.Lock()
+
+def get_default_cache() -> LLMCache:
+    """
+    プロセス内で共有するデフォルトのキャッシュを返す
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = LLMCache()
+        return _default_cache
+
+if __name__ == "__main__":
+    # 簡易テスト
+    cache = LLMCache(path=os.path.join(CACHE_DIR, "llm_cache_test.sqlite3"), max_entries=3)
+    cache.clear()
+    for i in range(5):
+        cache.set(LLMCache.make_key("openai", "gpt-4o", f"prompt {i}", 0.3), f"answer {i}")
+    start = time.perf_counter()
+    print(cache.get(LLMCache.make_key("openai", "gpt-4o", "prompt 4", 0.3)))
+    print(f"hit in {(time.perf_counter() - start) * 1e6:.1f} µs")
+    print(cache.get(LLMCache.make_key("openai", "gpt-4o", "prompt 0", 0.3)))
+    print(cache.stats())
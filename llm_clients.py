@@ -0,0 +1,33 @@
+import threading
+from typing import Dict, Tuple
+
+# LLM の SDK は読み込みに時間がかかるため、最初にクライアントが必要になった時点で読み込む。
+# クライアントは APIキー (とモデル) ごとにプロセス内で共有し、Streamlit の再実行や
+# ScriptGenerator の作り直しのたびに接続を作り直さないようにする。
+_clients: Dict[Tuple, object] = {}
+_clients_lock = threading.Lock()
+
+def get_openai_client(api_key: str):
+    """
+    APIキーごとに共有する OpenAI クライアントを返す
+    """
+    key = ("openai", api_key)
+    with _clients_lock:
+        if key not in _clients:
+            from openai import OpenAI
+            _clients[key] = OpenAI(api_key=api_key)
+        return _clients[key]
+
+def get_gemini_model(api_key: str, model: str):
+    """
+    APIキーとモデルごとに共有する Gemini の GenerativeModel を返す
+    """
+    import google.generativeai as genai
+
+    key = ("gemini", api_key, model)
+    with _clients_lock:
+        # genai の APIキーはプロセス全体の設定なので、呼び出しごとに設定し直す
+        genai.configure(api_key=api_key)
+        if key not in _clients:
+            _clients[key] = genai.GenerativeModel(model)
+        return _clients[key]
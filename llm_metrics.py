@@ -0,0 +1,156 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+LOG_DIR = "logs"
+DEFAULT_METRICS_PATH = os.path.join(LOG_DIR, "llm_metrics.jsonl")
+
+def new_run_id() -> str:
+    """
+    1回の台本生成 (分析〜生成〜統計提案) をまとめるためのID
+    """
+    return uuid.uuid4().hex[:12]
+
+class MetricsRecorder:
+    """
+    LLM呼び出しごとの所要時間・最初のトークンまでの時間・トークン数・エラーを記録するクラス
+    記録は JSON Lines でファイルに追記し、直近の分はメモリにも保持して集計に使う。
+    """
+    def __init__(self, path: Optional[str] = DEFAULT_METRICS_PATH, memory_events: int = 2000):
+        self.path = path
+        self._events: "deque[Dict]" = deque(maxlen=memory_events)
+        self._lock = threading.Lock()
+
+    def begin(self, operation: str, provider: str, model: str, run_id: Optional[str] = None) -> Tuple[Dict, Callable[..., None]]:
+        """
+        計測を開始し、(記録する dict, 終了を記録する関数) を返す
+        終了の記録は最初の1回だけ行うため、応答待ちの呼び出しを別のスレッドから「打ち切り」として先に閉じられる。
+        """
+        call: Dict = {"ttft": None, "input_tokens": 0, "output_tokens": 0, "cached_tokens": 0, "status": "ok"}
+        started = time.perf_counter()
+        finished = threading.Event()
+        finish_lock = threading.Lock()
+
+        def finish(status: Optional[str] = None, error: Optional[str] = None):
+            with finish_lock:
+                if finished.is_set():
+                    return
+                finished.set()
+            if status:
+                call["status"] = status
+            if error:
+                call["error"] = error
+            self.record(dict(
+                call,
+                ts=datetime.now().isoformat(timespec="seconds"),
+                run_id=run_id,
+                operation=operation,
+                provider=provider,
+                model=model,
+                wall=round(time.perf_counter() - started, 4),
+            ))
+
+        return call, finish
+
+    @contextmanager
+    def track(self, operation: str, provider: str, model: str, run_id: Optional[str] = None) -> Iterator[Dict]:
+        """
+        with ブロック内の1回の呼び出しを計測する。
+        ブロック内で返される dict に ttft や input_tokens などを書き込むと、一緒に記録される。
+        """
+        call, finish = self.begin(operation, provider, model, run_id=run_id)
+        try:
+            yield call
+        except GeneratorExit:
+            # ヘッジで負けたストリームなどが途中で打ち切られた場合
+            finish("cancelled")
+            raise
+        except Exception as e:
+            finish("error", f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            finish()
+
+    def record(self, event: Dict):
+        """
+        1件の記録を追加する
+        """
+        with self._lock:
+            self._events.append(event)
+            if not self.path:
+                return
+            try:
+                directory = os.path.dirname(self.path)
+                if directory and not os.path.exists(directory):
+                    os.makedirs(directory)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(event, ensure_ascii=False) + "\n")
+            except Exception as e:
+                print(f"Error writing LLM metrics: {e}")
+
+    def events(self, run_id: Optional[str] = None) -> List[Dict]:
+        with self._lock:
+            return [e for e in self._events if run_id is None or e.get("run_id") == run_id]
+
+    def summary(self, run_id: str) -> Dict[str, Dict]:
+        """
+        指定した実行の記録を処理 (operation) ごとに集計する
+        """
+        result: Dict[str, Dict] = {}
+        for e in self.events(run_id):
+            s = result.setdefault(e["operation"], {
+                "calls": 0, "errors": 0, "cache_hits": 0, "wall": 0.0, "ttft": None,
+                "input_tokens": 0, "output_tokens": 0, "cached_tokens": 0, "providers": [],
+            })
+            s["calls"] += 1
+            s["errors"] += e["status"] == "error"
+            s["cache_hits"] += e["status"] == "cache_hit"
+            s["wall"] += e.get("wall") or 0.0
+            if e.get("ttft") is not None and e["status"] == "ok":
+                s["ttft"] = e["ttft"] if s["ttft"] is None else min(s["ttft"], e["ttft"])
+            for k in ("input_tokens", "output_tokens", "cached_tokens"):
+                s[k] += e.get(k) or 0
+            if e["provider"] not in s["providers"]:
+                s["providers"].append(e["provider"])
+        return result
+
+_default_recorder: Optional[MetricsRecorder] = None
+_default_recorder_lock = threading.Lock()
+
+def get_default_recorder() -> MetricsRecorder:
+    """
+    プロセス内で共有するデフォルトの記録先を返す
+    """
+    global _default_recorder
+    with _default_recorder_lock:
+        if _default_recorder is None:
+            _default_recorder = MetricsRecorder()
+        return _default_recorder
+
+def format_metrics_summary(summary: Dict[str, Dict]) -> str:
+    """
+    summary() の結果を Markdown の表にする
+    """
+    lines = [
+        "| 処理 | 呼び出し | 所要時間 | 最初のトークン | 入力 (キャッシュ) | 出力 | エラー |",
+        "|---|---|---|---|---|---|---|",
+    ]
+    total_wall = total_in = total_out = 0
+    for op, s in summary.items():
+        calls = f"{s['calls']}" + (f" (キャッシュ {s['cache_hits']})" if s["cache_hits"] else "")
+        ttft = f"{s['ttft']:.1f}秒" if s["ttft"] is not None else "-"
+        lines.append(
+            f"| {op} | {calls} | {s['wall']:.1f}秒 | {ttft} | "
+            f"{s['input_tokens']:,} ({s['cached_tokens']:,}) | {s['output_tokens']:,} | {s['errors']} |"
+        )
+        total_wall += s["wall"]
+        total_in += s["input_tokens"]
+        total_out += s["output_tokens"]
+    lines.append(f"| 合計 | | {total_wall:.1f}秒 | | {total_in:,} | {total_out:,} | |")
+    return "\n".join(lines)
@@ -1,7 +1,42 @@
 import feedparser
 import datetime
+import threading
+import time
 import urllib.parse
-from typing import List, Dict
+from typing import List, Dict, Optional
+from headline_archive import get_default_archive
+
+class FeedCache:
+    """
+    取得したRSSフィードをメモリ上に一定時間保持するクラス
+    複数のトピックを続けて (または並行して) 処理する場合に、同じフィードを何度も取得しないよう共有する。
+    同じURLを同時に要求された場合は、最初の取得が終わるのを待ってその結果を使う。
+    """
+    def __init__(self, ttl_seconds: int = 600):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._url_locks: Dict[str, threading.Lock] = {}
+        self._feeds: Dict[str, tuple] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def parse(self, url: str):
+        with self._lock:
+            url_lock = self._url_locks.setdefault(url, threading.Lock())
+        with url_lock:
+            # URL ごとのロックでは別の URL を処理中のスレッドと競合するため、共有の件数とフィードは self._lock で扱う
+            with self._lock:
+                entry = self._feeds.get(url)
+                if entry and time.time() - entry[0] < self.ttl_seconds:
+                    self.hits += 1
+                    return entry[1]
+                self.misses += 1
+            feed = feedparser.parse(url)
+            # 取得に失敗したフィード (記事が無く bozo) は保持しない
+            if feed.entries or not getattr(feed, "bozo", False):
+                with self._lock:
+                    self._feeds[url] = (time.time(), feed)
+            return feed
 
 class NewsFetcher:
     """
@@ -16,6 +51,17 @@ class NewsFetcher:
         "朝日新聞(政治)": "https://www.asahi.com/rss/politics/index.xml"
     }
 
+    def __init__(self, feed_cache: Optional[FeedCache] = None):
+        """
+        :param feed_cache: 指定した場合は取得済みのフィードを共有する (バッチ生成用)
+        """
+        self.feed_cache = feed_cache
+
+    def _parse(self, url: str):
+        if self.feed_cache is not None:
+            return self.feed_cache.parse(url)
+        return feedparser.parse(url)
+
     def get_trending_headlines(self) -> List[str]:
         """
         全ソースから最新の見出しを取得する (Google News Top Storiesを含む)
@@ -24,7 +70,7 @@ class NewsFetcher:
         
         # 1. Google News Top Stories (Japan)
         try:
-            feed = feedparser.parse("https://news.google.com/rss?hl=ja&gl=JP&ceid=JP:ja")
+            feed = self._parse("https://news.google.com/rss?hl=ja&gl=JP&ceid=JP:ja")
             for entry in feed.entries[:10]:
                 headlines.append(entry.get("title", ""))
         except Exception as e:
@@ -33,11 +79,17 @@ class NewsFetcher:
         # 2. 既存の特定メディアRSS
         for source_name, url in self.SOURCES.items():
             try:
-                feed = feedparser.parse(url)
+                feed = self._parse(url)
                 for entry in feed.entries[:3]:
                     headlines.append(entry.get("title", ""))
             except Exception as e:
                 print(f"Error fetching headlines from {source_name}: {e}")
+
+        # 取得した見出しは時系列集計のためにアーカイブする
+        try:
+            get_default_archive().record("general", headlines)
+        except Exception as e:
+            print(f"Error archiving headlines: {e}")
         return headlines
 
     def fetch_all_news(self, keyword: str = "", days: int = 7) -> List[Dict]:
@@ -57,7 +109,7 @@ class NewsFetcher:
                 encoded_query = urllib.parse.quote(google_query)
                 google_url = f"https://news.google.com/rss/search?q={encoded_query}&hl=ja&gl=JP&ceid=JP:ja"
                 print(f"Searching Google News for: {google_query} (encoded: {encoded_query})")
-                feed = feedparser.parse(google_url)
+                feed = self._parse(google_url)
                 
                 for entry in feed.entries:
                     published = entry.get("published_parsed")
@@ -90,7 +142,7 @@ class NewsFetcher:
         for news_source_name, url in self.SOURCES.items():
             try:
                 print(f"Fetching news from {news_source_name}...")
-                feed = feedparser.parse(url)
+                feed = self._parse(url)
                 
                 for entry in feed.entries:
                     published = entry.get("published_parsed") or entry.get("updated_parsed")
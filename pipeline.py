@@ -0,0 +1,431 @@
+import asyncio
+import datetime
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+
+from diet_minutes_api import DietMinutesAPI
+from news_fetcher import NewsFetcher
+from komei_scraper import KomeiScraper
+from law_fetcher import LawFetcher
+from subsidy_fetcher import SubsidyFetcher
+from script_generator import ScriptGenerator
+from provider_router import RateLimiter
+from context_builder import ContextBuilder, format_context_report
+from llm_metrics import get_default_recorder
+from query_analyzer import MAX_PERIOD_DAYS
+from research_cache import (
+    DEFAULT_TTL_HOURS, MAX_SPEECHES, find_recent_research, get_research_cache, merge_news, merge_speeches, research_info
+)
+
+# on_progress に渡される level
+# "info": 通常の進捗 / "success": 成功 / "error": 失敗 / "note": 補足 / "caption": 詳細
+# "progress": 同じ行を上書きして表示する途中経過
+ProgressCallback = Callable[[str, str], None]
+
+def _noop_progress(message: str, level: str = "info"):
+    pass
+
+class ScriptPipeline:
+    """
+    収集 → 解析 → 台本生成 → スライド作成 の一連の流れを UI から切り離して実行するクラス
+    Streamlit には依存しないため、CLI・バッチ・ベンチマークからも同じ処理を呼び出せる。
+    進捗は on_progress(メッセージ, level) で、生成中のテキストは on_token(断片) で通知する。
+    """
+    def __init__(self, provider: str, api_key: str, model: str,
+                 use_komei: bool = True, use_diet: bool = True, use_news: bool = True,
+                 use_law: bool = True, use_stats: bool = True, use_subsidy: bool = True,
+                 komei_user: Optional[str] = None, komei_pass: Optional[str] = None, komei_article_url: Optional[str] = None,
+                 context_budget: int = 12000, summary_model: Optional[str] = None,
+                 retrieval_top_k: Optional[int] = None, embedder=None,
+                 make_generator: Optional[Callable[..., ScriptGenerator]] = None,
+                 news_fetcher: Optional[NewsFetcher] = None, rate_limiter: Optional[RateLimiter] = None,
+                 force_refresh: bool = False, research_ttl_hours: float = DEFAULT_TTL_HOURS):
+        """
+        :param make_generator: (provider, api_key, model, **kwargs) から ScriptGenerator を作る関数
+                               (フェイルオーバー設定などを反映したい場合に指定する)
+        :param news_fetcher: 複数のパイプラインでフィードを共有する場合に指定する
+        :param rate_limiter: 複数のパイプラインでLLMの呼び出し枠を共有する場合に指定する
+        :param force_refresh: 直近の調査結果を再利用せず、すべてのソースを取り直す
+        :param research_ttl_hours: 調査結果を再利用する期限 (前回すべてを取り直してからの時間。0 なら再利用しない)
+        """
+        self.provider = provider
+        self.api_key = api_key
+        self.model = model
+        self.use_komei = use_komei
+        self.use_diet = use_diet
+        self.use_news = use_news
+        self.use_law = use_law
+        self.use_stats = use_stats
+        self.use_subsidy = use_subsidy
+        self.komei_user = komei_user
+        self.komei_pass = komei_pass
+        self.komei_article_url = komei_article_url
+        self.context_budget = context_budget
+        self.summary_model = summary_model
+        self.retrieval_top_k = retrieval_top_k
+        self.embedder = embedder
+        self.make_generator = make_generator or ScriptGenerator
+        self.news_fetcher = news_fetcher
+        self.rate_limiter = rate_limiter
+        self.force_refresh = force_refresh
+        self.research_ttl_hours = research_ttl_hours
+
+    def run(self, topic: str, start_date: Optional[datetime.date] = None, end_date: Optional[datetime.date] = None,
+            on_progress: Optional[ProgressCallback] = None, on_token: Optional[Callable[[str], None]] = None,
+            consume_stream: Optional[Callable[[Iterator[str]], str]] = None, slides_title: Optional[str] = None) -> Dict:
+        """
+        トピックから台本を生成し、結果をまとめた dict を返す
+        :param start_date: 期間の開始日。指定しない場合は入力文から推測した日数 (無ければ直近7日)
+        :param consume_stream: 生成ストリームを受け取って全文を返す関数 (例: st.write_stream)。
+                               指定しない場合は on_token に断片を渡しながら結合する
+        :param slides_title: 指定した場合は PowerPoint も作成する (result["slides_pptx"] にファイルの中身を入れる)
+        """
+        progress = on_progress or _noop_progress
+        started = time.perf_counter()
+        generator = self.make_generator(self.provider, self.api_key, self.model, **self._limiter_options())
+
+        # --- 0. リクエストの解析 ---
+        query_info = generator.analyze_query(topic)
+        analyzed_by = "ルール解析" if query_info.get("analyzer") == "rule" else "AI解析"
+        progress(f"🔍 検索キーワードを抽出しました ({analyzed_by}): `{', '.join(query_info['keywords'])}`", "info")
+        start_date, end_date = self._resolve_period(query_info, start_date, end_date, progress)
+
+        sources = self.collect(topic, query_info, start_date, end_date, progress)
+        result = self.generate(
+            topic, query_info, sources, progress,
+            on_token=on_token, consume_stream=consume_stream, run_id=generator.run_id
+        )
+        result.update({
+            "topic": topic,
+            "query_info": query_info,
+            "start_date": start_date.isoformat(),
+            "end_date": end_date.isoformat(),
+        })
+
+        if slides_title and result["slides_data"]:
+            from slide_generator import SlideGenerator
+            progress("📊 スライドを作成中...", "info")
+            result["slides_pptx"] = SlideGenerator().render(slides_title, result["slides_data"])
+
+        result["elapsed"] = time.perf_counter() - started
+        return result
+
+    def collect(self, topic: str, query_info: Dict, start_date: datetime.date, end_date: datetime.date,
+                on_progress: Optional[ProgressCallback] = None) -> Dict:
+        """
+        各ソースから情報を収集する
+        同じキーワードで直近に集めた結果 (research_cache) があればそれを使い、期間に依存するソースは
+        前回以降の差分だけを取得する (force_refresh の場合はすべて取り直す)。
+        :return: {"news_list", "speeches", "law_data", "subsidy_data", "stats_summaries", "research"}
+        """
+        progress = on_progress or _noop_progress
+        keywords = query_info["keywords"] or [topic]
+        search_keywords = ", ".join(query_info["keywords"])
+        news_list: List[Dict] = []
+        speeches: List[Dict] = []
+        # 次回の再利用のために保存するソース (種類ごと)
+        collected: Dict[str, List[Dict]] = {}
+
+        warm = None
+        if not self.force_refresh and self.research_ttl_hours:
+            warm = find_recent_research(keywords, start_date, end_date, self.research_ttl_hours)
+        cached = warm["sources"] if warm else {}
+        if warm:
+            origin = "キャッシュ" if warm["origin"] == "cache" else f"保存済みプロジェクト {warm['origin']}"
+            fetched_at = warm["info"]["fetched_at"].replace("T", " ")[5:16]
+            progress(f"♻️ {fetched_at} に取得した調査結果 ({origin}) を再利用し、それ以降の分だけを取得します", "note")
+            previous_end = datetime.date.fromisoformat(warm["info"]["end_date"])
+
+        # --- 1. 国会議事録の取得 ---
+        if self.use_diet:
+            diet_start = end_date - datetime.timedelta(days=365)
+            if "speeches" in cached:
+                progress(f"🏛️ 国会議事録: 前回の{len(cached['speeches'])}件に加え、{previous_end} 〜 {end_date} の発言を検索中...", "info")
+                new_speeches = self._fetch_speeches(search_keywords, previous_end, end_date)
+                speeches = merge_speeches(cached["speeches"], new_speeches, diet_start)
+                progress(f"✅ 議事録: {len(speeches)}件 (差分の検索で{len(new_speeches)}件取得)", "info")
+            else:
+                progress(f"🏛️ 国会議事録を検索中 (背景調査のため 1年前まで遡ります: {diet_start} 〜 {end_date})...", "info")
+                speeches = self._fetch_speeches(search_keywords, diet_start, end_date)
+                progress(f"✅ 議事録: {len(speeches)}件取得", "info")
+            collected["speeches"] = speeches
+        else:
+            progress("⏩ 国会議事録をスキップ", "info")
+
+        # --- 2. ニュースRSSの取得 ---
+        main_kw = query_info["keywords"][0] if query_info["keywords"] else topic
+        if self.use_news:
+            fetcher = self.news_fetcher or NewsFetcher()
+            # キーワードの組み合わせが同じでも語順が違えば検索した語が違うので、前回のニュースは使わない
+            if "news" in cached and warm["info"].get("news_keyword") == main_kw:
+                progress("主要メディアのRSSから前回以降のニュースを検索中...", "info")
+                new_news = fetcher.fetch_all_news(keyword=main_kw, days=(end_date - previous_end).days)
+                news_list = merge_news(cached["news"], new_news, start_date)
+                progress(f"✅ ニュース: {len(news_list)}件 (前回 {len(cached['news'])}件、今回 {len(new_news)}件取得。キーワード: {main_kw})", "info")
+            else:
+                progress("主要メディアのRSSを検索中...", "info")
+                news_list = fetcher.fetch_all_news(keyword=main_kw, days=(end_date - start_date).days)
+                progress(f"✅ ニュース: {len(news_list)}件取得 (キーワード: {main_kw})", "info")
+            collected["news"] = list(news_list)
+        else:
+            progress("⏩ その他ニュースをスキップ", "info")
+
+        # --- 3. 公明新聞スクレイピング ---
+        if self.use_komei and self.komei_user and self.komei_pass:
+            # 記事URLを指定した場合は検索結果ではないので、再利用も保存もしない
+            if "komei" in cached and not self.komei_article_url:
+                komei_articles = cached["komei"]
+                progress(f"♻️ 公明新聞: 前回の{len(komei_articles)}件を再利用", "info")
+            else:
+                komei_articles = self._collect_komei(topic, query_info, progress)
+            if not self.komei_article_url:
+                collected["komei"] = komei_articles
+            news_list.extend(komei_articles)
+        else:
+            progress("⏩ 公明新聞をスキップ", "info")
+
+        # --- 4. 法令情報の取得 ---
+        law_data = []
+        if self.use_law:
+            if "law_data" in cached:
+                law_data = cached["law_data"]
+                progress(f"♻️ 法令: 前回の{len(law_data)}件を再利用", "info")
+            else:
+                law_data = self._collect_laws(query_info, progress)
+            collected["law_data"] = law_data
+
+        # --- 5. 統計情報 (Deep Dive用に温存し、初期はキーワード提案のみ) ---
+        progress("統計データ分析の準備をしています...", "info")
+
+        # --- 5.5 補助金情報の取得 ---
+        subsidy_data = []
+        if self.use_subsidy:
+            if "subsidy_data" in cached:
+                subsidy_data = cached["subsidy_data"]
+                progress(f"♻️ 補助金: 前回の{len(subsidy_data)}件を再利用", "info")
+            else:
+                subsidy_data = self._collect_subsidies(topic, query_info, progress)
+            collected["subsidy_data"] = subsidy_data
+
+        # 再利用した場合も、TTL は前回すべてを取り直した時刻から数える
+        research = research_info(
+            keywords, start_date, end_date, list(collected),
+            full_fetched_at=datetime.datetime.fromisoformat(warm["info"]["full_fetched_at"]).timestamp() if warm else None,
+            reused_from=warm["origin"] if warm else None,
+            news_keyword=main_kw if "news" in collected else None
+        )
+        if collected:
+            get_research_cache().put(research, collected)
+
+        return {
+            "news_list": news_list,
+            "speeches": speeches,
+            "law_data": law_data,
+            "subsidy_data": subsidy_data,
+            "stats_summaries": [],
+            "research": research,
+        }
+
+    def generate(self, topic: str, query_info: Dict, sources: Dict, on_progress: Optional[ProgressCallback] = None,
+                 on_token: Optional[Callable[[str], None]] = None, consume_stream: Optional[Callable[[Iterator[str]], str]] = None,
+                 run_id: Optional[str] = None) -> Dict:
+        """
+        収集したソースから台本を生成する (絞り込み・事前要約・統計指標の提案を含む)
+        """
+        progress = on_progress or _noop_progress
+        progress(f"AI ({self.model}) が台本を執筆中...", "info")
+        generator = self.make_generator(
+            self.provider, self.api_key, self.model,
+            context_builder=ContextBuilder(total_budget=self.context_budget, model=self.model),
+            run_id=run_id,
+            summary_model=self.summary_model,
+            retrieval_top_k=self.retrieval_top_k,
+            embedder=self.embedder,
+            **self._limiter_options()
+        )
+        keywords = query_info["keywords"]
+
+        # トピックに近いチャンクだけに絞り込む
+        prompt_news, prompt_speeches, prompt_laws = generator.retrieve_sources(
+            topic, sources["news_list"], sources["speeches"], sources["law_data"], keywords=keywords
+        )
+        retrieval_report = generator.last_retrieval_report
+        if retrieval_report:
+            progress(
+                f"🔎 埋め込み検索: {retrieval_report['items_before']}件 ({retrieval_report['chunks']}チャンク) から "
+                f"{retrieval_report['selected']}チャンクを採用 ({retrieval_report['elapsed']:.1f}秒)", "info"
+            )
+        # ソースが多い場合は安価なモデルで先に要約し、要約を台本生成に渡す
+        prompt_news, prompt_speeches = generator.summarize_sources(
+            topic, prompt_news, prompt_speeches,
+            progress=lambda done, total: progress(f"🧩 ソースを事前要約中... ({done}/{total})", "progress")
+        )
+        summary_report = generator.last_summary_report
+        if summary_report:
+            progress(
+                f"🧩 事前要約 ({summary_report['model']}): {summary_report['items_before']}件 → {summary_report['items_after']}件、"
+                f"{summary_report['tokens_before']:,} → {summary_report['tokens_after']:,} トークン ({summary_report['elapsed']:.1f}秒)", "progress"
+            )
+
+        script_stream = generator.generate_stream(
+            topic, prompt_news, prompt_speeches, prompt_laws,
+            sources["stats_summaries"], sources["subsidy_data"], keywords=keywords, prepared=True
+        )
+        context_report = generator.last_context_report
+        progress(f"📦 プロンプトのソース: {format_context_report(context_report)}", "info")
+        if context_report["dropped"]:
+            dropped_labels = [d["label"] for d in context_report["dropped"][:5] if d["label"]]
+            progress(f"予算超過で除外: {len(context_report['dropped'])}件 (例: {' / '.join(dropped_labels)})", "caption")
+
+        # 届いた断片から順に通知し、完了後にまとめてJSONを抽出する
+        if consume_stream is not None:
+            generated_text = consume_stream(script_stream)
+        else:
+            parts = []
+            for chunk in script_stream:
+                parts.append(chunk)
+                if on_token:
+                    on_token(chunk)
+            generated_text = "".join(parts)
+        if generator.last_provider and generator.last_provider != self.provider.lower():
+            progress(f"🛟 予備プロバイダー ({generator.last_provider}) の応答を採用しました", "note")
+        slides_data = generator.extract_json_from_response(generated_text)
+
+        # --- 7. 統計インサイトの提案 ---
+        suggested_indicators = []
+        if self.use_stats:
+            progress("📊 統計インサイトを分析中...", "info")
+            suggested_indicators = generator.suggest_indicators(generated_text)
+
+        return dict(
+            sources,
+            script=generated_text,
+            slides_data=slides_data,
+            suggested_indicators=suggested_indicators,
+            usage=generator.last_usage,
+            provider_used=generator.last_provider or self.provider.lower(),
+            context_report=context_report,
+            retrieval_report=retrieval_report,
+            summary_report=summary_report,
+            run_id=generator.run_id,
+            metrics=get_default_recorder().summary(generator.run_id),
+        )
+
+    def _limiter_options(self) -> Dict:
+        # 制限を指定しない場合は make_generator に余計な引数を渡さない
+        return {"rate_limiter": self.rate_limiter} if self.rate_limiter is not None else {}
+
+    @staticmethod
+    def _fetch_speeches(search_keywords: str, from_date: datetime.date, until_date: datetime.date) -> List[Dict]:
+        return DietMinutesAPI().fetch_speeches(
+            any_keyword=search_keywords,
+            from_date=from_date.strftime("%Y-%m-%d"),
+            until_date=until_date.strftime("%Y-%m-%d"),
+            maximum_records=MAX_SPEECHES
+        )
+
+    @staticmethod
+    def _resolve_period(query_info: Dict, start_date: Optional[datetime.date], end_date: Optional[datetime.date],
+                        progress: ProgressCallback):
+        today = datetime.date.today()
+        if start_date is not None:
+            end_date = end_date or today
+            progress(f"📅 ユーザー指定の期間を適用します: {start_date} 〜 {end_date}", "info")
+        elif query_info.get("days"):
+            # LLM の解析結果も含め、極端な日数は上限で打ち切る (日付の範囲を超えないように)
+            days = min(int(query_info["days"]), MAX_PERIOD_DAYS)
+            end_date = today
+            start_date = end_date - datetime.timedelta(days=days)
+            progress(f"📅 文章から期間を推測しました: {start_date} 〜 {end_date} ({days}日間)", "info")
+        else:
+            end_date = end_date or today
+            start_date = end_date - datetime.timedelta(days=7)
+        return start_date, end_date
+
+    def _collect_komei(self, topic: str, query_info: Dict, progress: ProgressCallback) -> List[Dict]:
+        scraper = KomeiScraper()
+        articles = []
+        target_urls = []
+        if self.komei_article_url:
+            target_urls = [self.komei_article_url]
+        else:
+            progress("---", "info")
+            k_keywords = query_info.get("keywords", [topic])
+            progress(f"🔍 公明新聞を検索中 (キーワード候補: {', '.join(k_keywords)})...", "info")
+            for kw in k_keywords:
+                f_urls = asyncio.run(scraper.search_articles(kw))
+                if f_urls:
+                    target_urls.extend(f_urls)
+                    progress(f"✅ 公明新聞: 「{kw}」で記事が見つかりました", "info")
+                    break
+        if target_urls:
+            target_urls = list(dict.fromkeys(target_urls))[:3]
+            for idx, url in enumerate(target_urls):
+                progress(f"📄 公明新聞記事の内容を抽出中 ({idx+1}/{len(target_urls)})...", "info")
+                komei_text = asyncio.run(scraper.fetch_article_text(self.komei_user, self.komei_pass, url))
+                if komei_text:
+                    articles.append({
+                        "source": "公明新聞",
+                        "title": f"公明新聞 関連記事 {idx+1}",
+                        "summary": komei_text[:1000] + "...",
+                        "link": url,
+                        "published": datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+                    })
+                    progress("✅ 公明新聞: 成功", "success")
+                else:
+                    progress("❌ 公明新聞: 失敗", "error")
+        elif not self.komei_article_url:
+            progress("ℹ️ 公明新聞: 関連記事なし", "note")
+        return articles
+
+    @staticmethod
+    def _collect_laws(query_info: Dict, progress: ProgressCallback) -> List[Dict]:
+        progress("e-Gov法令APIを検索中...", "info")
+        law_fetcher = LawFetcher()
+        l_keywords = query_info.get("law_keywords", query_info["keywords"])
+        unique_laws = []
+        seen_ids = set()
+
+        # 1. まずは「キーワード検索」を優先（全文検索・抜粋取得）
+        for kw in l_keywords:
+            progress(f"🔍 法令(全文検索): 「{kw}」で検索試行中...", "info")
+            for r in law_fetcher.search_by_keyword(kw):
+                if r['id'] not in seen_ids:
+                    unique_laws.append(r)
+                    seen_ids.add(r['id'])
+            if len(unique_laws) >= 3: break # 全文検索は重いので少なめに
+
+        # 2. 次に「名称検索」（見つからなかった場合の補完）
+        if len(unique_laws) < 5:
+            for kw in l_keywords:
+                progress(f"🔍 法令(名称検索): 「{kw}」で検索試行中...", "info")
+                for r in law_fetcher.search_laws(kw):
+                    if r['id'] not in seen_ids:
+                        unique_laws.append(r)
+                        seen_ids.add(r['id'])
+                if len(unique_laws) >= 5: break
+
+        law_data = unique_laws[:5]
+        progress(f"✅ 法令: {len(law_data)}件特定 (うち抜粋あり: {len([l for l in law_data if l.get('snippets')])}件)", "info")
+        return law_data
+
+    @staticmethod
+    def _collect_subsidies(topic: str, query_info: Dict, progress: ProgressCallback) -> List[Dict]:
+        progress("jGrantsで補助金を検索中...", "info")
+        subsidy_fetcher = SubsidyFetcher()
+        # 法令用キーワード (正式名称に近い語) を優先して使う
+        s_keywords = query_info.get("law_keywords", query_info.get("keywords", [topic]))
+        subsidy_data = []
+        seen_s_ids = set()
+        for kw in s_keywords:
+            progress(f"🔍 補助金: 「{kw}」で検索試行中...", "info")
+            # IDベースで重複排除
+            for s in subsidy_fetcher.search_subsidies(kw):
+                if s['id'] not in seen_s_ids:
+                    subsidy_data.append(s)
+                    seen_s_ids.add(s['id'])
+            if len(subsidy_data) >= 3: break
+
+        subsidy_data = subsidy_data[:3]
+        progress(f"✅ 補助金: {len(subsidy_data)}件特定", "info")
+        return subsidy_data
@@ -0,0 +1,300 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from project_store import is_project_file, read_packed, source_refs
+
+CACHE_DIR = "cache"
+DEFAULT_PROJECTS_DIR = "projects"
+DEFAULT_INDEX_PATH = os.path.join(CACHE_DIR, "project_index.sqlite3")
+
+# 索引の形式 (上がったら既存の索引を作り直す)
+INDEX_VERSION = 5
+# ディレクトリの更新時刻が変わらなくても、この秒数ごとに各ファイルの更新時刻・サイズを確かめる
+# (ファイルをその場で書き換えてもディレクトリの更新時刻は変わらないため)
+RESCAN_INTERVAL_SECONDS = 30
+# trigram の全文検索で引ける最短の語の長さ (これより短い語は部分一致で絞り込む)
+MIN_MATCH_LENGTH = 3
+
+# 一覧に表示する項目 (本文・ソースは含めない)
+META_COLUMNS = ["filename", "topic", "timestamp", "provider", "model", "news_count", "speech_count", "revision_count"]
+# 一覧には出さず、直近の調査結果を探すために持つ項目
+RESEARCH_COLUMNS = ["research_key", "research_fetched_at"]
+
+def _phrase(term: str) -> str:
+    # FTS5 のフレーズ (" は2つ重ねてエスケープ)
+    return '"' + term.replace('"', '""') + '"'
+
+def project_meta(filename: str, data: Dict) -> Dict:
+    """
+    プロジェクトの中身から一覧用のメタデータを作る
+    """
+    return {
+        "filename": filename,
+        "topic": data.get("topic", ""),
+        "timestamp": data.get("timestamp", ""),
+        "provider": data.get("provider", ""),
+        "model": data.get("model", ""),
+        # 圧縮形式ではニュース・議事録は参照 (ハッシュ) の一覧になっている
+        "news_count": len(data.get("news_list") or data.get("news_refs") or []),
+        "speech_count": len(data.get("diet_speeches") or data.get("speech_refs") or []),
+        # 改訂履歴の無い旧形式は1版として数える
+        "revision_count": len(data.get("revisions") or []) or 1,
+        # 調査の情報 (research_cache) はキーワードと、すべてを取り直した時刻だけを持つ
+        "research_key": (data.get("research") or {}).get("key"),
+        "research_fetched_at": (data.get("research") or {}).get("full_fetched_at"),
+    }
+
+class ProjectIndex:
+    """
+    保存済みプロジェクトのメタデータ (トピック・日時・モデルなど) を SQLite に保持するクラス
+    一覧の表示では索引だけを読み、プロジェクトのファイルは開かない。
+    保存・削除のときに更新するほか、ディレクトリの更新時刻が変わったとき (と一定時間ごと) に一覧を返す前に
+    ファイル名・更新時刻・サイズと突き合わせ、アプリの外で追加・書き換え・削除されたファイルだけを読み直す。
+    トピックと台本は全文検索用のテーブル (SQLite の FTS5 trigram。使えなければ通常のテーブル) にも入れる。
+    """
+    def __init__(self, projects_dir: str = DEFAULT_PROJECTS_DIR, path: str = DEFAULT_INDEX_PATH):
+        self.projects_dir = projects_dir
+        self.path = path
+        self._lock = threading.Lock()
+        self._synced_dir_mtime: Optional[int] = None
+        self._synced_at = 0.0
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        # 以前の形式の索引は捨て、次の sync でファイルから作り直す
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] < INDEX_VERSION:
+            for table in ("project_text_vocab", "project_text", "project_sources", "projects"):
+                self._conn.execute(f"DROP TABLE IF EXISTS {table}")
+            self._conn.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS projects ("
+            " filename TEXT PRIMARY KEY, topic TEXT NOT NULL, timestamp TEXT NOT NULL,"
+            " provider TEXT, model TEXT, news_count INTEGER, speech_count INTEGER, revision_count INTEGER,"
+            " research_key TEXT, research_fetched_at TEXT, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_projects_timestamp ON projects (timestamp)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_projects_research ON projects (research_key, research_fetched_at)")
+        # プロジェクトが参照しているソースのブロブ (削除時に不要になったブロブを消すため)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS project_sources (filename TEXT NOT NULL, blob TEXT NOT NULL,"
+            " PRIMARY KEY (filename, blob))"
+        )
+        # 日本語は単語に区切らずに検索できるよう trigram で索引を作る
+        try:
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS project_text USING fts5("
+                "filename UNINDEXED, topic, script, tokenize='trigram')"
+            )
+        except sqlite3.OperationalError:
+            # FTS5 / trigram が無い SQLite では部分一致で検索する
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS project_text (filename TEXT PRIMARY KEY, topic TEXT, script TEXT)"
+            )
+        sql = self._conn.execute("SELECT sql FROM sqlite_master WHERE name = 'project_text'").fetchone()[0]
+        self.full_text = "fts5" in sql.lower()
+        if self.full_text:
+            # 索引に含まれる trigram の一覧 (3文字未満の語を trigram に展開するため)
+            self._conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS project_text_vocab USING fts5vocab(project_text, 'row')")
+        self._conn.commit()
+
+    def add(self, filename: str, data: Dict):
+        """
+        保存したプロジェクトを索引に加える (同じファイル名なら置き換える)
+        :param data: ファイルに書いた内容 (圧縮形式ならソースは参照のまま)
+        """
+        filepath = os.path.join(self.projects_dir, filename)
+        try:
+            stat = os.stat(filepath)
+        except OSError as e:
+            print(f"Error indexing {filename}: {e}")
+            return
+        with self._lock:
+            self._upsert(filename, data, stat)
+            self._conn.commit()
+
+    def remove(self, filename: str):
+        with self._lock:
+            self._delete(filename)
+            self._conn.commit()
+
+    def referenced_blobs(self) -> Set[str]:
+        """
+        いずれかのプロジェクトが参照しているブロブのハッシュ
+        """
+        self.sync()
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT DISTINCT blob FROM project_sources")}
+
+    def list(self) -> List[Dict]:
+        """
+        メタデータの一覧 (新しい順)
+        """
+        self.sync()
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(META_COLUMNS)} FROM projects ORDER BY timestamp DESC, filename DESC"
+            ).fetchall()
+        return [dict(zip(META_COLUMNS, row)) for row in rows]
+
+    def find_research(self, key: str, fetched_after: str, limit: int = 5) -> List[str]:
+        """
+        同じキーワードで fetched_after 以降に調査したプロジェクトのファイル名 (新しい順)
+        """
+        self.sync()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT filename FROM projects WHERE research_key = ? AND research_fetched_at >= ?"
+                " ORDER BY research_fetched_at DESC, filename DESC LIMIT ?",
+                (key, fetched_after, limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def search(self, query: str = "", limit: int = 20, offset: int = 0) -> Tuple[List[Dict], int]:
+        """
+        トピック・台本に query のすべての語 (空白区切り) を含むプロジェクトを新しい順に返す
+        :return: (limit 件までのメタデータ, 該当する総件数)
+        """
+        self.sync()
+        where, params = self._search_condition(query)
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM projects{where}", params).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT {', '.join(META_COLUMNS)} FROM projects{where}"
+                " ORDER BY timestamp DESC, filename DESC LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            ).fetchall()
+        return [dict(zip(META_COLUMNS, row)) for row in rows], total
+
+    def _search_condition(self, query: str) -> Tuple[str, List]:
+        terms = list(dict.fromkeys(t for t in re.split(r"\s+", query or "") if t))
+        if not terms:
+            return "", []
+        conditions, params = [], []
+        if not self.full_text:
+            for term in terms:
+                conditions.append(
+                    "rowid IN (SELECT rowid FROM project_text WHERE instr(topic, ?) > 0 OR instr(script, ?) > 0)"
+                )
+                params.extend([term, term])
+            return " WHERE " + " AND ".join(conditions), params
+
+        long_terms = [t for t in terms if len(t) >= MIN_MATCH_LENGTH]
+        if long_terms:
+            # 各語をフレーズとして AND でつなぐ
+            conditions.append("rowid IN (SELECT rowid FROM project_text WHERE project_text MATCH ?)")
+            params.append(" AND ".join(_phrase(t) for t in long_terms))
+        for term in terms:
+            if len(term) >= MIN_MATCH_LENGTH:
+                continue
+            # 3文字未満の語は、その語で始まる trigram のいずれかを含むもの (全件の走査をしない)。
+            # 語が末尾にあると trigram にならないため、短いトピックだけは部分一致でも調べる
+            # (台本の末尾2文字だけに現れる語は見つからない)
+            with self._lock:
+                trigrams = [row[0] for row in self._conn.execute(
+                    "SELECT term FROM project_text_vocab WHERE term >= ? AND term < ?",
+                    (term.lower(), term.lower() + "\U0010ffff")
+                )]
+            condition = "instr(topic, ?) > 0"
+            params_for_term = [term]
+            if trigrams:
+                condition = f"(rowid IN (SELECT rowid FROM project_text WHERE project_text MATCH ?) OR {condition})"
+                params_for_term.insert(0, " OR ".join(_phrase(t) for t in trigrams))
+            conditions.append(condition)
+            params.extend(params_for_term)
+        return " WHERE " + " AND ".join(conditions), params
+
+    def sync(self) -> int:
+        """
+        ディレクトリの内容と索引を突き合わせ、差分だけを反映する
+        :return: 読み直した (または索引から消した) ファイル数
+        """
+        try:
+            dir_mtime = os.stat(self.projects_dir).st_mtime_ns
+        except OSError:
+            return 0
+        # ファイルの追加・削除・置き換えがなければディレクトリの更新時刻は変わらないので、走査を省く。
+        # その場での書き換えはディレクトリの更新時刻に現れないため、一定時間ごとには走査する
+        if dir_mtime == self._synced_dir_mtime and time.monotonic() - self._synced_at < RESCAN_INTERVAL_SECONDS:
+            return 0
+        on_disk = {}
+        for entry in os.scandir(self.projects_dir):
+            if is_project_file(entry.name) and entry.is_file():
+                on_disk[entry.name] = entry.stat()
+
+        with self._lock:
+            indexed = {
+                filename: (mtime_ns, size)
+                for filename, mtime_ns, size in self._conn.execute("SELECT filename, mtime_ns, size FROM projects")
+            }
+            changed = 0
+            for filename, stat in on_disk.items():
+                if indexed.get(filename) == (stat.st_mtime_ns, stat.st_size):
+                    continue
+                try:
+                    data = read_packed(os.path.join(self.projects_dir, filename))
+                except Exception as e:
+                    print(f"Error loading {filename}: {e}")
+                    continue
+                self._upsert(filename, data, stat)
+                changed += 1
+            for filename in indexed.keys() - on_disk.keys():
+                self._delete(filename)
+                changed += 1
+            if changed:
+                self._conn.commit()
+            self._synced_dir_mtime = dir_mtime
+            self._synced_at = time.monotonic()
+        return changed
+
+    def _upsert(self, filename: str, data: Dict, stat: os.stat_result):
+        meta = project_meta(filename, data)
+        columns = META_COLUMNS + RESEARCH_COLUMNS + ["mtime_ns", "size"]
+        # 全文検索のテーブルは rowid で対応づけるため、更新時も rowid が変わらない UPSERT にする
+        self._conn.execute(
+            f"INSERT INTO projects ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+            f" ON CONFLICT(filename) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in columns[1:])}",
+            [meta[c] for c in META_COLUMNS + RESEARCH_COLUMNS] + [stat.st_mtime_ns, stat.st_size]
+        )
+        rowid = self._conn.execute("SELECT rowid FROM projects WHERE filename = ?", (filename,)).fetchone()[0]
+        self._conn.execute("DELETE FROM project_text WHERE rowid = ?", (rowid,))
+        self._conn.execute(
+            "INSERT INTO project_text (rowid, filename, topic, script) VALUES (?, ?, ?, ?)",
+            (rowid, filename, data.get("topic", ""), data.get("script", ""))
+        )
+        self._conn.execute("DELETE FROM project_sources WHERE filename = ?", (filename,))
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO project_sources (filename, blob) VALUES (?, ?)",
+            [(filename, blob) for blob in source_refs(data)]
+        )
+
+    def _delete(self, filename: str):
+        row = self._conn.execute("SELECT rowid FROM projects WHERE filename = ?", (filename,)).fetchone()
+        if row:
+            self._conn.execute("DELETE FROM project_text WHERE rowid = ?", (row[0],))
+        self._conn.execute("DELETE FROM projects WHERE filename = ?", (filename,))
+        self._conn.execute("DELETE FROM project_sources WHERE filename = ?", (filename,))
+
+_indexes: Dict[str, ProjectIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_project_index(projects_dir: str = DEFAULT_PROJECTS_DIR) -> ProjectIndex:
+    """
+    プロジェクトのディレクトリごとにプロセス内で共有する索引を返す
+    """
+    key = os.path.abspath(projects_dir)
+    with _indexes_lock:
+        if key not in _indexes:
+            if projects_dir == DEFAULT_PROJECTS_DIR:
+                path = DEFAULT_INDEX_PATH
+            else:
+                # 別のディレクトリの索引は混ざらないよう別のファイルにする
+                path = os.path.join(CACHE_DIR, f"project_index_{hashlib.sha1(key.encode('utf-8')).hexdigest()[:10]}.sqlite3")
+            _indexes[key] = ProjectIndex(projects_dir, path)
+        return _indexes[key]
@@ -1,22 +1,35 @@
-import json
 import os
 import datetime
-from typing import List, Dict
+import threading
+from typing import List, Dict, Optional
+
+from project_index import get_project_index
+from script_revisions import add_revision
+from project_store import COMPRESSED_SUFFIX, get_blob_store, pack_project, read_project, write_packed
 
 PROJECTS_DIR = "projects"
 
+# 保存中のプロジェクトのブロブを、同時に行われた削除の後始末で消さないようにする
+# (別のプロセスの保存は、保存したばかりのブロブを消さない猶予 (BLOB_GRACE_SECONDS) で守る)
+_store_lock = threading.Lock()
+
 def ensure_projects_dir():
     """プロジェクト保存用ディレクトリを作成する"""
     if not os.path.exists(PROJECTS_DIR):
-        os.makedirs(PROJECTS_DIR)
+        os.makedirs(PROJECTS_DIR, exist_ok=True)
 
-def save_project(topic: str, script: str, news_list: List[Dict], diet_speeches: List[Dict], provider: str, model: str):
-    """プロジェクトをJSONファイルとして保存する"""
+def save_project(topic: str, script: str, news_list: List[Dict], diet_speeches: List[Dict], provider: str, model: str,
+                 revisions: Optional[List[Dict]] = None, research: Optional[Dict] = None):
+    """
+    プロジェクトを保存する
+    本体は圧縮した JSON (.json.gz)、ニュース・議事録は内容ごとにブロブとして1回だけ保存する (project_store)。
+    :param revisions: 台本の改訂履歴 (script_revisions。最新版が script。未指定なら生成した1版だけ)
+    :param research: 調査の情報 (research_cache.research_info。キーワード・期間・取得時刻)。
+                     保存すると、同じキーワードの次の生成でソースを再利用できる
+    """
     ensure_projects_dir()
     
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"project_{timestamp}.json"
-    filepath = os.path.join(PROJECTS_DIR, filename)
     
     data = {
         "timestamp": datetime.datetime.now().isoformat(),
@@ -25,36 +38,74 @@ def save_project(topic: str, script: str, news_list: List[Dict], diet_speeches:
         "news_list": news_list,
         "diet_speeches": diet_speeches,
         "provider": provider,
-        "model": model
+        "model": model,
+        "revisions": revisions or add_revision([], "", script, "generate", provider=provider, model=model)
     }
+    if research:
+        data["research"] = research
     
-    with open(filepath, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
-    return filepath
+    # 同じ秒に複数保存された場合 (バッチ生成など) は連番を付けて上書きを避ける
+    suffix = 0
+    with _store_lock:
+        packed = pack_project(data, get_blob_store(PROJECTS_DIR))
+        while True:
+            stem = f"project_{timestamp}" if suffix == 0 else f"project_{timestamp}_{suffix}"
+            filename = stem + COMPRESSED_SUFFIX
+            filepath = os.path.join(PROJECTS_DIR, filename)
+            try:
+                write_packed(filepath, packed)
+                get_project_index(PROJECTS_DIR).add(filename, packed)
+                return filepath
+            except FileExistsError:
+                suffix += 1
 
 def list_projects() -> List[Dict]:
-    """保存されたプロジェクトの一覧を取得する（最新順）"""
+    """
+    保存されたプロジェクトの一覧を取得する（最新順）
+    索引のメタデータ (filename, topic, timestamp, provider, model, 件数) だけを返す。
+    台本やソースが必要な場合は load_project で読み込む。
+    """
     ensure_projects_dir()
-    projects = []
-    
-    for filename in os.listdir(PROJECTS_DIR):
-        if filename.endswith(".json"):
-            filepath = os.path.join(PROJECTS_DIR, filename)
-            try:
-                with open(filepath, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    data["filename"] = filename
-                    projects.append(data)
-            except Exception as e:
-                print(f"Error loading {filename}: {e}")
-    
-    # タイムスタンプでソート（新しい順）
-    return sorted(projects, key=lambda x: x.get("timestamp", ""), reverse=True)
+    return get_project_index(PROJECTS_DIR).list()
+
+def search_projects(query: str = "", page: int = 1, per_page: int = 20) -> Dict:
+    """
+    トピック・台本の全文検索とページ分割 (最新順)
+    :param query: 空白区切りの語 (すべてを含むものに絞る。空なら全件)
+    :return: {"items": そのページのメタデータ, "total": 該当件数, "page": ページ番号, "pages": 総ページ数}
+    """
+    ensure_projects_dir()
+    per_page = max(1, per_page)
+    page = max(1, page)
+    index = get_project_index(PROJECTS_DIR)
+    items, total = index.search(query, limit=per_page, offset=(page - 1) * per_page)
+    pages = max(1, -(-total // per_page))
+    if page > pages:
+        # 削除などで件数が減り、ページが範囲外になった場合は最後のページを返す
+        page = pages
+        items, total = index.search(query, limit=per_page, offset=(page - 1) * per_page)
+    return {"items": items, "total": total, "page": page, "pages": pages}
+
+def load_project(filename: str) -> Optional[Dict]:
+    """プロジェクトの中身をすべて読み込む"""
+    filepath = os.path.join(PROJECTS_DIR, os.path.basename(filename))
+    try:
+        data = read_project(filepath, get_blob_store(PROJECTS_DIR))
+    except Exception as e:
+        print(f"Error loading {filename}: {e}")
+        return None
+    data["filename"] = os.path.basename(filename)
+    return data
 
 def delete_project(filename: str):
     """プロジェクトを削除する"""
     filepath = os.path.join(PROJECTS_DIR, filename)
     if os.path.exists(filepath):
-        os.remove(filepath)
+        with _store_lock:
+            os.remove(filepath)
+            index = get_project_index(PROJECTS_DIR)
+            index.remove(filename)
+            # どのプロジェクトからも参照されなくなったソースを消す (保存して間もないものは残す)
+            get_blob_store(PROJECTS_DIR).delete_unreferenced(index.referenced_blobs())
         return True
     return False
@@ -0,0 +1,321 @@
+"""
+保存済みプロジェクトの格納形式
+
+本体 (トピック・台本など) は gzip で圧縮した JSON (project_*.json.gz) として保存し、
+ニュース・議事録の各件は内容のハッシュをキーにして、圧縮したうえで projects/sources.sqlite3 に
+1回だけ保存する。本体にはハッシュの一覧 (news_refs / speech_refs) だけを書くため、
+関連するトピックのプロジェクトで同じ発言が何度も保存されることはない。
+旧形式 (整形済みの project_*.json) もそのまま読める。
+
+旧形式からの一括変換:
+    python project_store.py migrate              # projects/ を変換し、削減量を表示
+    python project_store.py migrate --dry-run    # 書き込まずに削減量だけを計算
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+FORMAT_VERSION = 2
+COMPRESSED_SUFFIX = ".json.gz"
+LEGACY_SUFFIX = ".json"
+BLOBS_FILENAME = "sources.sqlite3"
+# 参照されていないブロブでも、保存 (または再利用) からこの秒数が経つまでは消さない。
+# 別のプロセスがブロブを書いてから本体と索引を書き終えるまでの間に、削除の後始末で消されないようにする
+BLOB_GRACE_SECONDS = 3600
+
+# ブロブに分ける項目 (本体のキー → 参照のキー)
+SOURCE_FIELDS = {"news_list": "news_refs", "diet_speeches": "speech_refs"}
+
+def is_project_file(filename: str) -> bool:
+    return filename.startswith("project_") and filename.endswith((COMPRESSED_SUFFIX, LEGACY_SUFFIX))
+
+def project_stem(path: str) -> str:
+    """
+    拡張子 (.json / .json.gz) を除いたパス (資料などを同じ名前で保存するときに使う)
+    """
+    for suffix in (COMPRESSED_SUFFIX, LEGACY_SUFFIX):
+        if path.endswith(suffix):
+            return path[:-len(suffix)]
+    return os.path.splitext(path)[0]
+
+def _dumps(data) -> bytes:
+    # 圧縮前の JSON も小さくするため、インデントと区切りの空白を省く
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), sort_keys=True).encode("utf-8")
+
+def _compress(payload: bytes) -> bytes:
+    # mtime を固定し、同じ内容なら同じバイト列になるようにする
+    return gzip.compress(payload, compresslevel=6, mtime=0)
+
+def source_hash(item: Dict) -> str:
+    """
+    ニュース・議事録1件の内容から決まるハッシュ
+    """
+    return hashlib.sha256(_dumps(item)).hexdigest()
+
+class BlobStore:
+    """
+    内容のハッシュをキーにしたソースの保存先 (同じ内容は1回だけ書く)
+    1件ずつのファイルにするとファイルシステムのブロック単位で容量が膨らむため、
+    圧縮した JSON を1つの SQLite ファイルにまとめて持つ。
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        # アプリと CLI が同時に書き込むこともあるので、ロック待ちの時間を長めにとる
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs (key TEXT PRIMARY KEY, data BLOB NOT NULL, stored_at REAL NOT NULL DEFAULT 0)"
+        )
+        # 保存時刻の無い以前の保存先には列を足す (既存のブロブは古いものとして扱う)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(blobs)")}
+        if "stored_at" not in columns:
+            self._conn.execute("ALTER TABLE blobs ADD COLUMN stored_at REAL NOT NULL DEFAULT 0")
+        self._conn.commit()
+
+    def put_many(self, items: List[Dict]) -> List[str]:
+        """
+        まとめて保存し、各件のハッシュを同じ順序で返す
+        既にあるブロブは保存時刻だけを更新する (これから参照するブロブを削除の後始末で消さないため)
+        """
+        keys = [source_hash(item) for item in items]
+        rows = {key: item for key, item in zip(keys, items)}
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO blobs (key, data, stored_at) VALUES (?, ?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET stored_at = excluded.stored_at",
+                [(key, _compress(_dumps(item)), now) for key, item in rows.items()]
+            )
+            self._conn.commit()
+        return keys
+
+    def get_many(self, keys: List[str]) -> Dict[str, Dict]:
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            # SQLite の変数の上限を超えないよう分けて問い合わせる
+            for i in range(0, len(unique), 500):
+                chunk = unique[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, data FROM blobs WHERE key IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                found.update(rows)
+        result = {}
+        for key, data in found.items():
+            try:
+                result[key] = json.loads(gzip.decompress(data))
+            except Exception as e:
+                print(f"Error loading source {key}: {e}")
+        return result
+
+    def keys(self) -> Set[str]:
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT key FROM blobs")}
+
+    def delete_unreferenced(self, referenced: Iterable[str], grace_seconds: float = BLOB_GRACE_SECONDS) -> int:
+        """
+        referenced に含まれず、保存から grace_seconds 以上経ったブロブを削除する
+        保存時刻は削除の文でも確かめるため、削除対象を選んだ後に別のプロセスが再利用したブロブは残る。
+        :return: 削除した件数
+        """
+        referenced = set(referenced)
+        cutoff = time.time() - grace_seconds
+        with self._lock:
+            candidates = [
+                row[0] for row in self._conn.execute("SELECT key FROM blobs WHERE stored_at < ?", (cutoff,))
+                if row[0] not in referenced
+            ]
+            if not candidates:
+                return 0
+            cur = self._conn.executemany(
+                "DELETE FROM blobs WHERE key = ? AND stored_at < ?", [(key, cutoff) for key in candidates]
+            )
+            self._conn.commit()
+            return cur.rowcount
+
+    def compact(self):
+        """
+        削除で空いた領域をファイルから取り除く
+        """
+        with self._lock:
+            self._conn.execute("VACUUM")
+
+_blob_stores: Dict[str, BlobStore] = {}
+_blob_stores_lock = threading.Lock()
+
+def get_blob_store(projects_dir: str) -> BlobStore:
+    """
+    プロジェクトのディレクトリごとにプロセス内で共有するソースの保存先を返す
+    """
+    path = os.path.abspath(os.path.join(projects_dir, BLOBS_FILENAME))
+    with _blob_stores_lock:
+        if path not in _blob_stores:
+            _blob_stores[path] = BlobStore(path)
+        return _blob_stores[path]
+
+def pack_project(data: Dict, blobs: BlobStore) -> Dict:
+    """
+    ニュース・議事録をブロブに保存し、本体には参照だけを残した dict を返す
+    """
+    packed = {k: v for k, v in data.items() if k not in SOURCE_FIELDS}
+    for field, ref_field in SOURCE_FIELDS.items():
+        if field in data:
+            packed[ref_field] = blobs.put_many(data[field] or [])
+    packed["format"] = FORMAT_VERSION
+    return packed
+
+def unpack_project(packed: Dict, blobs: BlobStore) -> Dict:
+    """
+    参照をブロブの中身に戻す (旧形式の dict はそのまま返す)
+    """
+    if packed.get("format") != FORMAT_VERSION:
+        return packed
+    data = {k: v for k, v in packed.items() if k not in SOURCE_FIELDS.values() and k != "format"}
+    found = blobs.get_many(source_refs(packed))
+    for field, ref_field in SOURCE_FIELDS.items():
+        if ref_field in packed:
+            data[field] = [found[key] for key in packed[ref_field] if key in found]
+    return data
+
+def source_refs(packed: Dict) -> List[str]:
+    """
+    本体が参照しているブロブのハッシュ
+    """
+    return [key for ref_field in SOURCE_FIELDS.values() for key in packed.get(ref_field) or []]
+
+def write_packed(path: str, packed: Dict, exclusive: bool = True):
+    """
+    本体を圧縮して書き出す (exclusive なら既にあるファイルは上書きせず FileExistsError)
+    """
+    payload = _compress(_dumps(packed))
+    with open(path, "xb" if exclusive else "wb") as f:
+        f.write(payload)
+
+def read_packed(path: str) -> Dict:
+    """
+    本体を読み込む (参照は展開しない。旧形式のファイルは中身をそのまま返す)
+    """
+    with open(path, "rb") as f:
+        raw = f.read()
+    if path.endswith(COMPRESSED_SUFFIX):
+        raw = gzip.decompress(raw)
+    return json.loads(raw)
+
+def read_project(path: str, blobs: BlobStore) -> Dict:
+    return unpack_project(read_packed(path), blobs)
+
+def _usage(paths: List[str]) -> Dict[str, int]:
+    # ファイルサイズの合計と、実際にディスク上で使っている容量 (ブロック単位) の合計
+    size = disk = 0
+    for path in paths:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            size += stat.st_size
+            disk += getattr(stat, "st_blocks", 0) * 512 or stat.st_size
+    return {"size": size, "disk": disk}
+
+def migrate(projects_dir: str, dry_run: bool = False) -> Dict:
+    """
+    旧形式の project_*.json を圧縮形式に変換し、元のファイルを削除する
+    変換後の内容が元と一致することを確かめてから元のファイルを消す。
+    :param dry_run: 何も書き込まず、圧縮後のサイズだけを見積もる
+    :return: 変換したファイル数と、変換前後のファイルサイズ・ディスク使用量 (バイト)
+    """
+    legacy = sorted(
+        f for f in os.listdir(projects_dir)
+        if f.startswith("project_") and f.endswith(LEGACY_SUFFIX) and not f.endswith(COMPRESSED_SUFFIX)
+    )
+    sources_path = os.path.join(projects_dir, BLOBS_FILENAME)
+    before = _usage([os.path.join(projects_dir, f) for f in legacy] + [sources_path])
+    converted: List[str] = []
+
+    if dry_run:
+        # ソースは重複を除いた件数分だけ数える (既に保存先にあるものは考慮しない)
+        estimated = 0
+        seen: Set[str] = set()
+        for filename in legacy:
+            try:
+                data = read_packed(os.path.join(projects_dir, filename))
+            except Exception as e:
+                print(f"Error loading {filename}: {e}")
+                continue
+            packed = {k: v for k, v in data.items() if k not in SOURCE_FIELDS}
+            for field, ref_field in SOURCE_FIELDS.items():
+                if field not in data:
+                    continue
+                packed[ref_field] = []
+                for item in data[field] or []:
+                    key = source_hash(item)
+                    packed[ref_field].append(key)
+                    if key not in seen:
+                        seen.add(key)
+                        estimated += len(_compress(_dumps(item)))
+            packed["format"] = FORMAT_VERSION
+            estimated += len(_compress(_dumps(packed)))
+            converted.append(filename)
+        return {"files": len(converted), "before": before, "after": {"size": estimated, "disk": None}, "dry_run": True}
+
+    blobs = get_blob_store(projects_dir)
+    written: List[str] = []
+    for filename in legacy:
+        src = os.path.join(projects_dir, filename)
+        dst = os.path.join(projects_dir, filename[:-len(LEGACY_SUFFIX)] + COMPRESSED_SUFFIX)
+        try:
+            data = read_packed(src)
+            write_packed(dst, pack_project(data, blobs))
+        except FileExistsError:
+            print(f"Skip {filename}: {os.path.basename(dst)} already exists")
+            continue
+        except Exception as e:
+            print(f"Error converting {filename}: {e}")
+            continue
+        if read_project(dst, blobs) != data:
+            os.remove(dst)
+            print(f"Error converting {filename}: contents differ after conversion")
+            continue
+        os.remove(src)
+        converted.append(filename)
+        written.append(dst)
+    blobs.compact()
+    return {"files": len(converted), "before": before, "after": _usage(written + [sources_path]), "dry_run": False}
+
+def _format_size(size: int) -> str:
+    return f"{size / 1024:.1f} KB" if size < 1024 * 1024 else f"{size / 1024 / 1024:.2f} MB"
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="保存済みプロジェクトの格納形式を扱います")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_migrate = sub.add_parser("migrate", help="旧形式 (project_*.json) を圧縮形式に変換する")
+    p_migrate.add_argument("--projects-dir", default="projects")
+    p_migrate.add_argument("--dry-run", action="store_true", help="書き込まずに削減量だけを表示する")
+    args = parser.parse_args(argv)
+
+    report = migrate(args.projects_dir, dry_run=args.dry_run)
+    if not report["files"]:
+        print("変換するファイルはありません。")
+        return 0
+    before, after = report["before"], report["after"]
+    if report["dry_run"]:
+        print(f"変換対象: {report['files']}件")
+        print(f"ファイルサイズ: {_format_size(before['size'])} → 約 {_format_size(after['size'])} (見積もり)")
+        return 0
+    print(f"変換: {report['files']}件")
+    for label, key in (("ファイルサイズ", "size"), ("ディスク使用量", "disk")):
+        reduction = before[key] - after[key]
+        print(f"{label}: {_format_size(before[key])} → {_format_size(after[key])}"
+              f" (削減 {_format_size(reduction)}, {reduction / before[key] * 100:.1f}%)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,310 @@
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+LATENCY_PATH = os.path.join("cache", "provider_latency.json")
+
+class LatencyTracker:
+    """
+    プロバイダーごとの「最初のトークンまでの時間」とエラー率を指数移動平均で記録し、
+    速い方を主系として選ぶためのクラス
+    """
+    def __init__(self, path: Optional[str] = LATENCY_PATH, alpha: float = 0.3):
+        self.path = path
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict] = {}
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._stats = json.load(f)
+            except Exception as e:
+                print(f"Error loading provider latency: {e}")
+
+    def record(self, name: str, ttft: Optional[float] = None, error: bool = False):
+        """
+        1回分の結果を記録する (ttft は秒、失敗時は error=True)
+        """
+        with self._lock:
+            stat = self._stats.setdefault(name, {"ttft": None, "error_rate": 0.0, "samples": 0})
+            stat["samples"] += 1
+            stat["error_rate"] = (1 - self.alpha) * stat["error_rate"] + self.alpha * (1.0 if error else 0.0)
+            if ttft is not None:
+                stat["ttft"] = ttft if stat["ttft"] is None else (1 - self.alpha) * stat["ttft"] + self.alpha * ttft
+            self._save()
+
+    def record_lower_bound(self, name: str, elapsed: float):
+        """
+        最初のトークンが届く前に打ち切った候補を記録する (実際の ttft は elapsed 以上としか分からない)
+        平均を下げないよう、現在の値が elapsed より小さい場合だけ elapsed に引き上げる。
+        """
+        with self._lock:
+            stat = self._stats.setdefault(name, {"ttft": None, "error_rate": 0.0, "samples": 0})
+            if stat["ttft"] is None or stat["ttft"] < elapsed:
+                stat["ttft"] = elapsed
+                self._save()
+
+    def score(self, name: str) -> Optional[float]:
+        """
+        小さいほど良いスコア (計測前は None)
+        """
+        stat = self._stats.get(name)
+        if not stat or stat["ttft"] is None:
+            return None
+        # エラーが多いプロバイダーは実効的に遅いものとして扱う
+        return stat["ttft"] * (1 + 2 * stat["error_rate"])
+
+    def rank(self, names: List[str]) -> List[str]:
+        """
+        速い順に並べ替える。未計測のプロバイダーがある場合は指定順のまま返す
+        """
+        scores = {n: self.score(n) for n in names}
+        if any(s is None for s in scores.values()):
+            return list(names)
+        return sorted(names, key=lambda n: scores[n])
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {k: dict(v) for k, v in self._stats.items()}
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(self._stats, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            print(f"Error saving provider latency: {e}")
+
+_default_tracker: Optional[LatencyTracker] = None
+_default_tracker_lock = threading.Lock()
+
+def get_default_tracker() -> LatencyTracker:
+    """
+    プロセス内で共有するデフォルトのトラッカーを返す
+    """
+    global _default_tracker
+    with _default_tracker_lock:
+        if _default_tracker is None:
+            _default_tracker = LatencyTracker()
+        return _default_tracker
+
+class RateLimiter:
+    """
+    プロバイダーごとに同時呼び出し数と1分あたりの呼び出し回数を制限するクラス
+    複数のトピックを並行して生成する場合などに、同じ ScriptGenerator 群で共有して使う。
+    """
+    def __init__(self, max_concurrent: Optional[Dict[str, int]] = None, requests_per_minute: Optional[Dict[str, int]] = None):
+        """
+        :param max_concurrent: {"openai": 2, ...} 未指定のプロバイダーは無制限
+        :param requests_per_minute: {"gemini": 10, ...} 未指定のプロバイダーは無制限
+        """
+        self.max_concurrent = {k.lower(): v for k, v in (max_concurrent or {}).items()}
+        self.requests_per_minute = {k.lower(): v for k, v in (requests_per_minute or {}).items()}
+        self._lock = threading.Lock()
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._next_start: Dict[str, float] = {}
+
+    @contextmanager
+    def slot(self, provider: str):
+        """
+        呼び出し枠を確保してから処理を実行する (枠が空くまで待つ)
+        """
+        release = self.acquire(provider)
+        try:
+            yield
+        finally:
+            release()
+
+    def acquire(self, provider: str, cancelled: Optional[Callable[[], bool]] = None) -> Optional[Callable[[], None]]:
+        """
+        呼び出し枠を確保し、枠を返す関数を返す (何度呼んでも返すのは1回だけ)
+        :param cancelled: 枠を待っている間に True を返すようになったら、確保せずに None を返す
+        """
+        provider = provider.lower()
+        semaphore = self._semaphore(provider)
+        if semaphore:
+            while not semaphore.acquire(timeout=0.1 if cancelled else None):
+                if cancelled():
+                    return None
+        once = threading.Lock()
+
+        def release():
+            # 打ち切った側と呼び出し側の両方から呼ばれても1回だけ返す
+            if semaphore and once.acquire(blocking=False):
+                semaphore.release()
+
+        try:
+            self._wait_turn(provider)
+        except BaseException:
+            release()
+            raise
+        return release
+
+    def _semaphore(self, provider: str) -> Optional[threading.BoundedSemaphore]:
+        limit = self.max_concurrent.get(provider)
+        if not limit:
+            return None
+        with self._lock:
+            if provider not in self._semaphores:
+                self._semaphores[provider] = threading.BoundedSemaphore(limit)
+            return self._semaphores[provider]
+
+    def _wait_turn(self, provider: str):
+        rpm = self.requests_per_minute.get(provider)
+        if not rpm:
+            return
+        # 呼び出しの開始時刻を 60/rpm 秒間隔に並べ、自分の順番まで待つ
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start.get(provider, now))
+            self._next_start[provider] = start + 60.0 / rpm
+        if start > now:
+            time.sleep(start - now)
+
+class CancelToken:
+    """
+    ヘッジの候補ごとの打ち切りの通知
+    打ち切られたときに呼ぶ処理 (呼び出し枠の返却など) を登録でき、応答待ちで止まっている
+    スレッドの代わりに、打ち切った側のスレッドで実行される。
+    """
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+
+    def is_set(self) -> bool:
+        return self._event.is_set()
+
+    def on_cancel(self, callback: Callable[[], None]):
+        """
+        打ち切られたときに呼ぶ処理を登録する (既に打ち切られていればすぐに呼ぶ)
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error in cancel callback: {e}")
+
+class AllProvidersFailed(Exception):
+    """
+    すべてのプロバイダーが失敗した場合の例外 (プロバイダーごとのエラーを保持する)
+    """
+    def __init__(self, errors: Dict[str, Exception]):
+        self.errors = errors
+        super().__init__(" / ".join(f"{name}: {e}" for name, e in errors.items()))
+
+def hedged_stream(candidates: List[Tuple[str, Callable[[CancelToken], Iterator[str]]]], hedge_after: Optional[float] = None,
+                  tracker: Optional[LatencyTracker] = None, on_winner: Optional[Callable[[str], None]] = None) -> Iterator[str]:
+    """
+    先頭の候補からストリーミングを開始し、hedge_after 秒以内に最初のトークンが届かなければ
+    次の候補も並行して開始する。最初にトークンを返した候補を採用し、残りは打ち切る。
+    候補がエラーになった場合は待たずに次の候補を開始する (hedge_after=None ならエラー時のみ切り替え)。
+    負けた候補と、呼び出し側がこのジェネレーターを途中で手放した場合 (close / GeneratorExit) の
+    すべての候補には CancelToken で打ち切りを通知し、各ワーカーはストリームを閉じて終わる。
+    :param candidates: (名前, 打ち切りの通知を受け取ってストリームを返す関数) のリスト。優先順に並べる
+    """
+    events: "queue.Queue[Tuple[str, str, object]]" = queue.Queue()
+    tokens: Dict[str, CancelToken] = {}
+    started_at: Dict[str, float] = {}
+    errors: Dict[str, Exception] = {}
+    pending = list(candidates)
+    running = 0
+
+    def worker(name: str, factory: Callable[[CancelToken], Iterator[str]], token: CancelToken):
+        stream = None
+        try:
+            stream = factory(token)
+            for chunk in stream:
+                if token.is_set():
+                    break
+                events.put((name, "chunk", chunk))
+            else:
+                events.put((name, "done", None))
+        except Exception as e:
+            if not token.is_set():
+                events.put((name, "error", e))
+        finally:
+            if stream is not None and hasattr(stream, "close"):
+                stream.close()
+
+    def start_next() -> bool:
+        nonlocal running
+        if not pending:
+            return False
+        name, factory = pending.pop(0)
+        started_at[name] = time.perf_counter()
+        tokens[name] = CancelToken()
+        running += 1
+        threading.Thread(target=worker, args=(name, factory, tokens[name]), daemon=True).start()
+        return True
+
+    try:
+        start_next()
+        winner = None
+        while winner is None:
+            timeout = hedge_after if (hedge_after is not None and pending) else None
+            try:
+                name, kind, payload = events.get(timeout=timeout)
+            except queue.Empty:
+                # 期限内に最初のトークンが来なかったので、次の候補を並行して開始する
+                start_next()
+                continue
+
+            if kind == "chunk":
+                winner = name
+                now = time.perf_counter()
+                for other, token in tokens.items():
+                    if other != name:
+                        token.cancel()
+                if tracker:
+                    tracker.record(name, ttft=now - started_at[name])
+                    # 負けた候補は「少なくともここまで待った」ことしか分からないので、平均は下げない
+                    for other, t0 in started_at.items():
+                        if other != name and other not in errors:
+                            tracker.record_lower_bound(other, now - t0)
+                if on_winner:
+                    on_winner(name)
+                yield payload
+            elif kind == "error" or kind == "done":
+                # 1文字も返さずに終わった場合も失敗として扱う
+                running -= 1
+                errors[name] = payload if kind == "error" else RuntimeError("空の応答")
+                if tracker:
+                    tracker.record(name, error=True)
+                if not start_next() and running == 0:
+                    raise AllProvidersFailed(errors)
+
+        while True:
+            name, kind, payload = events.get()
+            if name != winner:
+                continue
+            if kind == "chunk":
+                yield payload
+            elif kind == "done":
+                return
+            else:
+                raise payload
+    finally:
+        # 途中で手放された場合も含め、まだ動いている候補をすべて止める (終わった候補には何もしない)
+        for token in tokens.values():
+            token.cancel()
@@ -0,0 +1,219 @@
+import re
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Set
+
+# 略語・通称 → 法令検索に使う正式名称の一部
+BUILTIN_TERMS = {
+    "国保": "国民健康保険",
+    "後期高齢者": "高齢者の医療の確保",
+    "年金": "年金",
+    "介護": "介護保険",
+    "生活保護": "生活保護",
+    "児童手当": "児童手当",
+    "子育て支援": "子ども・子育て支援",
+    "少子化": "少子化",
+    "少子化対策": "少子化",
+    "出産育児一時金": "健康保険",
+    "賃上げ": "最低賃金",
+    "最低賃金": "最低賃金",
+    "働き方改革": "労働基準",
+    "女性活躍": "女性の職業生活における活躍",
+    "防衛費": "防衛",
+    "防衛費増税": "防衛",
+    "補正予算": "財政",
+    "消費税": "消費税",
+    "インボイス": "消費税",
+    "所得税": "所得税",
+    "定額減税": "租税特別措置",
+    "マイナンバー": "行政手続における特定の個人を識別するための番号",
+    "マイナ保険証": "行政手続における特定の個人を識別するための番号",
+    "政治資金": "政治資金規正",
+    "裏金": "政治資金規正",
+    "選挙": "公職選挙",
+    "物価高": "物価",
+    "ガソリン税": "揮発油税",
+    "電気代": "電気事業",
+    "再エネ": "再生可能エネルギー",
+    "脱炭素": "地球温暖化対策",
+    "防災": "災害対策基本",
+    "能登": "災害救助",
+    "空き家": "空家等対策",
+    "教育無償化": "学校教育",
+    "奨学金": "独立行政法人日本学生支援機構",
+    "いじめ": "いじめ防止対策推進",
+    "不登校": "教育機会確保",
+    "外国人労働者": "出入国管理及び難民認定",
+    "技能実習": "外国人の技能実習",
+}
+
+# 自由文 (LLMで解析すべき入力) とみなす表現
+FREEFORM_PATTERN = re.compile(
+    r"について|に関して|とは|まとめ|教えて|ください|下さい|ですか|でしょう|ますか|したい|知りたい|"
+    r"なぜ|どう|どんな|どの|何|いつ|[？?。！!]|[てでた]ほしい"
+)
+
+# 期間の表現 → 日数
+_UNIT_DAYS = {"日": 1, "週": 7, "週間": 7, "ヶ月": 30, "ヵ月": 30, "か月": 30, "カ月": 30, "箇月": 30, "月": 30, "年": 365}
+# 「2024年」「令和6年度」のような年・年度は期間ではないので、期間を表す語 (直近・過去・ここ・最近、
+# または 間・以内) が付いている場合だけ期間とみなす。4桁の数と元号の後の数は対象にしない
+PERIOD_PATTERN = re.compile(
+    r"(?P<prefix>直近|過去|ここ|最近の?)?\s*(?<![0-9])(?<!令和)(?<!平成)(?<!昭和)"
+    r"(?P<n>[0-9]{1,3}|[一二三四五六七八九十]+)\s*(?P<unit>日|週間|週|ヶ月|ヵ月|か月|カ月|箇月|年)(?!度)"
+    r"(?P<suffix>間|分)?(?P<within>以内)?の?"
+)
+# 期間として受け付ける最大の日数
+MAX_PERIOD_DAYS = 365 * 5
+PERIOD_WORDS = {
+    "今日": 1, "本日": 1, "昨日": 2,
+    "今週": 7, "先週": 14, "最近": 30, "今月": 30, "先月": 60,
+    "今年": 365, "昨年": 730, "去年": 730,
+}
+
+DELIMITERS = r"[\s,、，/／|｜]+"
+
+_KANJI_NUMBERS = {"一": 1, "二": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9, "十": 10}
+
+def _to_int(text: str) -> int:
+    if text.isdigit():
+        return int(text)
+    # 「十二」「二十」程度までの漢数字に対応する
+    if "十" in text:
+        tens, _, ones = text.partition("十")
+        return _KANJI_NUMBERS.get(tens, 1) * 10 + _KANJI_NUMBERS.get(ones, 0)
+    return _KANJI_NUMBERS.get(text, 0)
+
+class QueryAnalyzer:
+    """
+    単語を並べただけの入力を、LLMを使わずに検索キーワードと期間に分解するクラス
+    用語辞書は「組み込みの略語表」「過去のプロジェクトのトピック」「法令名一覧」から作る。
+    文章として書かれた入力は解析できないため None を返し、LLM に任せる。
+    """
+    def __init__(self, law_fetcher: Optional["LawFetcher"] = None, projects_dir: str = "projects",
+                 refresh_catalog: bool = True, max_terms: int = 5):
+        if law_fetcher is None:
+            # requests は法令名一覧を取得するときだけ必要なので、解析器を作るまで読み込まない
+            from law_fetcher import LawFetcher
+            law_fetcher = LawFetcher()
+        self.law_fetcher = law_fetcher
+        self.projects_dir = projects_dir
+        self.max_terms = max_terms
+        # 用語 → 法令検索用の語
+        self.terms: Dict[str, str] = dict(BUILTIN_TERMS)
+        # 過去のトピック (用語として認識するだけで、法令検索用の語は持たない)
+        self.project_terms: Set[str] = set()
+        self.law_titles: List[str] = []
+        self._lock = threading.Lock()
+
+        self._load_project_terms()
+        # 法令名一覧はキャッシュ済みのものだけを即座に使い、更新はバックグラウンドで行う
+        self._set_law_titles(self.law_fetcher.fetch_law_titles(refresh=False))
+        if refresh_catalog:
+            threading.Thread(target=self._refresh_law_titles, daemon=True).start()
+
+    def analyze(self, user_input: str) -> Optional[Dict]:
+        """
+        :return: analyze_query と同じ形式の dict。自由文で解析できない場合は None
+        """
+        text = unicodedata.normalize("NFKC", user_input or "").strip()
+        if not text:
+            return None
+
+        days, text = self._extract_period(text)
+        tokens = [t for t in re.split(DELIMITERS, text) if t]
+        if not tokens or len(tokens) > self.max_terms:
+            return None
+        if any(not self._is_term(t) for t in tokens):
+            return None
+
+        tokens = list(dict.fromkeys(tokens))
+        return {
+            "keywords": tokens,
+            "law_keywords": list(dict.fromkeys(self._law_keyword(t) for t in tokens)),
+            "days": days,
+            "analyzer": "rule",
+        }
+
+    def _is_term(self, token: str) -> bool:
+        """
+        辞書 (略語表・法令名・過去のトピック) で確かめられる語か
+        完全一致のほか、法令名の一部 (「最低賃金」) と、辞書の語に語尾が付いたもの (「国保逃れ」) を受け付ける。
+        助詞を含む句 (「年収の壁」「子ども食堂の現状」) や辞書で確かめられない語は LLM に任せる。
+        """
+        with self._lock:
+            if token in self.terms or token in self.project_terms:
+                return True
+            if FREEFORM_PATTERN.search(token) or len(token) < 2 or len(token) > 12 or re.search(r"[のをがはにへ]", token):
+                return False
+            if any(token in title for title in self.law_titles):
+                return True
+            return any(len(t) >= 2 and t in token for t in self.terms)
+
+    def _law_keyword(self, token: str) -> str:
+        with self._lock:
+            mapped = self.terms.get(token)
+            if mapped:
+                return mapped
+            # 法令名に含まれる語はそのまま法令検索に使える
+            if any(token in title for title in self.law_titles):
+                return token
+            # 「国保逃れ」→「国保」のように、辞書の語を含む場合はその語の正式名称を使う
+            known = [t for t in self.terms if len(t) >= 2 and t in token]
+        if known:
+            return self.terms[max(known, key=len)]
+        return token
+
+    @staticmethod
+    def _extract_period(text: str):
+        # 期間表現を取り除き、日数に変換する (複数ある場合は最初のもの)
+        for match in PERIOD_PATTERN.finditer(text):
+            # 「週間」は単位自体が期間を表す
+            marked = match.group("prefix") or match.group("suffix") == "間" or match.group("within") or match.group("unit") == "週間"
+            n = _to_int(match.group("n"))
+            if marked and n:
+                days = min(n * _UNIT_DAYS[match.group("unit")], MAX_PERIOD_DAYS)
+                return days, (text[:match.start()] + " " + text[match.end():]).strip()
+        for word, days in PERIOD_WORDS.items():
+            # 「今年度」「昨年度」は期間ではなく予算などの名詞の一部として扱う
+            match = re.search(word + r"(?!度)の?", text)
+            if match:
+                return days, (text[:match.start()] + " " + text[match.end():]).strip()
+        return None, text
+
+    def _load_project_terms(self):
+        # 過去に単語で作成したトピックを辞書に加える (プロジェクトの索引からトピックだけを読む)
+        from project_index import get_project_index
+
+        for project in get_project_index(self.projects_dir).list():
+            topic = unicodedata.normalize("NFKC", project.get("topic") or "").strip()
+            tokens = [t for t in re.split(DELIMITERS, topic) if t]
+            if tokens and all(len(t) <= 12 and not FREEFORM_PATTERN.search(t) for t in tokens):
+                self.project_terms.update(tokens)
+
+    def _refresh_law_titles(self):
+        self._set_law_titles(self.law_fetcher.fetch_law_titles())
+
+    def _set_law_titles(self, titles: List[str]):
+        stems: Set[str] = set()
+        for title in titles:
+            # 「〜に関する法律」「〜法」「〜法施行令」などから中心の語を取り出す
+            stem = re.sub(r"(に関する)?(特別措置|基本)?(法律|法)(施行令|施行規則)?$", "", title)
+            if 2 <= len(stem) <= 12 and not re.search(r"[のをがはにへ]", stem):
+                stems.add(stem)
+        with self._lock:
+            self.law_titles = titles
+            for stem in stems:
+                self.terms.setdefault(stem, stem)
+
+_default_analyzer: Optional[QueryAnalyzer] = None
+_default_analyzer_lock = threading.Lock()
+
+def get_default_analyzer() -> QueryAnalyzer:
+    """
+    プロセス内で共有するデフォルトの解析器を返す
+    """
+    global _default_analyzer
+    with _default_analyzer_lock:
+        if _default_analyzer is None:
+            _default_analyzer = QueryAnalyzer()
+        return _default_analyzer
@@ -0,0 +1,214 @@
+"""
+直近の調査結果 (収集したソース) の再利用
+
+同じトピック (キーワードの組み合わせが同じで、語順・表記ゆれだけが違うものを含む) で続けて台本を作るとき、
+TTL 以内に集めたソースがあればそれを使い、前回の取得以降の分だけを取り直す。
+- 国会議事録: 前回の調査の終了日以降の発言だけを検索し、前回の結果に足す
+- ニュース (RSS): フィードは期間を指定して取得できないため取り直し、前回の記事と合わせる
+  (ニュースは先頭のキーワードだけで検索するため、検索した語が前回と違う場合は再利用しない)
+- 公明新聞・法令・補助金: 期間に依存しないため、TTL 以内ならそのまま使う
+TTL は前回の「すべてを取り直した」時刻から数える (差分の取得を続けても延びない)。
+議事録は後日まとめて登録されることがあり、差分の検索では拾えないため、TTL は数時間に留める。
+
+探す先は、収集のたびに書く cache/research_cache.sqlite3 と、調査の情報 (research) 付きで保存したプロジェクト。
+"""
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Dict, List, Optional
+
+CACHE_PATH = os.path.join("cache", "research_cache.sqlite3")
+DEFAULT_TTL_HOURS = 6
+# これより古い調査結果はキャッシュから消す
+RETENTION_DAYS = 7
+# 議事録の1回の検索で取得する最大件数 (DietMinutesAPI.fetch_speeches の既定値)
+MAX_SPEECHES = 100
+
+# 収集したソースの種類 (キャッシュの sources のキー)
+SOURCE_KINDS = ["speeches", "news", "komei", "law_data", "subsidy_data"]
+KOMEI_SOURCE = "公明新聞"
+
+def normalize_keywords(keywords: List[str]) -> List[str]:
+    """
+    全角・半角、大文字・小文字、語順、重複の違いをなくしたキーワードの一覧
+    """
+    normalized = {unicodedata.normalize("NFKC", k).strip().lower() for k in keywords or []}
+    return sorted(k for k in normalized if k)
+
+def research_key(keywords: List[str]) -> str:
+    return hashlib.sha1(json.dumps(normalize_keywords(keywords), ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def research_info(keywords: List[str], start_date: datetime.date, end_date: datetime.date, collected: List[str],
+                  full_fetched_at: Optional[float] = None, reused_from: Optional[str] = None,
+                  news_keyword: Optional[str] = None) -> Dict:
+    """
+    プロジェクトに保存する調査の情報 (ソースの中身は含まない)
+    :param collected: 収集したソースの種類 (SOURCE_KINDS のうち)
+    :param full_fetched_at: すべてを取り直した時刻 (UNIX時間。省略時は現在)
+    :param reused_from: 再利用した調査結果 ("cache" またはプロジェクトのファイル名)
+    :param news_keyword: ニュースの検索に使った語 (キーワードの組み合わせが同じでも、語順で変わる)
+    """
+    now = time.time()
+    info = {
+        "key": research_key(keywords),
+        "keywords": normalize_keywords(keywords),
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat(),
+        "fetched_at": _isoformat(now),
+        "full_fetched_at": _isoformat(full_fetched_at if full_fetched_at is not None else now),
+        "collected": list(collected),
+    }
+    if reused_from:
+        info["reused_from"] = reused_from
+    if news_keyword:
+        info["news_keyword"] = news_keyword
+    return info
+
+def _isoformat(timestamp: float) -> str:
+    return datetime.datetime.fromtimestamp(timestamp).isoformat(timespec="seconds")
+
+def _timestamp(value: str) -> float:
+    return datetime.datetime.fromisoformat(value).timestamp()
+
+def covers(info: Dict, start_date: datetime.date, end_date: datetime.date) -> bool:
+    """
+    調査結果が要求された期間に使えるか (開始日が要求以前で、終了日が要求より後でないこと)
+    終了日から要求の終了日までは差分として取得する。
+    """
+    return info["start_date"] <= start_date.isoformat() and info["end_date"] <= end_date.isoformat()
+
+def merge_speeches(cached: List[Dict], new: List[Dict], since: datetime.date) -> List[Dict]:
+    """
+    前回の議事録に差分を足す (発言IDで重複を除き、since より古いものは外して新しい順に MAX_SPEECHES 件まで)
+    """
+    merged: Dict[str, Dict] = {}
+    for speech in list(new) + list(cached):
+        merged.setdefault(speech.get("speechID") or json.dumps(speech, sort_keys=True), speech)
+    speeches = [s for s in merged.values() if (s.get("date") or "") >= since.isoformat()]
+    speeches.sort(key=lambda s: s.get("date") or "", reverse=True)
+    return speeches[:MAX_SPEECHES]
+
+def merge_news(cached: List[Dict], new: List[Dict], since: datetime.date) -> List[Dict]:
+    """
+    前回のニュースに新しく取得したものを足す (リンクで重複を除き、新しい順)
+    NewsFetcher と同じく、開始日の前日までの記事と日付が不明な記事を残す。
+    """
+    limit = (since - datetime.timedelta(days=1)).isoformat()
+    merged = {n["link"]: n for n in list(cached) + list(new)}
+    news = [n for n in merged.values() if n.get("published") == "不明" or (n.get("published") or "") >= limit]
+    return sorted(news, key=lambda x: x["published"], reverse=True)
+
+class ResearchCache:
+    """
+    キーワードの組み合わせごとに直近の調査結果 (期間・取得時刻・収集したソース) を保持するクラス
+    ソースは圧縮した JSON で持ち、同じキーワードの調査は最新の1件だけを残す。
+    """
+    def __init__(self, path: str = CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS research ("
+            " key TEXT PRIMARY KEY, info TEXT NOT NULL, full_fetched_at REAL NOT NULL, sources BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, keywords: List[str], start_date: datetime.date, end_date: datetime.date,
+            ttl_hours: float = DEFAULT_TTL_HOURS) -> Optional[Dict]:
+        """
+        TTL 以内で期間を満たす調査結果を返す
+        :return: {"info": 調査の情報, "sources": {種類: ソースの一覧}} (無ければ None)
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT info, sources FROM research WHERE key = ? AND full_fetched_at >= ?",
+                (research_key(keywords), time.time() - ttl_hours * 3600)
+            ).fetchone()
+        if row is None:
+            return None
+        try:
+            info = json.loads(row[0])
+            sources = json.loads(gzip.decompress(row[1]))
+        except Exception as e:
+            print(f"Error loading research cache: {e}")
+            return None
+        if not covers(info, start_date, end_date):
+            return None
+        return {"info": info, "sources": sources}
+
+    def put(self, info: Dict, sources: Dict[str, List[Dict]]):
+        """
+        調査結果を保存する (同じキーワードの以前の結果は置き換え、古い結果は消す)
+        """
+        payload = gzip.compress(json.dumps(sources, ensure_ascii=False).encode("utf-8"), mtime=0)
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO research (key, info, full_fetched_at, sources) VALUES (?, ?, ?, ?)",
+                    (info["key"], json.dumps(info, ensure_ascii=False), _timestamp(info["full_fetched_at"]), payload)
+                )
+                self._conn.execute(
+                    "DELETE FROM research WHERE full_fetched_at < ?", (time.time() - RETENTION_DAYS * 86400,)
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"Error saving research cache: {e}")
+
+_default_cache: Optional[ResearchCache] = None
+_default_cache_lock = threading.Lock()
+
+def get_research_cache() -> ResearchCache:
+    """
+    プロセス内で共有する調査結果のキャッシュを返す
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResearchCache()
+        return _default_cache
+
+def _from_project(project: Dict) -> Dict[str, List[Dict]]:
+    # プロジェクトに保存されているのはニュース (公明新聞を含む) と議事録だけ
+    collected = project["research"].get("collected", [])
+    news_list = project.get("news_list") or []
+    sources = {}
+    if "speeches" in collected:
+        sources["speeches"] = project.get("diet_speeches") or []
+    if "news" in collected:
+        sources["news"] = [n for n in news_list if n.get("source") != KOMEI_SOURCE]
+    if "komei" in collected:
+        sources["komei"] = [n for n in news_list if n.get("source") == KOMEI_SOURCE]
+    return sources
+
+def find_recent_research(keywords: List[str], start_date: datetime.date, end_date: datetime.date,
+                         ttl_hours: float = DEFAULT_TTL_HOURS) -> Optional[Dict]:
+    """
+    再利用できる直近の調査結果を、キャッシュ → 保存済みプロジェクトの順に探す
+    :return: {"info", "sources", "origin": "cache" またはプロジェクトのファイル名} (無ければ None)
+    """
+    found = get_research_cache().get(keywords, start_date, end_date, ttl_hours)
+    if found:
+        found["origin"] = "cache"
+        return found
+
+    from project_manager import PROJECTS_DIR, load_project
+    from project_index import get_project_index
+
+    if not os.path.isdir(PROJECTS_DIR):
+        return None
+    since = _isoformat(time.time() - ttl_hours * 3600)
+    for filename in get_project_index(PROJECTS_DIR).find_research(research_key(keywords), since):
+        project = load_project(filename)
+        if project and project.get("research") and covers(project["research"], start_date, end_date):
+            return {"info": project["research"], "sources": _from_project(project), "origin": filename}
+    return None
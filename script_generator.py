@@ -1,76 +1,25 @@
-from openai import OpenAI
-import google.generativeai as genai
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Iterator, Tuple
 import os
 from datetime import datetime
 import json
 import re
-
-class ScriptGenerator:
-    """
-    収集した情報を元に要約台本を生成するクラス（OpenAI / Gemini ハイブリッド対応）
-    """
-    def __init__(self, provider: str = "openai", api_key: Optional[str] = None, model: str = "gpt-4o"):
-        self.provider = provider.lower()
-        self.api_key = api_key
-        self.model = model
-
-        if self.provider == "openai":
-            if not self.api_key:
-                self.api_key = os.getenv("OPENAI_API_KEY")
-            if not self.api_key:
-                raise ValueError("OpenAI APIキーが提供されていません。")
-            self.client = OpenAI(api_key=self.api_key)
-        elif self.provider == "gemini":
-            if not self.api_key:
-                self.api_key = os.getenv("GEMINI_API_KEY")
-            if not self.api_key:
-                raise ValueError("Gemini APIキーが提供されていません。")
-            genai.configure(api_key=self.api_key)
-            self.client = genai.GenerativeModel(self.model)
-        else:
-            raise ValueError(f"未知のプロバイダーです: {provider}")
-
-    def generate(self, topic: str, news_list: List[Dict], diet_speeches: List[Dict], law_data: List[Dict] = [], stats_summaries: List[str] = [], subsidy_data: List[Dict] = []) -> str:
-        """
-        情報を統合して台本を生成 (一次ソース対応版)
-        """
-        news_context = "\n".join([
-            f"ソース: {n['source']}\nタイトル: {n['title']}\n要約: {n['summary']}\n---" 
-            for n in news_list
-        ])
-        
-        diet_context = "\n".join([
-            f"日付: {s.get('date')}\n発言者: {s.get('speaker')}\n会議録: {s.get('speech')[:500]}...\n---" 
-            for s in diet_speeches
-        ])
-
-        law_parts = []
-        for law in law_data:
-            part = f"- {law.get('title')} ({law.get('number')})"
-            if law.get("snippets"):
-                part += "\n  条文抜粋:\n  " + "\n  ".join(law["snippets"])
-            law_parts.append(part)
-        law_context = "\n".join(law_parts)
-        stats_context = "\n".join([f"- {summary}" for summary in stats_summaries])
-        
-        subsidy_context = ""
-        if subsidy_data:
-            subsidy_lines = []
-            for sub in subsidy_data[:3]: # Limit to top 3
-                line = f"- 【{sub.get('name')}】\n  締切: {sub.get('deadline')}\n  上限: {sub.get('limit')}\n  対象: {sub.get('target')}\n  概要: {sub.get('title')}"
-                subsidy_lines.append(line)
-            subsidy_context = "\n".join(subsidy_lines)
-
-        today_str = datetime.now().strftime("%Y年%m月%d日")
-        
-        # 検索結果が空の場合のメッセージ
-        if not news_list and not diet_speeches and not law_context:
-            data_status = f"【警告】指定されたキーワード「{topic}」に関する最新情報（ニュース・国会・法令）は見つかりませんでした。"
-        else:
-            data_status = f"以下に、最新（{today_str}時点）の多角的な情報を集約しました。"
-
-        prompt = f"""
+import time
+from contextlib import nullcontext
+from llm_cache import LLMCache, get_default_cache
+from context_builder import ContextBuilder
+from provider_router import CancelToken, LatencyTracker, RateLimiter, get_default_tracker, hedged_stream
+from script_sections import split_script, select_target_sections, format_section_payload, apply_section_response
+from source_summarizer import SourceSummarizer, CHEAP_MODELS
+from llm_clients import get_openai_client, get_gemini_model
+from llm_metrics import MetricsRecorder, get_default_recorder, new_run_id
+from query_analyzer import QueryAnalyzer, get_default_analyzer
+from trend_extractor import get_default_extractor
+
+# プロバイダー側のプロンプトキャッシュ (前方一致) が効くよう、固定の指示はバイト列として不変に保ち、
+# 日付やソースなどリクエストごとに変わる内容は必ずこの後ろに連結する
+SYSTEM_PROMPT = "あなたは公明党の国会議員として行動する広報担当AIです。"
+
+GENERATE_INSTRUCTIONS = """
 【役割設定】
 あなたは「現場の声を形にする公明党の国会議員」です。解説の目的は、複雑な政策を生活者の目線で紐解き、期待と安心を届けることです。
 
@@ -99,29 +48,10 @@ class ScriptGenerator:
   - 「スキーム」→「仕組み」
 - 公明党らしさのキーワード: 「小さな声を聞く力」「現場第一主義」「国と地方のネットワーク」「手取りを増やす」「一人のために」。
 
-【参照データ】
-トピック: {topic}
-日付: {today_str}
-{data_status}
-
-[1. 一次ソース（法令・公的データ）]
-{law_context if law_context else "（特になし）"}
-
-[2. 一次ソース（統計・数字）]
-{stats_context if stats_context else "（特になし）"}
-
-[3. 一次ソース（国会議事録）]
-{diet_context if diet_context else "（直近の審議記録なし）"}
-
-[4. 二次ソース（最新ニュース）]
-{news_context}
-
-[5. お役立ち情報（関連補助金・助成金）]
-{subsidy_context if subsidy_context else "（関連する公募中の補助金情報なし）"}
-
 【出力形式】
 YouTubeや街頭演説でも使えるような「語り口調」で出力してください。
 重要箇所には【テロップ案】や【補足解説】を挿入してください。
+台本は末尾の【参照データ】に基づいて執筆してください。
 
 --------------------------------------------------
 
@@ -138,35 +68,23 @@ YouTubeや街頭演説でも使えるような「語り口調」で出力して
 台本の後に、必ず以下のJSON形式でスライド構成を出力してください。
 ```json
 [
-  {{
+  {
     "title": "スライドタイトル",
     "content": "・箇条書き1\\n・箇条書き2",
     "caption": "キャプション",
     "visual_logic": "図解やイラストの指定"
-  }}
+  }
 ]
 ```
 必ず台本とJSONブロックの両方を出力すること。
+
+--------------------------------------------------
 """
-        if self.provider == "openai":
-            return self._generate_openai(prompt)
-        elif self.provider == "gemini":
-            return self._generate_gemini(prompt)
 
-    def refine(self, current_script: str, instruction: str) -> str:
-        """
-        既存の台本に対して、ユーザーの追加指示を反映して再構成する
-        """
-        prompt = f"""
+REFINE_INSTRUCTIONS = """
 【役割設定】
 あなたは「現場の声を形にする公明党の国会議員」です。
-現在、以下の解説台本がありますが、それに対してユーザーから追加の指示がありました。
-
-【現在の台本】:
-{current_script}
-
-【ユーザーの追加指示】:
-{instruction}
+末尾に示す【現在の台本】に対して、ユーザーから追加の指示（【ユーザーの追加指示】）がありました。
 
 【指示に従って台本をブラッシュアップしてください】
 - 「小さな声を聞く力」「現場第一主義」という公明党議員としての姿勢を崩さず、指示内容を反映してください。
@@ -177,35 +95,509 @@ YouTubeや街頭演説でも使えるような「語り口調」で出力して
 【重要】
 最後に、変更後の内容に合わせてスライド資料用のJSONデータも更新し、必ず ````json ... ```` の形式で末尾に含めてください。
 JSONには `visual_logic` (図解・イラスト指定) も含めてください。
+
+--------------------------------------------------
 """
+
+SECTION_REFINE_INSTRUCTIONS = """
+【役割設定】
+あなたは「現場の声を形にする公明党の国会議員」です。
+解説台本のうち、ユーザーの追加指示（【ユーザーの追加指示】）に関係するセクションだけを書き直します。
+
+【指示に従ってセクションをブラッシュアップしてください】
+- 「小さな声を聞く力」「現場第一主義」という公明党議員としての姿勢を崩さず、指示内容を反映してください。
+- 語尾は「〜です」「〜ます」の誠実な口調を維持してください。
+- 政策の「事実」と「ベネフィット（生活への恩恵）」をセットで語るルールを守ってください。
+- NGワード（「主張している」「スキーム」など）が含まれないように注意してください。
+- 渡されたセクション以外は出力しないでください。各セクションは見出し行も含めて書き直してください。
+
+【出力形式（厳守）】
+書き直した各セクションを、受け取ったときと同じ区切り行（<<<SECTION 番号>>>）の後に出力してください。
+最後に <<<SLIDES>>> の行を置き、内容の変更に伴って更新が必要なスライドだけを
+「スライド番号: スライド」のJSONオブジェクトとして ```json ... ``` の形式で出力してください。
+変更が不要なスライドは含めないでください。更新不要な場合は {} を出力してください。
+各スライドには title, content, caption, visual_logic を含めてください。
+
+--------------------------------------------------
+"""
+
+class ScriptGenerator:
+    """
+    収集した情報を元に要約台本を生成するクラス（OpenAI / Gemini ハイブリッド対応）
+    """
+    def __init__(self, provider: str = "openai", api_key: Optional[str] = None, model: str = "gpt-4o", cache: Optional[LLMCache] = None, context_builder: Optional[ContextBuilder] = None,
+                 fallback: Optional["ScriptGenerator"] = None, hedge_after: Optional[float] = None, auto_primary: bool = False, latency_tracker: Optional[LatencyTracker] = None,
+                 summary_model: Optional[str] = None, summary_concurrency: int = 4, summarize_min_tokens: Optional[int] = None,
+                 retrieval_top_k: Optional[int] = None, embedder=None, metrics: Optional[MetricsRecorder] = None, run_id: Optional[str] = None,
+                 query_analyzer: Optional[QueryAnalyzer] = None, rate_limiter: Optional[RateLimiter] = None):
+        self.provider = provider.lower()
+        self.api_key = api_key
+        self.model = model
+        # analyze_query などの補助呼び出しの応答キャッシュ (未指定ならプロセス共有のもの)
+        self.cache = cache if cache is not None else get_default_cache()
+        # generate のプロンプトに載せるソースのトークン予算
+        self.context_builder = context_builder or ContextBuilder(model=model)
+        self.last_context_report: Optional[Dict] = None
+        self.last_usage: Dict = {}
+        self.last_refine_result: Optional[str] = None
+        self.last_refine_scope: Optional[List[str]] = None
+        # 別プロバイダーへのフェイルオーバー/ヘッジ設定
+        # hedge_after 秒以内に最初のトークンが来なければ fallback にも並行リクエストする (None ならエラー時のみ切り替え)
+        self.fallback = fallback
+        self.hedge_after = hedge_after
+        self.auto_primary = auto_primary
+        self.latency_tracker = latency_tracker or get_default_tracker()
+        self.last_provider: Optional[str] = None
+        # 呼び出しごとの計測。同じ run_id の記録が1回の台本生成としてまとめて集計される
+        self.metrics = metrics or get_default_recorder()
+        self.run_id = run_id or new_run_id()
+        # 単語を並べただけの入力は LLM を使わずに解析する
+        self.query_analyzer = query_analyzer
+        # プロバイダーごとの呼び出し制限 (バッチ生成で複数の生成器が共有する)
+        self.rate_limiter = rate_limiter
+        if self.fallback is not None:
+            self.fallback.metrics = self.metrics
+            self.fallback.run_id = self.run_id
+            if rate_limiter is not None:
+                self.fallback.rate_limiter = rate_limiter
+        # 事前要約 (map-reduce) の設定。summary_model を指定した場合のみ有効 ("auto" でプロバイダー既定の安価なモデル)
+        # ソースが summarize_min_tokens を超えたときだけ要約する (未指定ならコンテキスト予算)
+        self.summary_model = CHEAP_MODELS.get(self.provider, model) if summary_model == "auto" else summary_model
+        self.summary_concurrency = summary_concurrency
+        self.summarize_min_tokens = summarize_min_tokens if summarize_min_tokens is not None else self.context_builder.total_budget
+        self._summarizer: Optional[SourceSummarizer] = None
+        self.last_summary_report: Optional[Dict] = None
+        # 埋め込み検索による絞り込み。retrieval_top_k を指定した場合のみ、トピックに近い上位のチャンクだけを generate に渡す
+        self.retrieval_top_k = retrieval_top_k
+        self.embedder = embedder
+        self.last_retrieval_report: Optional[Dict] = None
+
         if self.provider == "openai":
-            return self._generate_openai(prompt)
+            if not self.api_key:
+                self.api_key = os.getenv("OPENAI_API_KEY")
+            if not self.api_key:
+                raise ValueError("OpenAI APIキーが提供されていません。")
+            self.client = get_openai_client(self.api_key)
         elif self.provider == "gemini":
-            return self._generate_gemini(prompt)
+            if not self.api_key:
+                self.api_key = os.getenv("GEMINI_API_KEY")
+            if not self.api_key:
+                raise ValueError("Gemini APIキーが提供されていません。")
+            self.client = get_gemini_model(self.api_key, self.model)
+        else:
+            raise ValueError(f"未知のプロバイダーです: {provider}")
+
+    def generate(self, topic: str, news_list: List[Dict], diet_speeches: List[Dict], law_data: List[Dict] = [], stats_summaries: List[str] = [], subsidy_data: List[Dict] = [], keywords: Optional[List[str]] = None) -> str:
+        """
+        情報を統合して台本を生成 (一次ソース対応版)
+        """
+        return "".join(self.generate_stream(topic, news_list, diet_speeches, law_data, stats_summaries, subsidy_data, keywords=keywords))
+
+    def generate_stream(self, topic: str, news_list: List[Dict], diet_speeches: List[Dict], law_data: List[Dict] = [], stats_summaries: List[str] = [], subsidy_data: List[Dict] = [], keywords: Optional[List[str]] = None,
+                        prepared: bool = False) -> Iterator[str]:
+        """
+        generate のストリーミング版。生成されたテキストを断片ごとに yield する。
+        スライド用JSONはストリーム完了後に extract_json_from_response で抽出すること。
+        :param prepared: ソースを retrieve_sources / summarize_sources で処理済みの場合は True (絞り込み・要約をし直さない)
+        """
+        if not prepared:
+            news_list, diet_speeches, law_data = self.retrieve_sources(topic, news_list, diet_speeches, law_data, keywords)
+            news_list, diet_speeches = self.summarize_sources(topic, news_list, diet_speeches)
+        prompt = self._build_generate_prompt(topic, news_list, diet_speeches, law_data, stats_summaries, subsidy_data, keywords)
+        return self._stream(prompt, operation="generate")
+
+    def retrieve_sources(self, topic: str, news_list: List[Dict], diet_speeches: List[Dict], law_data: List[Dict],
+                         keywords: Optional[List[str]] = None) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+        """
+        ソースをチャンクに分けて埋め込み、トピックに近い上位 retrieval_top_k 件ずつに絞り込んだ
+        (ニュース, 議事録, 法令) を返す。絞り込みが無効な場合はそのまま返す。
+        """
+        if not self.retrieval_top_k:
+            return news_list, diet_speeches, law_data
+        # 埋め込み (numpy) は絞り込みを使うときだけ読み込む
+        from source_index import retrieve_top_k
+        result = retrieve_top_k(topic, news_list, diet_speeches, law_data, keywords=keywords,
+                                top_k=self.retrieval_top_k, embedder=self.embedder)
+        self.last_retrieval_report = dict(result["report"], items_before=len(news_list) + len(diet_speeches) + len(law_data))
+        return result["news"], result["diet"], result["law"]
+
+    def summarize_sources(self, topic: str, news_list: List[Dict], diet_speeches: List[Dict], progress=None) -> Tuple[List[Dict], List[Dict]]:
+        """
+        ニュースと議事録が多い場合に、安価なモデルでチャンクごとに並行要約した (ニュース, 議事録) を返す。
+        事前要約が無効、またはソースが閾値以下の場合はそのまま返す。
+        :param progress: (完了チャンク数, 全チャンク数) を受け取るコールバック
+        """
+        if not self.summary_model:
+            return news_list, diet_speeches
+        summarizer = self._get_summarizer()
+        before = summarizer.source_tokens(news_list, diet_speeches)
+        if before <= self.summarize_min_tokens:
+            return news_list, diet_speeches
+
+        started = time.perf_counter()
+        digest_news, digest_speeches = summarizer.summarize(topic, news_list, diet_speeches, progress=progress)
+        self.last_summary_report = {
+            "model": self.summary_model,
+            "items_before": len(news_list) + len(diet_speeches),
+            "items_after": len(digest_news) + len(digest_speeches),
+            "tokens_before": before,
+            "tokens_after": summarizer.source_tokens(digest_news, digest_speeches),
+            "elapsed": time.perf_counter() - started,
+        }
+        return digest_news, digest_speeches
+
+    def _get_summarizer(self) -> SourceSummarizer:
+        if self._summarizer is None:
+            worker = self if self.summary_model == self.model else ScriptGenerator(
+                self.provider, self.api_key, model=self.summary_model, cache=self.cache,
+                fallback=self.fallback, latency_tracker=self.latency_tracker,
+                metrics=self.metrics, run_id=self.run_id, rate_limiter=self.rate_limiter
+            )
+            self._summarizer = SourceSummarizer(worker, max_concurrency=self.summary_concurrency)
+        return self._summarizer
+
+    def _build_generate_prompt(self, topic: str, news_list: List[Dict], diet_speeches: List[Dict], law_data: List[Dict], stats_summaries: List[str], subsidy_data: List[Dict], keywords: Optional[List[str]] = None) -> str:
+        """
+        generate / generate_stream 共通のプロンプトを組み立てる
+        """
+        # ソース別の予算内で価値の高い項目から詰める (除外内訳は last_context_report に残す)
+        context = self.context_builder.build(topic, news_list, diet_speeches, law_data, stats_summaries, subsidy_data, keywords=keywords)
+        self.last_context_report = context["report"]
+        news_context = context["news"]
+        diet_context = context["diet"]
+        law_context = context["law"]
+        stats_context = context["stats"]
+        subsidy_context = context["subsidy"]
+
+        today_str = datetime.now().strftime("%Y年%m月%d日")
+        
+        # 検索結果が空の場合のメッセージ
+        if not news_list and not diet_speeches and not law_context:
+            data_status = f"【警告】指定されたキーワード「{topic}」に関する最新情報（ニュース・国会・法令）は見つかりませんでした。"
+        else:
+            data_status = f"以下に、最新（{today_str}時点）の多角的な情報を集約しました。"
+
+        # 固定の指示 (GENERATE_INSTRUCTIONS) を先頭に置き、リクエストごとのデータは末尾に連結する
+        prompt = GENERATE_INSTRUCTIONS + f"""
+【参照データ】
+トピック: {topic}
+日付: {today_str}
+{data_status}
+
+[1. 一次ソース（法令・公的データ）]
+{law_context if law_context else "（特になし）"}
+
+[2. 一次ソース（統計・数字）]
+{stats_context if stats_context else "（特になし）"}
+
+[3. 一次ソース（国会議事録）]
+{diet_context if diet_context else "（直近の審議記録なし）"}
+
+[4. 二次ソース（最新ニュース）]
+{news_context}
+
+[5. お役立ち情報（関連補助金・助成金）]
+{subsidy_context if subsidy_context else "（関連する公募中の補助金情報なし）"}
+"""
+        return prompt
+
+    def refine(self, current_script: str, instruction: str, scoped: bool = True) -> str:
+        """
+        既存の台本に対して、ユーザーの追加指示を反映して再構成する
+        scoped=True の場合、指示が特定のセクションだけに関わるときはそのセクションと関連スライドのみを再生成する
+        """
+        response_text = "".join(self.refine_stream(current_script, instruction, scoped=scoped))
+        # セクション単位の結果を差し戻しできなかった場合は応答をそのまま返す
+        return self.last_refine_result if self.last_refine_result is not None else response_text
+
+    def refine_stream(self, current_script: str, instruction: str, scoped: bool = True) -> Iterator[str]:
+        """
+        refine のストリーミング版。再構成されたテキストを断片ごとに yield する。
+        ストリーム完了後、差し戻し済みの台本全体が last_refine_result に入る
+        (セクション単位の結果を反映できなかった場合は None)。
+        """
+        self.last_refine_result = None
+        plan = self._plan_section_refine(current_script, instruction) if scoped else None
+        if plan is None:
+            self.last_refine_scope = None
+            prompt = self._build_refine_prompt(current_script, instruction)
+        else:
+            self.last_refine_scope = [plan["parsed"]["sections"][i]["title"] for i in plan["targets"]]
+            prompt = self._build_section_refine_prompt(plan, instruction)
+        return self._collect_refine(self._stream(prompt, operation="refine"), plan)
+
+    def _plan_section_refine(self, current_script: str, instruction: str) -> Optional[Dict]:
+        """
+        指示が対象とするセクションを特定する。全体の再構成が必要なら None
+        """
+        parsed = split_script(current_script)
+        targets = select_target_sections(parsed, instruction)
+        if targets is None:
+            return None
+        return {"parsed": parsed, "targets": targets, "slides": self.extract_json_from_response(current_script)}
+
+    def _collect_refine(self, chunks: Iterator[str], plan: Optional[Dict]) -> Iterator[str]:
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+        text = "".join(parts)
+        if plan is None:
+            self.last_refine_result = text
+        else:
+            self.last_refine_result = apply_section_response(plan["parsed"], plan["targets"], plan["slides"], text)
+
+    def _build_section_refine_prompt(self, plan: Dict, instruction: str) -> str:
+        """
+        対象セクションと現在のスライド構成だけを送るプロンプトを組み立てる
+        """
+        slides_json = json.dumps({str(i): s for i, s in enumerate(plan["slides"])}, ensure_ascii=False)
+        prompt = SECTION_REFINE_INSTRUCTIONS + f"""
+【書き直すセクション】
+{format_section_payload(plan["parsed"], plan["targets"])}
+【現在のスライド構成（スライド番号: スライド）】
+```json
+{slides_json}
+```
+
+【ユーザーの追加指示】:
+{instruction}
+"""
+        return prompt
+
+    def _build_refine_prompt(self, current_script: str, instruction: str) -> str:
+        """
+        refine / refine_stream 共通のプロンプトを組み立てる
+        """
+        prompt = REFINE_INSTRUCTIONS + f"""
+【現在の台本】:
+{current_script}
+
+【ユーザーの追加指示】:
+{instruction}
+"""
+        return prompt
+
+    def _stream(self, prompt: str, operation: str = "stream") -> Iterator[str]:
+        """
+        フェイルオーバー/ヘッジ付きでストリーミングする
+        すべて失敗した場合や、採用したプロバイダーが途中で失敗した場合は RuntimeError を送出する
+        (エラーメッセージを台本の続きとして返すと、途中までの台本と一緒に保存・再構成されてしまうため)。
+        """
+        candidates = [self] + ([self.fallback] if self.fallback else [])
+        if len(candidates) > 1 and self.auto_primary:
+            # 直近の「最初のトークンまでの時間」が速いプロバイダーを主系にする
+            order = self.latency_tracker.rank([g.provider for g in candidates])
+            candidates.sort(key=lambda g: order.index(g.provider))
+        by_name = {g.provider: g for g in candidates}
+        self.last_provider = None
+
+        def on_winner(name: str):
+            self.last_provider = name
 
-    def _generate_openai(self, prompt: str) -> str:
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "あなたは公明党の国会議員として行動する広報担当AIです。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7
+            yield from hedged_stream(
+                [(g.provider, (lambda token, g=g: g._raw_stream(prompt, operation, cancel=token))) for g in candidates],
+                hedge_after=self.hedge_after,
+                tracker=self.latency_tracker,
+                on_winner=on_winner
             )
-            return response.choices[0].message.content
+            if self.last_provider in by_name and by_name[self.last_provider] is not self:
+                self.last_usage = by_name[self.last_provider].last_usage
         except Exception as e:
-            return f"OpenAIによる台本生成中にエラーが発生しました: {e}"
+            label = "OpenAI" if self.provider == "openai" else "Gemini"
+            raise RuntimeError(f"{label}による台本生成中にエラーが発生しました: {e}") from e
 
-    def _generate_gemini(self, prompt: str) -> str:
+    def _raw_stream(self, prompt: str, operation: str = "stream", cancel: Optional[CancelToken] = None) -> Iterator[str]:
+        """
+        1プロバイダーへのストリーミング呼び出しを計測付きで行う
+        cancel で打ち切られた場合は、応答を待っている途中でも呼び出し枠をすぐに返し、計測を「打ち切り」として閉じる。
+        """
+        cancelled = cancel.is_set if cancel is not None else None
+        release = self.rate_limiter.acquire(self.provider, cancelled=cancelled) if self.rate_limiter is not None else (lambda: None)
+        if release is None:
+            # 枠を待っている間に打ち切られた
+            return
+        call, finish = self.metrics.begin(operation, self.provider, self.model, run_id=self.run_id)
+
+        def abandon():
+            release()
+            finish("cancelled")
+
+        if cancel is not None:
+            cancel.on_cancel(abandon)
         try:
-            # Geminiは system_instruction を使うか、プロンプトに含める
-            response = self.client.generate_content(prompt)
-            return response.text
+            if cancel is not None and cancel.is_set():
+                return
+            stream = self._raw_stream_openai(prompt, cancel) if self.provider == "openai" else self._raw_stream_gemini(prompt, cancel)
+            yield from stream
+            call.update({k: v for k, v in self.last_usage.items() if k != "elapsed"})
+        except GeneratorExit:
+            finish("cancelled")
+            raise
         except Exception as e:
-            return f"Geminiによる台本生成中にエラーが発生しました: {e}"
+            finish("error", f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            release()
+            finish()
+
+    def _raw_stream_openai(self, prompt: str, cancel: Optional[CancelToken] = None) -> Iterator[str]:
+        started = time.perf_counter()
+        first_token_at = None
+        usage = {}
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.7,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        if cancel is not None and hasattr(stream, "close"):
+            # 次のチャンクを待っている途中で打ち切られた場合も、打ち切った側のスレッドで接続を閉じる
+            cancel.on_cancel(stream.close)
+        try:
+            for chunk in stream:
+                # include_usage 指定時は、最後のチャンク (choices が空) に usage が入る
+                if getattr(chunk, "usage", None):
+                    usage = self._openai_usage(chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    yield chunk.choices[0].delta.content
+        finally:
+            # 打ち切られた場合も接続を閉じ、残りの応答を受信し続けないようにする
+            if hasattr(stream, "close"):
+                stream.close()
+        self._record_usage(usage, started, first_token_at)
+
+    def _raw_stream_gemini(self, prompt: str, cancel: Optional[CancelToken] = None) -> Iterator[str]:
+        # Geminiは system_instruction を使うか、プロンプトに含める
+        started = time.perf_counter()
+        first_token_at = None
+        usage = {}
+        response = self.client.generate_content(prompt, stream=True)
+        if cancel is not None:
+            # 打ち切られたら打ち切った側のスレッドで応答のストリームを閉じる (既に打ち切られていればすぐに閉じる)
+            cancel.on_cancel(lambda: self._close_gemini_stream(response))
+        try:
+            for chunk in response:
+                if getattr(chunk, "usage_metadata", None):
+                    usage = self._gemini_usage(chunk)
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # セーフティフィルタ等でパーツが空のチャンクは読み飛ばす
+                    continue
+                if text:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    yield text
+        finally:
+            # 途中で手放された場合も、残りの応答を受信し続けないようにする
+            self._close_gemini_stream(response)
+        self._record_usage(usage, started, first_token_at)
+
+    @staticmethod
+    def _close_gemini_stream(response):
+        """
+        ストリーミング応答の受信を止める
+        GenerateContentResponse 自体には close が無いため、内側のイテレーター
+        (gRPC なら cancel、REST なら close を持つ) を閉じる。
+        """
+        iterator = getattr(response, "_iterator", None)
+        for target in (iterator, response):
+            for name in ("cancel", "close"):
+                method = getattr(target, name, None)
+                if callable(method):
+                    try:
+                        method()
+                    except Exception as e:
+                        print(f"Error closing Gemini stream: {e}")
+                    return
+
+    @staticmethod
+    def _openai_usage(usage) -> Dict:
+        if usage is None:
+            return {}
+        details = getattr(usage, "prompt_tokens_details", None)
+        return {
+            "input_tokens": usage.prompt_tokens,
+            "output_tokens": usage.completion_tokens,
+            "cached_tokens": getattr(details, "cached_tokens", 0) or 0,
+        }
+
+    @staticmethod
+    def _gemini_usage(response) -> Dict:
+        meta = getattr(response, "usage_metadata", None)
+        if meta is None:
+            return {}
+        return {
+            "input_tokens": getattr(meta, "prompt_token_count", 0) or 0,
+            "output_tokens": getattr(meta, "candidates_token_count", 0) or 0,
+            "cached_tokens": getattr(meta, "cached_content_token_count", 0) or 0,
+        }
+
+    def _record_usage(self, usage: Dict, started: float, first_token_at: Optional[float] = None):
+        """
+        直近の台本生成・再構成のトークン数 (キャッシュ済み入力を含む) と所要時間を記録する
+        """
+        finished = time.perf_counter()
+        self.last_usage = dict(usage)
+        self.last_usage["elapsed"] = finished - started
+        self.last_usage["ttft"] = (first_token_at - started) if first_token_at else None
+
+    def _complete(self, prompt: str, temperature: float, json_mode: bool = False, operation: str = "complete") -> str:
+        """
+        補助的な単発呼び出し (エラーは呼び出し元で処理する)
+        """
+        with self._rate_slot(), self.metrics.track(operation, self.provider, self.model, run_id=self.run_id) as call:
+            if self.provider == "openai":
+                options = {"response_format": {"type": "json_object"}} if json_mode else {}
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=temperature,
+                    **options
+                )
+                call.update(self._openai_usage(getattr(response, "usage", None)))
+                return response.choices[0].message.content
+            else: # Gemini
+                if json_mode:
+                    prompt += "\nJSONのみで出力してください。"
+                response = self.client.generate_content(prompt, generation_config={"temperature": temperature})
+                call.update(self._gemini_usage(response))
+                return response.text
 
-    def extract_json_from_response(self, text: str) -> List[Dict]:
+    def _rate_slot(self):
+        # 制限が無い場合は何もしないコンテキスト
+        return self.rate_limiter.slot(self.provider) if self.rate_limiter is not None else nullcontext()
+
+    def _cached_complete(self, prompt: str, temperature: float, json_mode: bool = False, operation: str = "complete") -> str:
+        """
+        _complete の結果をディスクキャッシュ経由で返す
+        """
+        key = LLMCache.make_key(self.provider, self.model, prompt, temperature, json_mode=json_mode)
+        cached = self.cache.get(key)
+        if cached is not None:
+            with self.metrics.track(operation, self.provider, self.model, run_id=self.run_id) as call:
+                call["status"] = "cache_hit"
+            return cached
+        try:
+            text = self._complete(prompt, temperature, json_mode=json_mode, operation=operation)
+        except Exception as e:
+            if self.fallback is None:
+                raise
+            print(f"{self.provider} failed ({e}), falling back to {self.fallback.provider}")
+            return self.fallback._cached_complete(prompt, temperature, json_mode=json_mode, operation=operation)
+        self.cache.set(key, text)
+        return text
+
+    @staticmethod
+    def extract_json_from_response(text: str) -> List[Dict]:
         """
         レスポンスからJSONブロックを抽出する
         """
@@ -242,17 +634,7 @@ JSONには `visual_logic` (図解・イラスト指定) も含めてください
         - 出力はカンマ区切りでキーワードのみを返してください。例: 消費者物価指数, 実質賃金, 完全失業率
         """
         try:
-            if self.provider == "openai":
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.5
-                )
-                tags = response.choices[0].message.content.strip().split(",")
-            else:
-                response = self.client.generate_content(prompt)
-                tags = response.text.strip().split(",")
-            
+            tags = self._cached_complete(prompt, temperature=0.5, operation="suggest_indicators").strip().split(",")
             return [t.strip() for t in tags if t.strip()][:4]
         except Exception as e:
             print(f"Error suggesting indicators: {e}")
@@ -262,7 +644,13 @@ JSONには `visual_logic` (図解・イラスト指定) も含めてください
         """
         ユーザーの自然言語入力から、検索エンジン（ニュース・国会・法令・統計）に渡すべき
         最適な「検索キーワード」と「期間（日数）」を抽出する
+        「国保」「防衛費 直近1ヶ月」のような単語の入力はルールで解析し、文章の場合のみ LLM を呼ぶ
         """
+        analyzer = self.query_analyzer or get_default_analyzer()
+        local = analyzer.analyze(user_input)
+        if local is not None:
+            return local
+
         prompt = f"""
         ユーザーの入力から、各ソースに合わせた「ヒット率重視」のキーワードを抽出してください。
 
@@ -280,26 +668,16 @@ JSONには `visual_logic` (図解・イラスト指定) も含めてください
         - ニュース・国会: 具体的で最近の報道で使われそうなワード。
         """
         try:
-            if self.provider == "openai":
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[{"role": "user", "content": prompt}],
-                    response_format={"type": "json_object"},
-                    temperature=0.3
-                )
-                return json.loads(response.choices[0].message.content)
-            else: # Gemini
-                response = self.client.generate_content(prompt + "\nJSONのみで出力してください。")
-                text = response.text
-                match = re.search(r"\{.*\}", text, re.DOTALL)
-                if match:
-                    res = json.loads(match.group(0))
-                else:
-                    res = json.loads(text)
-                
-                # 法令キーワードが不足している場合の補完
-                if "law_keywords" not in res: res["law_keywords"] = res.get("keywords", [user_input])
-                return res
+            text = self._cached_complete(prompt, temperature=0.3, json_mode=True, operation="analyze_query")
+            match = re.search(r"\{.*\}", text, re.DOTALL)
+            if match:
+                res = json.loads(match.group(0))
+            else:
+                res = json.loads(text)
+            
+            # 法令キーワードが不足している場合の補完
+            if "law_keywords" not in res: res["law_keywords"] = res.get("keywords", [user_input])
+            return res
 
         except Exception as e:
             print(f"Error analyzing query: {e}")
@@ -309,43 +687,46 @@ JSONには `visual_logic` (図解・イラスト指定) も含めてください
                 "days": None
             }
 
-    def extract_keyword_tags(self, headlines: List[str]) -> List[str]:
+    def extract_keyword_tags(self, headlines: List[str], rerank: bool = False) -> List[str]:
         """
         大量の見出しから、今注目すべき政治キーワードを5〜6個抽出する
+        候補の抽出はローカル (TrendExtractor) で行い、rerank=True の場合のみ LLM で候補を選び直す
         """
         if not headlines:
             return []
 
+        candidates = get_default_extractor().extract(headlines, top_n=12 if rerank else 6)
+        if not rerank or not candidates:
+            return candidates[:6]
+
         headlines_str = "\n".join(headlines)
+        candidates_str = ", ".join(candidates)
         prompt = f"""
-以下の最新ニュースの見出しリストから、現在注目されている具体的な政治キーワード（議題）を5〜6個抽出してください。
+以下の最新ニュースの見出しリストと、そこから機械的に抽出したキーワード候補があります。
+候補の中から、現在注目されている具体的な政治キーワード（議題）を5〜6個選び、注目度の高い順に並べてください。
 ニュース解説動画のネタとして適切な、具体的で検索されやすいワードを選んでください。
 
 【制約事項】:
-- キーワードは短く（2〜10文字程度）。
+- 候補の語が途中で切れている場合は、見出しに合わせて補ってよい（例: 国保逃 → 国保逃れ）。
 - 重複を避け、バリエーション豊かなキーワードにすること。
 - 出力はカンマ区切りでキーワードのみを返してください。
 
+【キーワード候補】:
+{candidates_str}
+
 【見出しリスト】:
 {headlines_str}
 """
         try:
-            if self.provider == "openai":
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.7
-                )
-                tags = response.choices[0].message.content.strip().split(",")
-            else: # Assuming self.provider == "gemini"
-                response = self.client.generate_content(prompt)
-                tags = response.text.strip().split(",")
+            tags = self._cached_complete(prompt, temperature=0.3, operation="extract_keyword_tags").strip().split(",")
             
             # クリーニング (余計な空白を消すなど)
-            return [t.strip().replace("「", "").replace("」", "") for t in tags if t.strip()][:6]
+            tags = [t.strip().replace("「", "").replace("」", "") for t in tags if t.strip()]
+            tags = [t for t in tags if 2 <= len(t) <= 15 and not re.search(r"[{}\[\]\"]", t)][:6]
+            return tags or candidates[:6]
         except Exception as e:
-            print(f"Error extracting tags: {e}")
-            return []
+            print(f"Error reranking tags: {e}")
+            return candidates[:6]
 
 if __name__ == "__main__":
     # テスト
@@ -0,0 +1,122 @@
+"""
+台本の改訂履歴
+
+生成・再構成・復元のたびに1版を追加する。最新版の本文はプロジェクトの script そのものとし、
+それより前の版は「1つ新しい版からの差分」(行単位) だけを持つ。
+差分は [開始行, 終了行] (新しい版の行をそのまま使う) と文字列 (差し替える内容) の並びで、
+20回再構成しても増えるのは書き換えた部分だけになる。
+
+例:
+    revisions = add_revision([], "", generated, "generate", provider="OpenAI", model="gpt-4o")
+    revisions = add_revision(revisions, generated, refined, "refine", instruction="もっと具体的に", ...)
+    revision_text(revisions, refined, 0)  # -> generated
+"""
+import datetime
+import difflib
+from typing import Dict, List, Optional, Union
+
+# 表示用の種別名
+KIND_LABELS = {"generate": "生成", "refine": "再構成", "restore": "復元"}
+
+Delta = List[Union[List[int], str]]
+
+def make_delta(base: str, target: str) -> Delta:
+    """
+    base から target を作るための差分
+    """
+    base_lines = base.splitlines(keepends=True)
+    target_lines = target.splitlines(keepends=True)
+    delta: Delta = []
+    matcher = difflib.SequenceMatcher(None, base_lines, target_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            delta.append([i1, i2])
+        elif j2 > j1:
+            # replace / insert は新しい内容を文字列で持つ (delete は何も書かない)
+            text = "".join(target_lines[j1:j2])
+            if delta and isinstance(delta[-1], str):
+                delta[-1] += text
+            else:
+                delta.append(text)
+    return delta
+
+def apply_delta(base: str, delta: Delta) -> str:
+    """
+    make_delta で作った差分を base に適用する
+    """
+    base_lines = base.splitlines(keepends=True)
+    parts = []
+    for op in delta:
+        if isinstance(op, str):
+            parts.append(op)
+        else:
+            parts.extend(base_lines[op[0]:op[1]])
+    return "".join(parts)
+
+def new_revision(kind: str, instruction: Optional[str] = None, provider: Optional[str] = None,
+                 model: Optional[str] = None, scope: Optional[List[str]] = None,
+                 restored_from: Optional[int] = None) -> Dict:
+    """
+    1版分のメタデータ (本文・差分は含まない)
+    :param kind: "generate" / "refine" / "restore"
+    :param scope: セクション単位で再構成した場合の対象セクション
+    :param restored_from: 復元の場合、元にした版の番号 (0始まり)
+    """
+    revision = {"kind": kind, "timestamp": datetime.datetime.now().isoformat(timespec="seconds")}
+    for key, value in (("instruction", instruction), ("provider", provider), ("model", model), ("scope", scope)):
+        if value:
+            revision[key] = value
+    if restored_from is not None:
+        revision["restored_from"] = restored_from
+    return revision
+
+def add_revision(revisions: List[Dict], head_text: str, new_text: str, kind: str, **meta) -> List[Dict]:
+    """
+    new_text を最新版として追加した履歴を返す (元のリストは変更しない)
+    :param head_text: これまでの最新版の本文 (履歴が空なら使わない)
+    :param meta: new_revision に渡す項目 (instruction, provider, model, scope, restored_from)
+    """
+    revisions = list(revisions or [])
+    if revisions:
+        # これまでの最新版は、新しい最新版からの差分として持つ
+        previous = dict(revisions[-1])
+        previous["delta"] = make_delta(new_text, head_text)
+        revisions[-1] = previous
+    revision = new_revision(kind, **meta)
+    revision["chars"] = len(new_text)
+    revisions.append(revision)
+    return revisions
+
+def revision_text(revisions: List[Dict], head_text: str, index: int) -> str:
+    """
+    index 番目 (0始まり、負の値は末尾から) の版の本文を復元する
+    :param head_text: 最新版の本文
+    """
+    if not revisions:
+        return head_text
+    index = index % len(revisions)
+    text = head_text
+    # 最新版から1版ずつさかのぼる
+    for revision in reversed(revisions[index:-1]):
+        text = apply_delta(text, revision["delta"])
+    return text
+
+def revision_label(revisions: List[Dict], index: int) -> str:
+    """
+    履歴の一覧に表示する1行
+    """
+    revision = revisions[index]
+    label = f"第{index + 1}版 {KIND_LABELS.get(revision.get('kind'), revision.get('kind', ''))}"
+    time = revision.get("timestamp", "").replace("T", " ")[5:16]
+    if time:
+        label += f" ({time})"
+    if revision.get("model"):
+        label += f" {revision['model']}"
+    if revision.get("restored_from") is not None:
+        label += f" ← 第{revision['restored_from'] + 1}版"
+    if revision.get("instruction"):
+        instruction = revision["instruction"]
+        label += f"「{instruction[:30]}{'…' if len(instruction) > 30 else ''}」"
+    if index == len(revisions) - 1:
+        label += " [現在]"
+    return label
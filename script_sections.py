@@ -0,0 +1,171 @@
+import json
+import re
+from typing import List, Dict, Optional
+
+# 指示文に含まれる語 → そのグループに属するセクションの見出し語
+SECTION_ALIASES = [
+    ["タイトル", "見出し", "ヘッドライン", "キャプション"],
+    ["導入", "冒頭", "挨拶", "オープニング", "つかみ", "共感"],
+    ["本題", "柱", "ポイント", "要点", "本質"],
+    ["裏付け", "根拠", "出典", "信頼", "統計", "数字", "データ"],
+    ["国会", "議論", "論点", "答弁", "政局"],
+    ["展望", "今後", "注目点", "スケジュール", "約束", "これから"],
+    ["お役立ち", "補助金", "助成金", "締切"],
+]
+
+# 台本全体に関わる指示 (部分的な再構成では対応できない)
+GLOBAL_INSTRUCTION_WORDS = ["全体", "全て", "すべて", "全部", "トーン", "口調", "文体", "構成を", "一から", "作り直"]
+
+# スライド用JSONの直前に置かれる見出し
+TRAILER_HEADING_WORDS = ["JSON", "構成案", "構成データ", "プレゼン", "スライド"]
+
+_MD_HEADING = re.compile(r"^(#{1,4})\s+\S")
+_BOLD_NUMBERED_HEADING = re.compile(r"^\*\*\s*[0-9０-９]+[\.．]\s*.+\*\*\s*$")
+_JSON_FENCE = re.compile(r"```json.*?```", re.DOTALL)
+
+def split_script(raw_script: str) -> Dict:
+    """
+    台本を「前置き」「見出しごとのセクション」「スライド用JSONを含む末尾」に分割する
+    :return: {"preamble": str, "sections": [{"title": str, "text": str}], "trailer": str}
+    """
+    fence = _JSON_FENCE.search(raw_script)
+    body = raw_script[:fence.start()] if fence else raw_script
+    trailer = raw_script[fence.start():] if fence else ""
+
+    lines = body.splitlines(keepends=True)
+    # JSON直前の「プレゼン資料構成案」などの見出しは末尾側に含める
+    if fence:
+        trailer_start = _find_trailer_heading(lines)
+        if trailer_start is not None:
+            trailer = "".join(lines[trailer_start:]) + trailer
+            lines = lines[:trailer_start]
+    heading_indices = _find_heading_lines(lines)
+
+    if not heading_indices:
+        return {"preamble": "".join(lines), "sections": [], "trailer": trailer}
+
+    sections = []
+    for n, start in enumerate(heading_indices):
+        end = heading_indices[n + 1] if n + 1 < len(heading_indices) else len(lines)
+        sections.append({
+            "title": _heading_title(lines[start]),
+            "text": "".join(lines[start:end]),
+        })
+    return {
+        "preamble": "".join(lines[:heading_indices[0]]),
+        "sections": sections,
+        "trailer": trailer,
+    }
+
+def join_script(parsed: Dict) -> str:
+    """
+    split_script の結果を1つの台本に戻す
+    """
+    return parsed["preamble"] + "".join(s["text"] for s in parsed["sections"]) + parsed["trailer"]
+
+def select_target_sections(parsed: Dict, instruction: str, max_ratio: float = 0.6) -> Optional[List[int]]:
+    """
+    指示が対象とするセクションの番号を返す。
+    台本全体に関わる指示や、対象を特定できない場合は None (全体を再構成する)
+    """
+    sections = parsed["sections"]
+    if len(sections) < 2 or any(w in instruction for w in GLOBAL_INSTRUCTION_WORDS):
+        return None
+
+    targets = set()
+    for i, section in enumerate(sections):
+        title = section["title"]
+        # 見出しの語句がそのまま指示に含まれている (例: 『信頼性チェック』セクションに反映)
+        segments = [s for s in re.split(r"[\s【】「」『』（）()：:・、。,\-－―~〜]+", title) if len(s) >= 2]
+        if any(seg in instruction for seg in segments):
+            targets.add(i)
+            continue
+        for aliases in SECTION_ALIASES:
+            if any(a in instruction for a in aliases) and any(a in title for a in aliases):
+                targets.add(i)
+                break
+
+    if not targets or len(targets) > len(sections) * max_ratio:
+        return None
+    return sorted(targets)
+
+def parse_section_response(text: str) -> Dict:
+    """
+    セクション単位の再構成結果を解析する
+    :return: {"sections": {番号: 本文}, "slides": {番号: スライド}}
+    """
+    result = {"sections": {}, "slides": {}}
+    for match in re.finditer(r"<<<SECTION (\d+)>>>\s*\n(.*?)(?=<<<SECTION \d+>>>|<<<SLIDES>>>|\Z)", text, re.DOTALL):
+        result["sections"][int(match.group(1))] = match.group(2).strip("\n") + "\n\n"
+
+    slides_part = text.split("<<<SLIDES>>>", 1)[1] if "<<<SLIDES>>>" in text else ""
+    if slides_part:
+        match = re.search(r"```json(.*?)```", slides_part, re.DOTALL) or re.search(r"(\{.*\})", slides_part, re.DOTALL)
+        if match:
+            try:
+                slides = json.loads(match.group(1).strip())
+                if isinstance(slides, dict):
+                    result["slides"] = {int(k): v for k, v in slides.items() if str(k).isdigit() and isinstance(v, dict)}
+            except Exception as e:
+                print(f"Error parsing section slides: {e}")
+    return result
+
+def apply_section_response(parsed: Dict, targets: List[int], slides_data: List[Dict], response_text: str) -> Optional[str]:
+    """
+    再構成されたセクションと変更されたスライドだけを元の台本に差し戻す。
+    対象セクションが1つも返ってこなかった場合は None
+    """
+    response = parse_section_response(response_text)
+    updated = {i: t for i, t in response["sections"].items() if i in targets}
+    if not updated:
+        return None
+
+    sections = [dict(s) for s in parsed["sections"]]
+    for i, text in updated.items():
+        sections[i]["text"] = text
+
+    new_slides = [dict(s) for s in slides_data]
+    for i, slide in response["slides"].items():
+        if 0 <= i < len(new_slides):
+            new_slides[i] = slide
+
+    trailer = parsed["trailer"]
+    if new_slides:
+        slides_block = "```json\n" + json.dumps(new_slides, ensure_ascii=False, indent=2) + "\n```"
+        if _JSON_FENCE.search(trailer):
+            trailer = _JSON_FENCE.sub(lambda _: slides_block, trailer, count=1)
+        else:
+            trailer = trailer + "\n\n" + slides_block
+
+    return join_script({"preamble": parsed["preamble"], "sections": sections, "trailer": trailer})
+
+def format_section_payload(parsed: Dict, targets: List[int]) -> str:
+    """
+    再構成対象のセクションだけをプロンプト用に整形する
+    """
+    return "\n".join(f"<<<SECTION {i}>>>\n{parsed['sections'][i]['text'].strip()}\n" for i in targets)
+
+def _find_heading_lines(lines: List[str]) -> List[int]:
+    # Markdown見出しは最も浅いレベルのものを区切りとし、無ければ「**1. 導入**」形式の太字見出しを使う
+    md = [(i, len(m.group(1))) for i, line in enumerate(lines) if (m := _MD_HEADING.match(line.strip()))]
+    if md:
+        for level in sorted({lv for _, lv in md}):
+            indices = [i for i, lv in md if lv == level]
+            if len(indices) >= 2:
+                return indices
+    return [i for i, line in enumerate(lines) if _BOLD_NUMBERED_HEADING.match(line.strip())]
+
+def _find_trailer_heading(lines: List[str]) -> Optional[int]:
+    # 末尾から遡り、空行・区切り線以外で最初に現れる行がJSON用の見出しであればその位置を返す
+    for i in range(len(lines) - 1, -1, -1):
+        line = lines[i].strip()
+        if not line or set(line) <= set("-－―*"):
+            continue
+        is_heading = _MD_HEADING.match(line) or (line.startswith("**") and line.endswith("**"))
+        if is_heading and any(w in line for w in TRAILER_HEADING_WORDS):
+            return i
+        return None
+    return None
+
+def _heading_title(line: str) -> str:
+    return line.strip().lstrip("#").strip().strip("*").strip()
@@ -0,0 +1,215 @@
+import re
+import time
+import unicodedata
+import zlib
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# 1チャンクあたりの最大文字数 (議事録・長い記事はこの長さで分割する)
+DEFAULT_CHUNK_CHARS = 500
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return re.sub(r"\s+", "", text)
+
+def _char_ngrams(text: str, ngram_range=(2, 3)) -> List[str]:
+    # 日本語は分かち書きせず、文字 n-gram を特徴量にする
+    text = _normalize(text)
+    grams = []
+    for n in range(ngram_range[0], ngram_range[1] + 1):
+        grams.extend(text[i:i + n] for i in range(len(text) - n + 1))
+    return grams
+
+class HashingEmbedder:
+    """
+    文字 n-gram をハッシュで固定次元に落とすローカル埋め込み (学習不要・API不要)
+    """
+    def __init__(self, dim: int = 4096, ngram_range=(2, 3)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for gram in _char_ngrams(text, self.ngram_range):
+                h = zlib.crc32(gram.encode("utf-8"))
+                # 符号もハッシュで決めて衝突の偏りを打ち消す
+                matrix[row, h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+        # 出現回数は対数で緩める
+        return np.sign(matrix) * np.log1p(np.abs(matrix))
+
+class TfidfEmbedder(HashingEmbedder):
+    """
+    HashingEmbedder の各次元を、収集したソース全体での IDF で重み付けした埋め込み
+    fit() で渡したコーパスに多く現れる n-gram (「について」「政府」など) の影響が小さくなる。
+    fit() は IDF を持つ新しい埋め込みを返し、自身は変更しない (複数のスレッドで共有した埋め込みで
+    別々のコーパスの IDF が混ざらないように)。
+    """
+    def __init__(self, dim: int = 4096, ngram_range=(2, 3)):
+        super().__init__(dim, ngram_range)
+        self.idf: Optional[np.ndarray] = None
+
+    def fit(self, texts: List[str]) -> "TfidfEmbedder":
+        counts = np.abs(HashingEmbedder.embed(self, texts)) > 0
+        df = counts.sum(axis=0)
+        fitted = TfidfEmbedder(self.dim, self.ngram_range)
+        fitted.idf = (np.log((1 + len(texts)) / (1 + df)) + 1).astype(np.float32)
+        return fitted
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        matrix = super().embed(texts)
+        return matrix * self.idf if self.idf is not None else matrix
+
+class OpenAIEmbedder:
+    """
+    OpenAI の Embeddings API を使う埋め込み
+    """
+    def __init__(self, api_key: str, model: str = "text-embedding-3-small", batch_size: int = 100):
+        from llm_clients import get_openai_client
+        self.client = get_openai_client(api_key)
+        self.model = model
+        self.batch_size = batch_size
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = []
+        for i in range(0, len(texts), self.batch_size):
+            batch = [t or " " for t in texts[i:i + self.batch_size]]
+            response = self.client.embeddings.create(model=self.model, input=batch)
+            vectors.extend(d.embedding for d in sorted(response.data, key=lambda d: d.index))
+        return np.asarray(vectors, dtype=np.float32)
+
+class SourceIndex:
+    """
+    収集したニュース・議事録・法令をチャンクに分けて埋め込み、
+    トピックとのコサイン類似度で上位のチャンクを取り出すための索引
+    """
+    def __init__(self, embedder=None, chunk_chars: int = DEFAULT_CHUNK_CHARS):
+        self.embedder = embedder or TfidfEmbedder()
+        self.chunk_chars = chunk_chars
+        self.entries: List[Dict] = []
+        self.matrix: Optional[np.ndarray] = None
+
+    def add_sources(self, news_list: List[Dict] = [], diet_speeches: List[Dict] = [], law_data: List[Dict] = []):
+        """
+        ソースをチャンクに分けて登録する (検索前に build() を呼ぶこと)
+        """
+        for n in news_list:
+            # 公明新聞の本文など長い記事は分割する
+            for i, part in enumerate(self._split(n.get("summary") or "")):
+                chunk = dict(n, summary=part)
+                if i:
+                    chunk["title"] = f"{n.get('title')} (続き{i})"
+                self._add("news", chunk, f"{n.get('title')}\n{part}")
+        for s in diet_speeches:
+            for part in self._split(s.get("speech") or ""):
+                self._add("diet", dict(s, speech=part), part)
+        for law in law_data:
+            snippets = law.get("snippets") or []
+            if not snippets:
+                self._add("law", dict(law), law.get("title") or "")
+            for snippet in snippets:
+                self._add("law", dict(law, snippets=[snippet]), f"{law.get('title')}\n{snippet}")
+        self.matrix = None
+
+    def build(self):
+        """
+        登録済みチャンクを埋め込み、正規化した行列を作る
+        """
+        texts = [e["text"] for e in self.entries]
+        if hasattr(self.embedder, "fit"):
+            # 共有の埋め込みは変更せず、この索引のコーパスで学習したものを使う
+            self.embedder = self.embedder.fit(texts)
+        matrix = self.embedder.embed(texts) if texts else np.zeros((0, 1), dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.matrix = matrix / np.where(norms == 0, 1, norms)
+        return self
+
+    def search(self, query: str, k: int = 10, source: Optional[str] = None) -> List[Dict]:
+        """
+        クエリに近い順に上位 k 件のチャンクを返す
+        :return: [{"source": str, "data": dict, "score": float}]
+        """
+        if self.matrix is None:
+            self.build()
+        if not self.entries:
+            return []
+        q = self.embedder.embed([query])[0]
+        norm = np.linalg.norm(q)
+        scores = self.matrix @ (q / norm if norm else q)
+
+        candidates = np.arange(len(self.entries))
+        if source is not None:
+            candidates = np.array([i for i, e in enumerate(self.entries) if e["source"] == source], dtype=int)
+            if len(candidates) == 0:
+                return []
+        k = min(k, len(candidates))
+        top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [{"source": self.entries[i]["source"], "data": self.entries[i]["data"], "score": float(scores[i])} for i in top]
+
+    def select(self, query: str, top_k: Dict[str, int]) -> Dict[str, List[Dict]]:
+        """
+        ソースごとに上位 top_k[ソース] 件のチャンクを、generate に渡せる形式で返す
+        類似度は各項目の retrieval_score に入れる (ContextBuilder の優先度に加算される)
+        """
+        selected = {}
+        for source, k in top_k.items():
+            items = []
+            for hit in self.search(query, k, source=source):
+                item = dict(hit["data"], retrieval_score=round(hit["score"], 4))
+                items.append(item)
+            selected[source] = self._merge_laws(items) if source == "law" else items
+        return selected
+
+    def _add(self, source: str, data: Dict, text: str):
+        self.entries.append({"source": source, "data": data, "text": text})
+
+    def _split(self, text: str) -> List[str]:
+        if len(text) <= self.chunk_chars:
+            return [text]
+        # 句点で区切りつつ、chunk_chars を超えないように詰める
+        parts, current = [], ""
+        for sentence in re.split(r"(?<=[。！？\n])", text):
+            if current and len(current) + len(sentence) > self.chunk_chars:
+                parts.append(current)
+                current = ""
+            while len(sentence) > self.chunk_chars:
+                parts.append(sentence[:self.chunk_chars])
+                sentence = sentence[self.chunk_chars:]
+            current += sentence
+        if current.strip():
+            parts.append(current)
+        return parts
+
+    @staticmethod
+    def _merge_laws(items: List[Dict]) -> List[Dict]:
+        # 同じ法令の条文抜粋は1件にまとめる
+        merged: Dict[str, Dict] = {}
+        for item in items:
+            key = item.get("title") or ""
+            if key in merged:
+                merged[key]["snippets"] = merged[key].get("snippets", []) + item.get("snippets", [])
+                merged[key]["retrieval_score"] = max(merged[key]["retrieval_score"], item["retrieval_score"])
+            else:
+                merged[key] = dict(item, snippets=list(item.get("snippets") or []))
+        return list(merged.values())
+
+def retrieve_top_k(topic: str, news_list: List[Dict], diet_speeches: List[Dict], law_data: List[Dict],
+                   keywords: Optional[List[str]] = None, top_k: int = 20, embedder=None) -> Dict:
+    """
+    トピック (+キーワード) に近いチャンクだけを残したソースと、絞り込みの内訳を返す
+    :return: {"news": [...], "diet": [...], "law": [...], "report": {...}}
+    """
+    started = time.perf_counter()
+    index = SourceIndex(embedder)
+    index.add_sources(news_list, diet_speeches, law_data)
+    index.build()
+    query = " ".join([topic] + list(keywords or []))
+    result = index.select(query, {"news": top_k, "diet": top_k, "law": max(1, top_k // 2)})
+    result["report"] = {
+        "chunks": len(index.entries),
+        "selected": sum(len(v) for v in result.values()),
+        "elapsed": time.perf_counter() - started,
+    }
+    return result
@@ -0,0 +1,146 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
+
+from context_builder import count_tokens
+
+# 要約 (map) 段で使う安価なモデル
+CHEAP_MODELS = {
+    "openai": "gpt-4o-mini",
+    "gemini": "gemini-2.5-flash",
+}
+
+MAP_PROMPT = """
+以下は、トピックに関する{kind}の抜粋です。解説台本の下調べとして、要点を日本語で{length}字程度に要約してください。
+
+【要約のルール】
+- トピックに関係する事実・数字・日付・制度名・発言者（所属）を優先して残す。
+- 推測や評価は加えない。資料に無いことは書かない。
+- 箇条書きで出力する。各行の末尾に出典（媒体名、または発言者と日付）を括弧で付ける。
+
+【トピック】: {topic}
+
+【資料】:
+{body}
+"""
+
+class SourceSummarizer:
+    """
+    大量のソースをチャンクに分け、安価なモデルで並行して要約するクラス (map-reduce の map 段)
+    要約結果は元の議事録・ニュースと同じ形式の dict で返すため、そのまま generate に渡せる。
+    """
+    def __init__(self, generator, max_concurrency: int = 4, chunk_tokens: int = 3000,
+                 speech_chars: int = 2000, digest_chars: int = 400):
+        """
+        :param generator: 要約に使う ScriptGenerator (安価なモデルを指定したもの)
+        """
+        self.generator = generator
+        self.max_concurrency = max_concurrency
+        self.chunk_tokens = chunk_tokens
+        self.speech_chars = speech_chars
+        self.digest_chars = digest_chars
+
+    def source_tokens(self, news_list: List[Dict], diet_speeches: List[Dict]) -> int:
+        """
+        要約前のソース全体のトークン数
+        """
+        return sum(count_tokens(self._news_text(n)) for n in news_list) + \
+            sum(count_tokens(self._speech_text(s)) for s in diet_speeches)
+
+    def summarize(self, topic: str, news_list: List[Dict], diet_speeches: List[Dict],
+                  progress: Optional[Callable[[int, int], None]] = None) -> Tuple[List[Dict], List[Dict]]:
+        """
+        ニュースと議事録をチャンク単位で並行要約し、(ニュース, 議事録) の要約リストを返す
+        :param progress: (完了チャンク数, 全チャンク数) を受け取るコールバック
+        """
+        speech_chunks = self._chunk(diet_speeches, self._speech_text)
+        # 公明新聞は他のニュースと混ぜずに要約し、要約後もソースの加点を受けられるようにする
+        komei_chunks = self._chunk([n for n in news_list if n.get("source") == "公明新聞"], self._news_text)
+        news_chunks = self._chunk([n for n in news_list if n.get("source") != "公明新聞"], self._news_text)
+        jobs = [("diet", c) for c in speech_chunks] + [("komei", c) for c in komei_chunks] + [("news", c) for c in news_chunks]
+        if not jobs:
+            return news_list, diet_speeches
+
+        done = 0
+        results: List[Optional[Dict]] = [None] * len(jobs)
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            futures = {
+                executor.submit(self._summarize_chunk, topic, kind, chunk): i
+                for i, (kind, chunk) in enumerate(jobs)
+            }
+            for future in as_completed(futures):
+                i = futures[future]
+                kind, chunk = jobs[i]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    # 失敗したチャンクは要約せず、元の項目を残す
+                    print(f"Error summarizing {kind} chunk: {e}")
+                    results[i] = None
+                done += 1
+                if progress:
+                    progress(done, len(jobs))
+
+        digest_news, digest_speeches = [], []
+        for (kind, chunk), digest in zip(jobs, results):
+            if kind == "diet":
+                digest_speeches.extend([self._speech_digest(chunk, digest)] if digest else chunk)
+            else:
+                digest_news.extend([self._news_digest(chunk, digest)] if digest else chunk)
+        return digest_news, digest_speeches
+
+    def _summarize_chunk(self, topic: str, kind: str, chunk: List[Dict]) -> str:
+        if kind == "diet":
+            body = "\n---\n".join(self._speech_text(s) for s in chunk)
+            label = "国会会議録"
+        else:
+            body = "\n---\n".join(self._news_text(n) for n in chunk)
+            label = "公明新聞の記事" if kind == "komei" else "ニュース記事"
+        prompt = MAP_PROMPT.format(kind=label, length=self.digest_chars, topic=topic, body=body)
+        return self.generator._cached_complete(prompt, temperature=0.2, operation="summarize_sources").strip()
+
+    def _chunk(self, items: List[Dict], to_text: Callable[[Dict], str]) -> List[List[Dict]]:
+        chunks, current, used = [], [], 0
+        for item in items:
+            tokens = count_tokens(to_text(item))
+            if current and used + tokens > self.chunk_tokens:
+                chunks.append(current)
+                current, used = [], 0
+            current.append(item)
+            used += tokens
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def _speech_text(self, s: Dict) -> str:
+        return f"日付: {s.get('date')}\n発言者: {s.get('speaker')} ({s.get('speakerGroup') or '所属不明'})\n会議: {s.get('nameOfMeeting')}\n発言: {(s.get('speech') or '')[:self.speech_chars]}"
+
+    @staticmethod
+    def _news_text(n: Dict) -> str:
+        return f"ソース: {n.get('source')}\nタイトル: {n.get('title')}\n本文: {n.get('summary', '')}"
+
+    @staticmethod
+    def _speech_digest(chunk: List[Dict], digest: str) -> Dict:
+        dates = sorted(s.get("date") for s in chunk if s.get("date"))
+        speakers = list(dict.fromkeys(s.get("speaker") for s in chunk if s.get("speaker")))
+        groups = " / ".join(dict.fromkeys(s.get("speakerGroup") for s in chunk if s.get("speakerGroup")))
+        return {
+            "date": f"{dates[0]}〜{dates[-1]}" if dates else "不明",
+            "speaker": "、".join(speakers[:5]) + (" ほか" if len(speakers) > 5 else ""),
+            "speakerGroup": groups,
+            "nameOfMeeting": "、".join(dict.fromkeys(s.get("nameOfMeeting") for s in chunk if s.get("nameOfMeeting"))),
+            "speech": digest,
+            "digest_of": len(chunk),
+        }
+
+    @staticmethod
+    def _news_digest(chunk: List[Dict], digest: str) -> Dict:
+        sources = list(dict.fromkeys(n.get("source") for n in chunk if n.get("source")))
+        published = sorted((n.get("published") for n in chunk if n.get("published") not in (None, "不明")), reverse=True)
+        return {
+            "source": "、".join(sources[:3]) + (" ほか" if len(sources) > 3 else ""),
+            "title": f"{len(chunk)}件の記事の要約",
+            "summary": digest,
+            "link": chunk[0].get("link"),
+            "published": published[0] if published else "不明",
+            "digest_of": len(chunk),
+        }
@@ -0,0 +1,12 @@
+import os
+import sys
+
+import pytest
+
+# テストはリポジトリ直下のモジュールをそのまま読み込む
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(autouse=True)
+def _work_dir(tmp_path, monkeypatch):
+    # cache/ や projects/ は作業ディレクトリからの相対パスなので、テストごとに空のディレクトリで動かす
+    monkeypatch.chdir(tmp_path)
@@ -0,0 +1,73 @@
+import pytest
+
+from fake_slides_server import FakeSlidesServer, SlidesApiError
+from google_slide_generator import GoogleSlideGenerator, build_deck_requests
+
+SLIDES = [
+    {"title": "制度の概要", "content": "・背景と経緯\n・主な改正点", "caption": "制度の概要を説明します。",
+     "visual_logic": "diagram: 比較表"},
+    {"title": "家計への影響", "content": "・負担額の変化\n・対象となる世帯", "caption": "家計への影響です。"},
+    {"title": "今後の見通し", "content": "・施行時期\n・残る課題"},
+]
+
+def _texts(slide):
+    return {e["shape"]["placeholder"]["type"]: e["shape"]["text"] for e in slide["pageElements"]}
+
+def _notes(slide):
+    return slide["slideProperties"]["notesPage"]["pageElements"][0]["shape"]["text"]
+
+@pytest.fixture
+def fake():
+    # HTTP を経由せずにサーバーの処理を直接呼ぶ (ソケットは作られるので with で閉じる)
+    with FakeSlidesServer() as server:
+        yield server
+
+def test_requests_build_the_whole_deck_in_one_batch(fake):
+    presentation = fake.create({"title": "テスト"})
+    default_ids = [s["objectId"] for s in presentation["slides"]]
+    requests, notes = build_deck_requests("テスト", SLIDES, default_ids)
+    fake.batch_update(presentation["presentationId"], {"requests": requests})
+
+    slides = fake.presentations[presentation["presentationId"]]["slides"]
+    assert [s["objectId"] for s in slides] == ["deck_title", "slide_000", "slide_001", "slide_002"]
+    assert _texts(slides[0])["CENTERED_TITLE"] == "テスト"
+    assert _texts(slides[1]) == {"TITLE": "制度の概要", "BODY": "背景と経緯\n主な改正点"}
+    # キャプションの無いスライドにはノートを書かない
+    assert set(notes) == {"slide_000", "slide_001"}
+    assert "[図解指示]\ndiagram: 比較表" in notes["slide_000"]
+
+def test_empty_texts_are_not_inserted(fake):
+    presentation = fake.create({"title": ""})
+    requests, _ = build_deck_requests("", [{"title": "", "content": ""}], [])
+    assert not any("insertText" in r and not r["insertText"]["text"] for r in requests)
+    fake.batch_update(presentation["presentationId"], {"requests": requests})
+
+def test_invalid_batch_is_rejected_atomically(fake):
+    presentation = fake.create({"title": "テスト"})
+    before = fake.presentations[presentation["presentationId"]]
+    requests, _ = build_deck_requests("テスト", SLIDES)
+    # 同じ objectId を2回作ると全体が失敗し、何も反映されない
+    with pytest.raises(SlidesApiError):
+        fake.batch_update(presentation["presentationId"], {"requests": requests + requests})
+    assert fake.presentations[presentation["presentationId"]] == before
+
+def test_generator_round_trips_against_fake_server():
+    pytest.importorskip("googleapiclient")
+    pytest.importorskip("httplib2")
+    with FakeSlidesServer() as fake:
+        generator = GoogleSlideGenerator(service=fake.build_service())
+        url = generator.create_slides("テストプレゼン", SLIDES)
+
+        presentation = next(iter(fake.presentations.values()))
+        assert url.endswith(f"/d/{presentation['presentationId']}/edit")
+        # 作成・スライドとテキストの一括作成・ノートIDの取得・ノートの書き込みの4往復
+        assert [(c["method"], c["path"].rsplit("/", 1)[-1]) for c in fake.calls] == [
+            ("POST", "presentations"),
+            ("POST", f"{presentation['presentationId']}:batchUpdate"),
+            ("GET", presentation["presentationId"]),
+            ("POST", f"{presentation['presentationId']}:batchUpdate"),
+        ]
+        slides = presentation["slides"]
+        assert len(slides) == 1 + len(SLIDES)
+        assert _notes(slides[1]).startswith("制度の概要を説明します。")
+        assert _notes(slides[3]) == ""
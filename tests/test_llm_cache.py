@@ -0,0 +1,71 @@
+import sqlite3
+import time
+
+import llm_cache
+from llm_cache import LLMCache
+
+def _accessed(path, key):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT accessed_at FROM llm_cache WHERE key = ?", (key,)).fetchone()[0]
+    finally:
+        conn.close()
+
+def test_hit_from_memory_and_disk(tmp_path):
+    path = str(tmp_path / "llm.sqlite3")
+    key = LLMCache.make_key("openai", "gpt-4o", "prompt", 0.3)
+    LLMCache(path).set(key, "answer")
+    # 別のインスタンス (再起動後) はディスクから読む
+    cache = LLMCache(path)
+    assert cache.get(key) == "answer"
+    assert cache.get(key) == "answer"
+    assert cache.get("missing") is None
+    assert (cache.hits, cache.misses) == (2, 1)
+
+def test_key_depends_on_call_options():
+    base = LLMCache.make_key("openai", "gpt-4o", "prompt", 0.3)
+    assert base == LLMCache.make_key("openai", "gpt-4o", "prompt", 0.3000001)
+    assert base != LLMCache.make_key("openai", "gpt-4o", "prompt", 0.3, response_format="json")
+    assert base != LLMCache.make_key("gemini", "gpt-4o", "prompt", 0.3)
+
+def test_memory_hits_update_disk_access_time(tmp_path):
+    path = str(tmp_path / "llm.sqlite3")
+    cache = LLMCache(path)
+    cache.set("a", "A")
+    stored = _accessed(path, "a")
+    time.sleep(0.01)
+    assert cache.get("a") == "A"
+    # メモリ上のヒットはまとめて書くので、flush までは反映されない
+    assert _accessed(path, "a") == stored
+    cache.flush()
+    assert _accessed(path, "a") > stored
+
+def test_memory_hits_are_flushed_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "ACCESS_FLUSH_ENTRIES", 2)
+    path = str(tmp_path / "llm.sqlite3")
+    cache = LLMCache(path)
+    cache.set("a", "A")
+    cache.set("b", "B")
+    stored = _accessed(path, "a")
+    time.sleep(0.01)
+    cache.get("a")
+    cache.get("b")
+    assert _accessed(path, "a") > stored
+
+def test_eviction_keeps_entries_hit_in_memory(tmp_path):
+    path = str(tmp_path / "llm.sqlite3")
+    cache = LLMCache(path, max_entries=3)
+    for key in "abc":
+        cache.set(key, key.upper())
+        time.sleep(0.01)
+    cache.get("a")
+    cache.set("d", "D")
+    # 最終アクセスが古い b が消え、メモリ上で使われた a は残る
+    assert LLMCache(path).get("a") == "A"
+    assert LLMCache(path).get("b") is None
+
+def test_expired_entries_are_not_returned(tmp_path):
+    cache = LLMCache(str(tmp_path / "llm.sqlite3"), ttl_seconds=0)
+    cache.set("a", "A")
+    time.sleep(0.01)
+    assert cache.get("a") is None
@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+import project_index
+from project_index import ProjectIndex
+from project_store import write_packed
+
+PROJECTS = [
+    ("project_20250101_000000.json.gz", "国保 保険料", "国民健康保険の保険料が来年度から見直されます。", "2025-01-01T00:00:00"),
+    ("project_20250102_000000.json.gz", "年金 改定", "年金額の改定について解説します。物価と賃金に連動します。", "2025-01-02T00:00:00"),
+    ("project_20250103_000000.json.gz", "防災 能登", "能登半島の復旧と防災対策の予算を確保しました。", "2025-01-03T00:00:00"),
+]
+
+def _write(projects_dir, filename, topic, script, timestamp, exclusive=True):
+    data = {"topic": topic, "script": script, "timestamp": timestamp, "provider": "openai", "model": "gpt-4o",
+            "format": 2, "news_refs": [], "speech_refs": []}
+    write_packed(os.path.join(projects_dir, filename), data, exclusive=exclusive)
+
+@pytest.fixture
+def index(tmp_path):
+    projects_dir = tmp_path / "projects"
+    projects_dir.mkdir()
+    for project in PROJECTS:
+        _write(str(projects_dir), *project)
+    return ProjectIndex(str(projects_dir), str(tmp_path / "index.sqlite3"))
+
+def _topics(result):
+    items, total = result
+    assert total == len(items)
+    return [item["topic"] for item in items]
+
+def test_list_reads_files_once_and_orders_newest_first(index):
+    assert [p["topic"] for p in index.list()] == ["防災 能登", "年金 改定", "国保 保険料"]
+    assert index.sync() == 0
+
+def test_full_text_search_and(index):
+    assert index.full_text
+    assert _topics(index.search("保険料")) == ["国保 保険料"]
+    assert _topics(index.search("予算 防災対策")) == ["防災 能登"]
+    assert _topics(index.search("予算 保険料")) == []
+    assert _topics(index.search("")) == ["防災 能登", "年金 改定", "国保 保険料"]
+
+def test_short_terms_use_trigram_prefixes(index):
+    # 3文字未満の語は、その語で始まる trigram に展開して検索する
+    assert _topics(index.search("物価")) == ["年金 改定"]
+    assert _topics(index.search("復旧 能登")) == ["防災 能登"]
+    # 末尾にあって trigram にならない語も、トピックなら見つかる
+    assert _topics(index.search("改定")) == ["年金 改定"]
+
+def test_search_pagination(index):
+    items, total = index.search("", limit=2, offset=2)
+    assert total == 3
+    assert [item["topic"] for item in items] == ["国保 保険料"]
+
+def test_sync_picks_up_external_changes(index, monkeypatch):
+    index.list()
+    projects_dir = index.projects_dir
+    _write(projects_dir, "project_20250104_000000.json.gz", "賃上げ", "最低賃金の引き上げ", "2025-01-04T00:00:00")
+    os.remove(os.path.join(projects_dir, PROJECTS[0][0]))
+    assert [p["topic"] for p in index.list()] == ["賃上げ", "防災 能登", "年金 改定"]
+    assert _topics(index.search("保険料")) == []
+
+    # その場での書き換えはディレクトリの更新時刻に現れないので、一定時間ごとの走査で拾う
+    monkeypatch.setattr(project_index, "RESCAN_INTERVAL_SECONDS", 0)
+    filename, _, _, timestamp = PROJECTS[1]
+    dir_mtime = os.stat(projects_dir).st_mtime_ns
+    _write(projects_dir, filename, "年金 支給", "支給開始年齢の議論", timestamp, exclusive=False)
+    assert os.stat(projects_dir).st_mtime_ns == dir_mtime
+    assert "年金 支給" in [p["topic"] for p in index.list()]
+    assert _topics(index.search("支給開始")) == ["年金 支給"]
@@ -0,0 +1,74 @@
+import os
+import sqlite3
+
+import project_manager
+from project_store import BlobStore, pack_project, read_project, source_hash, write_packed
+
+NEWS = [{"title": "国保の保険料", "link": "https://example.com/1"}, {"title": "年金の改定", "link": "https://example.com/2"}]
+SPEECHES = [{"speechID": "s1", "speech": "国保について質問します。"}]
+
+def _age_all(path: str):
+    # 猶予期間を過ぎたものとして扱う
+    conn = sqlite3.connect(path)
+    conn.execute("UPDATE blobs SET stored_at = 0")
+    conn.commit()
+    conn.close()
+
+def test_pack_and_read_round_trip(tmp_path):
+    blobs = BlobStore(str(tmp_path / "sources.sqlite3"))
+    data = {"topic": "国保", "script": "台本", "news_list": NEWS + NEWS[:1], "diet_speeches": SPEECHES}
+    packed = pack_project(data, blobs)
+    assert "news_list" not in packed
+    assert packed["news_refs"] == [source_hash(n) for n in NEWS + NEWS[:1]]
+    # 同じ内容は1回だけ保存される
+    assert len(blobs.keys()) == 3
+
+    path = str(tmp_path / "project_1.json.gz")
+    write_packed(path, packed)
+    assert read_project(path, blobs) == data
+
+def test_gc_keeps_recent_unreferenced_blobs(tmp_path):
+    path = str(tmp_path / "sources.sqlite3")
+    blobs = BlobStore(path)
+    keys = blobs.put_many(NEWS)
+    # 保存したばかりのブロブは、まだどの本体からも参照されていなくても消さない
+    assert blobs.delete_unreferenced(set()) == 0
+    assert blobs.keys() == set(keys)
+
+    _age_all(path)
+    assert blobs.delete_unreferenced({keys[0]}) == 1
+    assert blobs.keys() == {keys[0]}
+
+def test_reuse_by_another_connection_protects_blob(tmp_path):
+    path = str(tmp_path / "sources.sqlite3")
+    deleting, saving = BlobStore(path), BlobStore(path)
+    key = saving.put_many(NEWS[:1])[0]
+    _age_all(path)
+    # 削除側が対象を選んだ後に、別の接続 (別のプロセス) が同じ内容を保存し直した場合は残る
+    saving.put_many(NEWS[:1])
+    assert deleting.delete_unreferenced(set()) == 0
+    assert key in deleting.keys()
+    assert deleting.delete_unreferenced(set(), grace_seconds=-1) == 1
+
+def test_store_without_stored_at_is_upgraded(tmp_path):
+    path = str(tmp_path / "sources.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE blobs (key TEXT PRIMARY KEY, data BLOB NOT NULL)")
+    conn.execute("INSERT INTO blobs VALUES ('old', x'00')")
+    conn.commit()
+    conn.close()
+
+    blobs = BlobStore(path)
+    # 以前の保存先のブロブは古いものとして扱う
+    assert blobs.delete_unreferenced(set()) == 1
+
+def test_delete_project_keeps_shared_sources():
+    first = project_manager.save_project("国保", "台本1", NEWS, SPEECHES, "openai", "gpt-4o")
+    second = project_manager.save_project("年金", "台本2", NEWS[:1], [], "openai", "gpt-4o")
+    blobs_path = os.path.join(project_manager.PROJECTS_DIR, "sources.sqlite3")
+    _age_all(blobs_path)
+
+    assert project_manager.delete_project(os.path.basename(first))
+    # 残ったプロジェクトが参照しているニュースだけが残る
+    assert project_manager.get_blob_store(project_manager.PROJECTS_DIR).keys() == {source_hash(NEWS[0])}
+    assert project_manager.load_project(os.path.basename(second))["news_list"] == NEWS[:1]
@@ -0,0 +1,123 @@
+import threading
+import time
+
+import pytest
+
+from provider_router import AllProvidersFailed, CancelToken, LatencyTracker, RateLimiter, hedged_stream
+
+def _fast(chunks):
+    def factory(token):
+        yield from chunks
+    return factory
+
+def _slow(started: threading.Event, closed: threading.Event):
+    # 打ち切られるまで最初のトークンを返さない候補
+    def factory(token):
+        started.set()
+        try:
+            while not token.is_set():
+                time.sleep(0.01)
+            yield "late"
+        finally:
+            closed.set()
+    return factory
+
+def test_primary_wins_without_hedging():
+    tracker = LatencyTracker(path=None)
+    winners = []
+    out = list(hedged_stream([("openai", _fast(["a", "b"])), ("gemini", _fast(["x"]))],
+                             hedge_after=5, tracker=tracker, on_winner=winners.append))
+    assert out == ["a", "b"]
+    assert winners == ["openai"]
+    # 予備は開始されていない
+    assert "gemini" not in tracker.stats()
+
+def test_loser_is_cancelled_and_closed():
+    started, closed = threading.Event(), threading.Event()
+    tracker = LatencyTracker(path=None)
+    out = list(hedged_stream([("openai", _slow(started, closed)), ("gemini", _fast(["x", "y"]))],
+                             hedge_after=0.05, tracker=tracker))
+    assert out == ["x", "y"]
+    assert started.is_set()
+    assert closed.wait(2)
+    stats = tracker.stats()
+    # 負けた候補は失敗として数えず、ttft の下限だけを記録する
+    assert stats["openai"]["samples"] == 0
+    assert stats["openai"]["ttft"] > 0
+    assert stats["gemini"]["samples"] == 1
+
+def test_closing_consumer_cancels_all_candidates():
+    tokens = []
+
+    def endless(token):
+        tokens.append(token)
+        while not token.is_set():
+            yield "chunk"
+            time.sleep(0.01)
+
+    stream = hedged_stream([("openai", endless)], hedge_after=None)
+    assert next(stream) == "chunk"
+    stream.close()
+    assert tokens and tokens[0].is_set()
+
+def test_error_switches_to_next_candidate():
+    def broken(token):
+        raise RuntimeError("boom")
+        yield
+
+    assert list(hedged_stream([("openai", broken), ("gemini", _fast(["ok"]))])) == ["ok"]
+
+def test_all_candidates_failing_raises():
+    def broken(token):
+        raise RuntimeError("boom")
+        yield
+
+    def empty(token):
+        return
+        yield
+
+    with pytest.raises(AllProvidersFailed) as info:
+        list(hedged_stream([("openai", broken), ("gemini", empty)]))
+    assert set(info.value.errors) == {"openai", "gemini"}
+
+def test_error_after_first_token_is_raised():
+    def flaky(token):
+        yield "a"
+        raise RuntimeError("stream broke")
+
+    stream = hedged_stream([("openai", flaky), ("gemini", _fast(["x"]))])
+    assert next(stream) == "a"
+    with pytest.raises(RuntimeError, match="stream broke"):
+        next(stream)
+
+def test_cancel_token_runs_callbacks_once():
+    token = CancelToken()
+    calls = []
+    token.on_cancel(lambda: calls.append("first"))
+    token.cancel()
+    token.cancel()
+    # 打ち切り後に登録した処理はすぐに呼ばれる
+    token.on_cancel(lambda: calls.append("late"))
+    assert calls == ["first", "late"]
+
+def test_rate_limiter_acquire_gives_up_when_cancelled():
+    limiter = RateLimiter(max_concurrent={"openai": 1})
+    release = limiter.acquire("openai")
+    token = CancelToken()
+    threading.Timer(0.05, token.cancel).start()
+    assert limiter.acquire("openai", cancelled=token.is_set) is None
+
+    # 返却は何度呼んでも1回分だけ
+    release()
+    release()
+    second = limiter.acquire("openai")
+    assert limiter.acquire("openai", cancelled=lambda: True) is None
+    second()
+
+def test_latency_lower_bound_never_lowers_average():
+    tracker = LatencyTracker(path=None)
+    tracker.record("openai", ttft=2.0)
+    tracker.record_lower_bound("openai", 1.0)
+    assert tracker.stats()["openai"]["ttft"] == 2.0
+    tracker.record_lower_bound("openai", 3.0)
+    assert tracker.stats()["openai"]["ttft"] == 3.0
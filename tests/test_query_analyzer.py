@@ -0,0 +1,70 @@
+import pytest
+
+from query_analyzer import MAX_PERIOD_DAYS, QueryAnalyzer
+
+class StaticLawFetcher:
+    # 法令名一覧をネットワークから取得しない代わり
+    def __init__(self, titles):
+        self.titles = titles
+
+    def fetch_law_titles(self, refresh=True):
+        return list(self.titles)
+
+@pytest.fixture
+def analyzer(tmp_path):
+    return QueryAnalyzer(
+        law_fetcher=StaticLawFetcher(["最低賃金法", "国民健康保険法", "児童手当法"]),
+        projects_dir=str(tmp_path / "projects"), refresh_catalog=False
+    )
+
+@pytest.mark.parametrize("text, days, rest", [
+    ("直近3ヶ月 国保", 90, "国保"),
+    ("過去2週間 年金", 14, "年金"),
+    ("1年以内 年金", 365, "年金"),
+    ("3日間 年金", 3, "年金"),
+    ("ここ十日 年金", 10, "年金"),
+    ("2週間 年金", 14, "年金"),
+    ("今週の 国保", 7, "国保"),
+])
+def test_period_expressions(text, days, rest):
+    assert QueryAnalyzer._extract_period(text) == (days, rest)
+
+@pytest.mark.parametrize("text", [
+    "2024年 予算",
+    "令和6年度 予算",
+    "6年度 予算",
+    "今年度 予算",
+    "3年 国保",
+])
+def test_years_are_not_periods(text):
+    # 年・年度は「直近」「間」「以内」などが付かない限り期間ではない
+    assert QueryAnalyzer._extract_period(text)[0] is None
+
+def test_period_is_clamped():
+    days, rest = QueryAnalyzer._extract_period("直近999年 国保")
+    assert days == MAX_PERIOD_DAYS
+    assert rest == "国保"
+
+def test_keyword_query_is_analyzed_locally(analyzer):
+    result = analyzer.analyze("国保 最低賃金 直近1ヶ月")
+    assert result == {
+        "keywords": ["国保", "最低賃金"],
+        "law_keywords": ["国民健康保険", "最低賃金"],
+        "days": 30,
+        "analyzer": "rule",
+    }
+
+def test_term_with_suffix_maps_to_known_term(analyzer):
+    result = analyzer.analyze("国保逃れ")
+    assert result["keywords"] == ["国保逃れ"]
+    assert result["law_keywords"] == ["国民健康保険"]
+
+@pytest.mark.parametrize("text", [
+    "国保について教えて",
+    "年収の壁",
+    "よく分からない単語",
+    "ABCDEF",
+    "国保 年金 介護 選挙 防災 能登",
+])
+def test_unrecognised_input_is_left_to_llm(analyzer, text):
+    assert analyzer.analyze(text) is None
@@ -0,0 +1,73 @@
+import datetime
+
+import pytest
+
+from research_cache import ResearchCache, covers, merge_news, merge_speeches, normalize_keywords, research_info, research_key
+
+TODAY = datetime.date(2025, 1, 31)
+WEEK_AGO = TODAY - datetime.timedelta(days=7)
+
+def test_key_ignores_order_width_and_case():
+    assert normalize_keywords(["年金", "ＮＨＫ", "国保", "国保"]) == ["nhk", "国保", "年金"]
+    assert research_key(["国保", "年金"]) == research_key(["年金 ", "国保"])
+    assert research_key(["国保"]) != research_key(["国保", "年金"])
+
+def test_cache_round_trip_and_period(tmp_path):
+    cache = ResearchCache(str(tmp_path / "research.sqlite3"))
+    info = research_info(["国保"], WEEK_AGO, TODAY - datetime.timedelta(days=1), ["news"], news_keyword="国保")
+    cache.put(info, {"news": [{"link": "a"}]})
+
+    found = cache.get(["国保"], WEEK_AGO, TODAY)
+    assert found["sources"] == {"news": [{"link": "a"}]}
+    assert found["info"]["news_keyword"] == "国保"
+    # 前回より前の期間は前回の結果では足りない
+    assert cache.get(["国保"], WEEK_AGO - datetime.timedelta(days=1), TODAY) is None
+    assert cache.get(["国保"], WEEK_AGO, TODAY, ttl_hours=0) is None
+    assert covers(info, WEEK_AGO, TODAY)
+
+def test_merge_speeches_dedups_and_drops_old():
+    cached = [{"speechID": "1", "date": "2025-01-20"}, {"speechID": "2", "date": "2024-01-01"}]
+    new = [{"speechID": "1", "date": "2025-01-20"}, {"speechID": "3", "date": "2025-01-30"}]
+    merged = merge_speeches(cached, new, since=datetime.date(2024, 6, 1))
+    assert [s["speechID"] for s in merged] == ["3", "1"]
+
+def test_merge_news_keeps_unknown_dates():
+    cached = [{"link": "a", "published": "2025-01-25 10:00"}, {"link": "b", "published": "不明"}]
+    new = [{"link": "a", "published": "2025-01-25 10:00"}, {"link": "c", "published": "2025-01-30 09:00"},
+           {"link": "old", "published": "2024-12-01 00:00"}]
+    merged = merge_news(cached, new, since=WEEK_AGO)
+    assert [n["link"] for n in merged] == ["b", "c", "a"]
+
+class RecordingFetcher:
+    def __init__(self):
+        self.calls = []
+
+    def fetch_all_news(self, keyword="", days=7):
+        self.calls.append((keyword, days))
+        return [{"link": f"{keyword}-{len(self.calls)}", "title": keyword, "published": "2025-01-30 00:00"}]
+
+def _collect(fetcher, keywords):
+    pytest.importorskip("requests")
+    pytest.importorskip("feedparser")
+    from pipeline import ScriptPipeline
+
+    pipeline = ScriptPipeline("openai", "key", "gpt-4o", use_komei=False, use_diet=False, use_law=False,
+                              use_subsidy=False, news_fetcher=fetcher)
+    return pipeline.collect(" ".join(keywords), {"keywords": keywords}, WEEK_AGO, TODAY)
+
+def test_reordered_keywords_do_not_reuse_news():
+    fetcher = RecordingFetcher()
+    first = _collect(fetcher, ["国保", "年金"])
+    assert first["research"]["news_keyword"] == "国保"
+
+    # キーワードの組み合わせは同じでも、ニュースを検索する語が違うので取り直す
+    second = _collect(fetcher, ["年金", "国保"])
+    assert fetcher.calls[-1] == ("年金", 7)
+    assert [n["title"] for n in second["news_list"]] == ["年金"]
+    assert second["research"]["news_keyword"] == "年金"
+
+    # 同じ語で検索する場合は前回の結果に差分を足す
+    third = _collect(fetcher, ["年金", "国保"])
+    assert fetcher.calls[-1] == ("年金", 0)
+    assert {n["title"] for n in third["news_list"]} == {"年金"}
+    assert len(third["news_list"]) == 2
@@ -0,0 +1,75 @@
+import random
+
+import pytest
+
+from script_revisions import add_revision, apply_delta, make_delta, revision_label, revision_text
+
+BASE = "導入\n国保の保険料について\n本題1\n本題2\nまとめ\n"
+
+@pytest.mark.parametrize("target", [
+    BASE,
+    "",
+    BASE.replace("本題1", "本題1 (改)"),
+    "前置き\n" + BASE + "追記\n",
+    "導入\nまとめ\n",
+    "まとめ\n本題2\n本題1\n導入\n",
+    BASE.rstrip("\n"),
+    "まったく別の台本",
+])
+def test_delta_round_trip(target):
+    assert apply_delta(BASE, make_delta(BASE, target)) == target
+    assert apply_delta(target, make_delta(target, BASE)) == BASE
+
+def test_delta_keeps_only_changed_lines():
+    target = BASE.replace("本題2", "本題2を具体的に")
+    delta = make_delta(target, BASE)
+    # 変更の無い行は行番号の範囲だけで表す
+    assert [op for op in delta if isinstance(op, str)] == ["本題2\n"]
+
+def test_random_edits_round_trip():
+    rng = random.Random(0)
+    lines = [f"行{i}\n" for i in range(30)]
+    for _ in range(50):
+        edited = list(lines)
+        for _ in range(rng.randint(1, 5)):
+            i = rng.randrange(len(edited) + 1)
+            action = rng.choice(["insert", "delete", "replace"])
+            if action == "insert" or not edited:
+                edited.insert(i, f"追加{rng.random()}\n")
+            elif action == "delete":
+                del edited[min(i, len(edited) - 1)]
+            else:
+                edited[min(i, len(edited) - 1)] = f"変更{rng.random()}\n"
+        base, target = "".join(lines), "".join(edited)
+        assert apply_delta(base, make_delta(base, target)) == target
+        lines = edited
+
+def test_history_restores_every_version():
+    versions = [BASE]
+    revisions = add_revision([], "", BASE, "generate", provider="OpenAI", model="gpt-4o")
+    for i in range(20):
+        new_text = versions[-1].replace("まとめ", f"まとめ{i}") + f"追記{i}\n"
+        revisions = add_revision(revisions, versions[-1], new_text, "refine", instruction=f"指示{i}")
+        versions.append(new_text)
+
+    head = versions[-1]
+    assert len(revisions) == len(versions)
+    assert "delta" not in revisions[-1]
+    for i, text in enumerate(versions):
+        assert revision_text(revisions, head, i) == text
+    assert revision_text(revisions, head, -1) == head
+
+def test_add_revision_does_not_modify_input():
+    revisions = add_revision([], "", BASE, "generate")
+    before = [dict(r) for r in revisions]
+    add_revision(revisions, BASE, BASE + "追記\n", "refine")
+    assert revisions == before
+
+def test_restore_label():
+    revisions = add_revision([], "", BASE, "generate", model="gpt-4o")
+    revisions = add_revision(revisions, BASE, "別の台本\n", "refine", instruction="短く")
+    revisions = add_revision(revisions, "別の台本\n", BASE, "restore", restored_from=0)
+    assert revision_text(revisions, BASE, 1) == "別の台本\n"
+    label = revision_label(revisions, 2)
+    assert label.startswith("第3版 復元")
+    assert "← 第1版" in label and label.endswith("[現在]")
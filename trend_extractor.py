@@ -0,0 +1,214 @@
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, deque
+from typing import TYPE_CHECKING, Iterable, List, Optional, Set, Tuple
+
+if TYPE_CHECKING:
+    from headline_archive import HeadlineArchive
+
+# 注目ワードとして意味の無い語 (媒体名・定型句・一般語)
+STOP_PHRASES = {
+    "ニュース", "速報", "写真", "動画", "中継", "解説", "特集", "社説", "コラム", "インタビュー",
+    "全文", "詳報", "一覧", "まとめ", "ライブ", "LIVE", "新聞", "記者", "会見", "発表", "報道",
+    "日本", "政府", "東京", "国内", "海外", "今日", "明日", "昨日", "今年", "来年", "午前", "午後",
+    "NHK", "共同通信", "時事通信", "朝日新聞", "読売新聞", "毎日新聞", "日本経済新聞", "産経新聞",
+    "公明新聞", "Yahoo", "Google", "TBS", "FNN", "ANN", "JNN", "テレ朝", "日テレ",
+}
+
+_CONTENT_RUN = re.compile(r"[一-龥々〆ヵヶァ-ヴーA-Za-z0-9]+")
+_NUMERIC = re.compile(r"^[0-9]+[年月日時分秒歳人件円%万億兆]*$")
+# 数字の直後で切った候補 (「2024年度」の「年度」) は語の断片として除く
+_UNIT_HEAD = set("年月日時分")
+_KATAKANA = re.compile(r"[ァ-ヴー]")
+_ALNUM = re.compile(r"[A-Za-z0-9]")
+_KANJI = re.compile(r"[一-龥々〆]")
+_HIRAGANA = re.compile(r"[ぁ-ゖ]")
+# 名詞として使われる動詞の連用形の送り仮名 (「国保逃れ」「見直し」「賃上げ」)
+OKURIGANA = set("いきぎけげしじちびみりれえめ")
+# 送り仮名の後に続いてよい助詞 (これ以外のひらがなが続く場合は活用の途中とみなす。例:「解散した」)
+_PARTICLES = set("をがはにへとでものやか")
+
+def _okurigana(text: str, end: int) -> str:
+    """
+    漢字で終わる語の直後 (text[end]) が送り仮名1文字で、その後が語の切れ目ならその文字を返す
+    見出しの語はひらがなの手前で区切るため、送り仮名を付けないと「国保逃」のような断片になる。
+    """
+    if end == 0 or end >= len(text) or not _KANJI.match(text[end - 1]) or text[end] not in OKURIGANA:
+        return ""
+    after = text[end + 1:end + 2]
+    if after and _HIRAGANA.match(after) and after not in _PARTICLES:
+        return ""
+    return text[end]
+
+def clean_headline(headline: str) -> str:
+    """
+    「見出し - 媒体名」形式の末尾の媒体名を取り除き、表記を正規化する
+    """
+    text = unicodedata.normalize("NFKC", headline or "").strip()
+    return re.sub(r"\s+[-|｜]\s+[^-|｜]{1,30}$", "", text)
+
+def headline_terms(headline: str, stop_phrases: Optional[Set[str]] = None, max_len: int = 12) -> Set[str]:
+    """
+    見出しに含まれる語 (漢字・カタカナ・英数字の連なり) を返す。時系列の集計に使う
+    """
+    stop_phrases = STOP_PHRASES if stop_phrases is None else stop_phrases
+    text = clean_headline(headline)
+    terms = set()
+    for match in _CONTENT_RUN.finditer(text):
+        run = match.group(0) + _okurigana(text, match.end())
+        if 2 <= len(run) <= max_len and run not in stop_phrases and not _NUMERIC.match(run) and run[0] != "ー":
+            terms.add(run)
+    return terms
+
+class TrendExtractor:
+    """
+    見出しの集合から注目キーワードを抽出するクラス (LLM不要)
+    見出し中の漢字・カタカナ・英数字の連なりから文字 n-gram を候補とし、
+    「今回の見出しに出てくる件数」×「過去の見出し (背景コーパス) での珍しさ (IDF)」でスコアを付ける。
+    背景コーパスは HeadlineArchive に保存された直近の見出しで、抽出のたびに増えた分だけを読み足す。
+    """
+    def __init__(self, archive: Optional["HeadlineArchive"] = None, max_background_docs: int = 5000,
+                 min_len: int = 2, max_len: int = 10, stop_phrases: Optional[Set[str]] = None):
+        """
+        :param archive: 背景コーパスに使う見出しのアーカイブ (None ならメモリ上の add_background 分だけ)
+        """
+        self.archive = archive
+        self.min_len = min_len
+        self.max_len = max_len
+        self.stop_phrases = set(STOP_PHRASES if stop_phrases is None else stop_phrases)
+        self._docs: "deque[str]" = deque(maxlen=max_background_docs)
+        self._seen: Set[str] = set()
+        self._df: Counter = Counter()
+        self._archive_rowid = 0
+        self._lock = threading.Lock()
+        self._sync_background()
+
+    def extract(self, headlines: List[str], top_n: int = 6, update_background: bool = True) -> List[str]:
+        """
+        見出しから注目キーワードを top_n 個返す
+        """
+        ranked = self.score_candidates(headlines)
+        selected: List[str] = []
+        for term, _ in ranked:
+            # 既に選んだ語と重なる語 (部分文字列) は選ばない
+            if any(term in s or s in term for s in selected):
+                continue
+            selected.append(term)
+            if len(selected) >= top_n:
+                break
+        if update_background:
+            self.add_background(headlines)
+        return selected
+
+    def score_candidates(self, headlines: List[str]) -> List[Tuple[str, float]]:
+        """
+        候補語とスコアをスコアの高い順に返す
+        """
+        docs = [clean_headline(h) for h in headlines if h]
+        tf: Counter = Counter()
+        for doc in docs:
+            tf.update(self._candidates(doc))
+        if not tf:
+            return []
+
+        # 複数の見出しに出てくる語を優先する (見出しが少ない場合は1件でも可)
+        min_tf = 2 if len(docs) >= 10 and any(c >= 2 for c in tf.values()) else 1
+        # 同じ件数で出現する1文字長い語があれば、短い語はその一部にすぎないので長い語に代表させる
+        # (例:「防衛費増」→「防衛費増税」)
+        dominated = set()
+        for term, count in tf.items():
+            for part in (term[:-1], term[1:]):
+                if tf.get(part) == count:
+                    dominated.add(part)
+        closed = {term: count for term, count in tf.items() if count >= min_tf and term not in dominated}
+
+        with self._lock:
+            n_docs = len(self._docs)
+            scores = {
+                term: count * (math.log((n_docs + 1) / (self._df.get(term, 0) + 1)) + 1) * (1 + 0.25 * min(len(term), 6))
+                for term, count in closed.items()
+            }
+        return sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+
+    def add_background(self, headlines: List[str]):
+        """
+        見出しを背景コーパスに加え、アーカイブに保存された他の見出しも読み足す (重複は無視する)
+        取得した見出しはアーカイブにも保存されるため、ファイルには書き出さない。
+        """
+        self._add_docs(headlines)
+        self._sync_background()
+
+    def _add_docs(self, headlines: Iterable[str]):
+        added = False
+        with self._lock:
+            for h in headlines:
+                doc = clean_headline(h)
+                if not doc or doc in self._seen:
+                    continue
+                if len(self._docs) == self._docs.maxlen:
+                    old = self._docs[0]
+                    self._seen.discard(old)
+                    self._df.subtract(self._candidates(old))
+                self._docs.append(doc)
+                self._seen.add(doc)
+                self._df.update(self._candidates(doc))
+                added = True
+            if added:
+                self._df = +self._df
+
+    def _candidates(self, doc: str) -> Set[str]:
+        terms = set()
+        for match in _CONTENT_RUN.finditer(doc):
+            run = match.group(0)
+            tail = _okurigana(doc, match.end())
+            for n in range(self.min_len, min(len(run), self.max_len) + 1):
+                for i in range(len(run) - n + 1):
+                    term = run[i:i + n]
+                    if not self._is_valid(run, i, i + n, term):
+                        continue
+                    # 末尾の漢字に送り仮名が続く場合は、送り仮名まで含めて1語とする (「国保逃」→「国保逃れ」)
+                    terms.add(term + tail if i + n == len(run) else term)
+        return terms
+
+    def _is_valid(self, run: str, start: int, end: int, term: str) -> bool:
+        if term in self.stop_phrases or _NUMERIC.match(term) or term[0] == "ー":
+            return False
+        if term[0] in _UNIT_HEAD and start > 0 and run[start - 1].isdigit():
+            return False
+        # カタカナ語・英単語の途中で切れている候補は除く (例:「リチウムイオン電池」の「イオン電」)
+        for pattern in (_KATAKANA, _ALNUM):
+            if start > 0 and pattern.match(run[start - 1]) and pattern.match(run[start]):
+                return False
+            if end < len(run) and pattern.match(run[end - 1]) and pattern.match(run[end]):
+                return False
+        return True
+
+    def _sync_background(self):
+        if self.archive is None:
+            return
+        try:
+            rows = self.archive.headlines_after(self._archive_rowid, self._docs.maxlen)
+        except Exception as e:
+            print(f"Error loading headline background: {e}")
+            return
+        if not rows:
+            return
+        self._archive_rowid = rows[-1][0]
+        self._add_docs(text for _, text in rows)
+
+_default_extractor: Optional[TrendExtractor] = None
+_default_extractor_lock = threading.Lock()
+
+def get_default_extractor() -> TrendExtractor:
+    """
+    プロセス内で共有するデフォルトの抽出器を返す
+    """
+    global _default_extractor
+    with _default_extractor_lock:
+        if _default_extractor is None:
+            # headline_archive はこのモジュールの headline_terms を使うため、ここで読み込む
+            from headline_archive import get_default_archive
+            _default_extractor = TrendExtractor(archive=get_default_archive())
+        return _default_extractor
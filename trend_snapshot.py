@@ -0,0 +1,192 @@
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from trend_extractor import get_default_extractor
+
+SNAPSHOT_PATH = os.path.join("cache", "trend_snapshot.json")
+# 他のプロセスが更新中であることを示すロックファイル (古いものは放置されたとみなす)
+LOCK_STALE_SECONDS = 600
+
+class TrendSnapshot:
+    """
+    トレンド (見出しと注目ワード) の共有スナップショット
+    全ユーザー・全モデルで同じファイルを読み、更新はバックグラウンドのスレッドか
+    cron などから実行する `python trend_snapshot.py` で行う。読み込みは更新を待たない。
+    """
+    def __init__(self, path: str = SNAPSHOT_PATH, max_age_seconds: int = 3600):
+        self.path = path
+        self.max_age_seconds = max_age_seconds
+        self._refresh_lock = threading.Lock()
+        self._cached: Optional[Dict] = None
+        self._cached_mtime: Optional[float] = None
+
+    def get(self, refresh_if_stale: bool = True) -> Optional[Dict]:
+        """
+        保存済みのスナップショットを返す (未取得なら None)
+        古い・未取得の場合はバックグラウンドで更新を開始する
+        """
+        snapshot = self._read()
+        if refresh_if_stale and self.is_stale(snapshot):
+            self.refresh_in_background()
+        return snapshot
+
+    def is_stale(self, snapshot: Optional[Dict]) -> bool:
+        if not snapshot:
+            return True
+        return time.time() - snapshot.get("fetched_at", 0) > self.max_age_seconds
+
+    def is_refreshing(self) -> bool:
+        return self._refresh_lock.locked() or self._lock_file_active()
+
+    def refresh_in_background(self) -> bool:
+        """
+        更新用のスレッドを開始する。既に更新中の場合は何もしない
+        """
+        if self.is_refreshing():
+            return False
+        threading.Thread(target=self.refresh, daemon=True).start()
+        return True
+
+    def refresh(self) -> Optional[Dict]:
+        """
+        見出しを取得して注目ワードを抽出し、スナップショットを保存する (同時に1つだけ実行される)
+        """
+        if not self._refresh_lock.acquire(blocking=False):
+            return None
+        lock_path = self.path + ".lock"
+        try:
+            if not self._acquire_lock_file(lock_path):
+                return None
+            try:
+                snapshot = self._build()
+                self._write(snapshot)
+                return snapshot
+            finally:
+                try:
+                    os.remove(lock_path)
+                except OSError:
+                    pass
+        finally:
+            self._refresh_lock.release()
+
+    def _build(self) -> Dict:
+        # 取得処理 (feedparser / Playwright) は更新するときだけ読み込む
+        import asyncio
+        from news_fetcher import NewsFetcher
+        from komei_scraper import KomeiScraper
+
+        extractor = get_default_extractor()
+        result = {}
+
+        general, err_general = [], None
+        try:
+            general = NewsFetcher().get_trending_headlines()
+        except Exception as e:
+            err_general = str(e)
+
+        komei, err_komei = [], None
+        try:
+            komei = asyncio.run(KomeiScraper().get_trending_headlines())
+        except Exception as e:
+            err_komei = str(e)
+
+        for name, headlines, error in (("general", general, err_general), ("komei", komei, err_komei)):
+            tags = []
+            if headlines:
+                try:
+                    tags = extractor.extract(headlines)
+                except Exception as e:
+                    error = f"Tags Error: {e}" if not error else f"{error} | Tags Error: {e}"
+            result[name] = {"tags": tags, "headlines": headlines, "error": error}
+
+        result["fetched_at"] = time.time()
+        result["updated_at"] = datetime.now().isoformat(timespec="seconds")
+        return result
+
+    def _read(self) -> Optional[Dict]:
+        # ファイルが更新されていなければメモリ上のものを返す
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return None
+        if self._cached is not None and self._cached_mtime == mtime:
+            return self._cached
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._cached = json.load(f)
+                self._cached_mtime = mtime
+        except Exception as e:
+            print(f"Error loading trend snapshot: {e}")
+        return self._cached
+
+    def _write(self, snapshot: Dict):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        # 読み込み中のセッションが壊れたファイルを読まないよう、一時ファイルから置き換える
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _acquire_lock_file(self, lock_path: str) -> bool:
+        directory = os.path.dirname(lock_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        for _ in range(2):
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()).encode())
+                os.close(fd)
+                return True
+            except FileExistsError:
+                if self._lock_file_active():
+                    return False
+                # 異常終了で残ったロックは削除して取り直す
+                try:
+                    os.remove(lock_path)
+                except OSError:
+                    pass
+        return False
+
+    def _lock_file_active(self) -> bool:
+        try:
+            return time.time() - os.path.getmtime(self.path + ".lock") < LOCK_STALE_SECONDS
+        except OSError:
+            return False
+
+_default_snapshot: Optional[TrendSnapshot] = None
+_default_snapshot_lock = threading.Lock()
+
+def get_trend_snapshot() -> TrendSnapshot:
+    """
+    プロセス内で共有するスナップショットを返す
+    """
+    global _default_snapshot
+    with _default_snapshot_lock:
+        if _default_snapshot is None:
+            _default_snapshot = TrendSnapshot()
+        return _default_snapshot
+
+if __name__ == "__main__":
+    # cron などから定期実行する: python trend_snapshot.py
+    parser = argparse.ArgumentParser(description="トレンドのスナップショットを更新します")
+    parser.add_argument("--path", default=SNAPSHOT_PATH)
+    parser.add_argument("--if-stale", type=int, default=None, metavar="SECONDS",
+                        help="スナップショットがこの秒数より新しければ更新しない")
+    args = parser.parse_args()
+
+    snapshot = TrendSnapshot(path=args.path, max_age_seconds=args.if_stale or 0)
+    if args.if_stale is not None and not snapshot.is_stale(snapshot.get(refresh_if_stale=False)):
+        print("スナップショットは最新です。")
+    else:
+        result = snapshot.refresh()
+        if result is None:
+            print("他のプロセスが更新中のためスキップしました。")
+        else:
+            print(f"更新しました ({result['updated_at']}): 一般 {result['general']['tags']} / 公明 {result['komei']['tags']}")